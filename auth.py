@@ -2,12 +2,16 @@ import os
 import secrets
 from datetime import timedelta, datetime
 from typing import Optional
+from uuid import uuid4
 
 from fastapi import HTTPException, Request, Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, HTTPBasicCredentials, HTTPBasic
-from jose import jwt
+from jose import JWTError, jwt
+
+from utils.token_cache import hash_token, token_cache
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+ALGORITHM = "HS256"
 security = HTTPBasic()
 
 
@@ -17,8 +21,9 @@ def generate_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=30)
-    to_encode.update({"exp": expire})
-    encode_jwt = jwt.encode(to_encode, SECRET_KEY)
+    # the id makes every token unique, so that revoking one doesn't revoke another one issued in the same second
+    to_encode.update({"exp": expire, "jti": uuid4().hex})
+    encode_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
     return encode_jwt
 
@@ -58,23 +63,30 @@ class JWTBearer(HTTPBearer):
             if not credentials.scheme == "Bearer":
                 raise HTTPException(
                     status_code=403, detail="Invalid authentication sheme.")
-            if not self.verfity_jwt(credentials.credentials):
+            payload = self.verify_jwt(credentials.credentials)
+            if payload is None:
                 raise HTTPException(
                     status_code=403, detail="Invalid token or expired token.")
-            return self.decode_jwt(credentials.credentials)
+            return payload
         else:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
 
-    def verfity_jwt(Self, jwt_token: str):
-        is_token_valid: bool = False
+    @staticmethod
+    def verify_jwt(jwt_token: str) -> Optional[dict]:
+        """
+        Verify and decode a token. Verified tokens are cached until they expire
+        :param jwt_token: jwt token
+        :return: payload, or None if the token is invalid, expired or revoked
+        """
+        token_hash = hash_token(jwt_token)
+        payload = token_cache.get(token_hash)
+        if payload is not None:
+            return payload
+        if token_cache.is_revoked(token_hash):
+            return None
         try:
-            payload = jwt.decode(jwt_token, SECRET_KEY)
-        except:
-            payload = None
-        if payload:
-            is_token_valid = True
-        return is_token_valid
-
-    def decode_jwt(self, jwt_token: str):
-        payload = jwt.decode(jwt_token, SECRET_KEY)
+            payload = jwt.decode(jwt_token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        token_cache.put(token_hash, payload)
         return payload
@@ -0,0 +1,38 @@
+"""
+Micro-benchmark for the token verification of JWTBearer.
+
+Run with: JWT_SECRET_KEY=secret python -m benchmarks.bench_auth
+"""
+import timeit
+
+from jose import jwt
+
+from auth import ALGORITHM, JWTBearer, SECRET_KEY, generate_token
+from utils.token_cache import token_cache
+
+
+def legacy_verify(token: str) -> dict:
+    """
+    Previous implementation, which decodes the token once to verify it and once more to return the payload
+    """
+    jwt.decode(token, SECRET_KEY)
+    return jwt.decode(token, SECRET_KEY)
+
+
+def uncached_verify(token: str) -> dict:
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def main():
+    token = generate_token(data={"name": "player", "id": "6423f0c1a2b3c4d5e6f70809"})
+    number = 20_000
+    print(f"{'variant':>10} {'us/request':>12}")
+    for name, verify in [("legacy", legacy_verify), ("uncached", uncached_verify),
+                         ("cached", JWTBearer.verify_jwt)]:
+        token_cache.configure(max_size=10000)
+        seconds = timeit.timeit(lambda: verify(token), number=number) / number
+        print(f"{name:>10} {seconds * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Micro-benchmark for utils.get_selections.
+
+Run with: python -m benchmarks.bench_get_selections
+"""
+import timeit
+from typing import List
+
+from utils.get_selections import GameMessageWithSelections, SelectionsParser, get_selections
+
+LINE = "你走进了一条昏暗的小巷，霓虹灯在雨中闪烁。"
+SELECTIONS = "---selections---\n1. 继续前进\n2. 转身离开\n---end selections---\n"
+
+
+def legacy_get_selections(message: str) -> GameMessageWithSelections:
+    """
+    Previous implementation, which concatenates the message line by line
+    """
+    selections: List[str] = []
+    message_without_selections = ""
+    entered_selections = False
+    for line in message.splitlines():
+        if entered_selections:
+            if line.strip() == "---end selections---":
+                entered_selections = False
+            elif len(line.strip()) > 0:
+                selections.append(line.strip())
+        elif line.strip() == "---selections---":
+            entered_selections = True
+        else:
+            message_without_selections += line
+    return GameMessageWithSelections(message=message_without_selections, selections=selections)
+
+
+def feed_in_chunks(message: str, chunk_size: int = 4) -> GameMessageWithSelections:
+    parser = SelectionsParser()
+    for start in range(0, len(message), chunk_size):
+        parser.feed(message[start:start + chunk_size])
+    parser.close()
+    return parser.result()
+
+
+def main():
+    print(f"{'lines':>8} {'legacy (ms)':>12} {'parser (ms)':>12} {'chunked (ms)':>13} {'chunked ns/char':>16}")
+    for lines in [100, 1_000, 10_000, 100_000]:
+        message = (LINE + "\n") * lines + SELECTIONS
+        number = max(1, 100_000 // lines)
+        legacy = timeit.timeit(lambda: legacy_get_selections(message), number=number) / number
+        parser = timeit.timeit(lambda: get_selections(message), number=number) / number
+        chunked = timeit.timeit(lambda: feed_in_chunks(message), number=number) / number
+        print(f"{lines:>8} {legacy * 1e3:>12.3f} {parser * 1e3:>12.3f} {chunked * 1e3:>13.3f} "
+              f"{chunked * 1e9 / len(message):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
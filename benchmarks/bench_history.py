@@ -0,0 +1,84 @@
+"""
+Benchmark for the encoding of GET /chat responses: CPU time and bytes on the wire for sessions of 10, 100 and 1000
+turns of Chinese text, through the generic encoder of FastAPI and through the fast path of utils.fast_response.
+
+Run with: python -m benchmarks.bench_history
+"""
+import json
+import time
+from typing import Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+from models.message_models import GetMessageDto, Role
+from models.session_models import GetGameSessionDto
+from utils.fast_response import ResponseEncoder, brotli, msgpack, orjson
+from utils.get_selections import get_selections, to_stored_selections
+
+LINE = "你走进了一条昏暗的小巷，霓虹灯在雨中闪烁，远处传来低沉的引擎声。"
+SELECTIONS = "---selections---\n1. 继续前进\n2. 转身离开\n3. 躲进阴影\n---end selections---\n"
+
+
+def build_session(turns: int) -> Tuple[GetGameSessionDto, dict]:
+    """
+    Session with a reply of about 2 KB per turn
+    :return: the dataclass that GameController.get_history used to return, and the content it returns now
+    """
+    messages = []
+    documents = []
+    for turn in range(turns):
+        reply = "\n".join(f"{LINE}{turn}-{line}" for line in range(20)) + "\n" + SELECTIONS
+        for seq, role, content in ((2 * turn, Role.USER, "1"), (2 * turn + 1, Role.ASSISTANT, reply)):
+            messages.append(GetMessageDto(role=role, content=get_selections(content), image=None, audio=None,
+                                          seq=seq))
+            documents.append({"role": role.value, "content": content, "image": None, "audio": None, "seq": seq,
+                              "parsed": to_stored_selections(get_selections(content))})
+    session = {"user": "6423f0c1a2b3c4d5e6f70809", "prompt_name": "sci_fi_game", "message_count": 2 * turns}
+    return GetGameSessionDto(user=session["user"], messages=messages, prompt=session["prompt_name"],
+                             message_count=session["message_count"]), \
+        GetGameSessionDto.response_dict_from_documents(session, documents)
+
+
+def generic_response(session: GetGameSessionDto) -> bytes:
+    """
+    What FastAPI does for a returned dataclass: jsonable_encoder and then JSONResponse.render
+    """
+    return json.dumps(jsonable_encoder(session), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def measure(function, repeat: int):
+    result = None
+    started = time.process_time()
+    for _ in range(repeat):
+        result = function()
+    return (time.process_time() - started) / repeat, result
+
+
+def main():
+    encoder = ResponseEncoder(compression_min_size=1024)
+    variants = [
+        ("generic", None, None, lambda session, content: generic_response(session)),
+        ("fast", None, None, None),
+        ("fast+gzip", None, "gzip", None),
+    ]
+    if brotli is not None:
+        variants.append(("fast+br", None, "br", None))
+    if msgpack is not None:
+        variants.append(("msgpack", "application/msgpack", None, None))
+        variants.append(("msgpack+gzip", "application/msgpack", "gzip", None))
+    print(f"orjson: {orjson is not None}, brotli: {brotli is not None}, msgpack: {msgpack is not None}")
+    print(f"{'turns':>6} {'variant':>13} {'ms cpu':>9} {'bytes':>10}")
+    for turns in (10, 100, 1000):
+        session, content = build_session(turns)
+        repeat = max(3, 2000 // turns)
+        for name, accept, accept_encoding, function in variants:
+            if function is None:
+                def function(session, content, accept=accept, accept_encoding=accept_encoding):
+                    return encoder.response(content, accept=accept, accept_encoding=accept_encoding).body
+            seconds, body = measure(lambda: function(session, content), repeat=repeat)
+            print(f"{turns:>6} {name:>13} {seconds * 1e3:>9.2f} {len(body):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Allocations and peak memory of the per-request conversions of the messages of large sessions:
+- turn: loaded message documents to the messages sent to the model
+- history: loaded message documents to the content of the GET /chat response
+
+The documents are built by the benchmark, as the driver would decode them, so that the numbers include the fields
+that are loaded. The previous implementations are kept here for comparison.
+
+Run with: python -m benchmarks.bench_memory
+"""
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+
+from models.message_models import Role
+from models.session_models import GetGameSessionDto
+from utils.get_selections import PARSER_VERSION, GameMessageWithSelections, get_selections, to_stored_selections
+
+LINE = "你走进了一条昏暗的小巷，霓虹灯在雨中闪烁，远处传来低沉的引擎声。"
+SELECTIONS = "---selections---\n1. 继续前进\n2. 转身离开\n3. 躲进阴影\n---end selections---\n"
+SESSION = {"user": "6423f0c1a2b3c4d5e6f70809", "prompt_name": "sci_fi_game"}
+
+
+@dataclass
+class LegacyMessageDto:
+    """
+    Previous message type, a dataclass without slots
+    """
+    role: Role
+    content: Union[str, GameMessageWithSelections]
+    image: Optional[str]
+    audio: Optional[str]
+    seq: Optional[int] = None
+
+    def to_chat_gpt_dict(self) -> dict:
+        return {"role": self.role.value, "content": self.content}
+
+    def to_response_dict(self) -> dict:
+        content = self.content
+        if isinstance(content, GameMessageWithSelections):
+            content = {"message": content.message, "selections": content.selections}
+        return {"role": self.role.value, "content": content, "image": self.image, "audio": self.audio,
+                "seq": self.seq}
+
+
+def build_documents(messages: int) -> List[dict]:
+    documents = []
+    for seq in range(messages):
+        if seq % 2 == 0:
+            content = "1"
+            role = "user"
+        else:
+            content = "\n".join(f"{LINE}{seq}-{line}" for line in range(20)) + "\n" + SELECTIONS
+            role = "assistant"
+        documents.append({"role": role, "content": content, "image": None, "audio": None, "seq": seq,
+                          "parsed": to_stored_selections(get_selections(content))})
+    return documents
+
+
+def decode(documents: List[dict], fields: Optional[tuple] = None) -> List[dict]:
+    """
+    Copy of the documents, with the projected fields only, standing in for the documents decoded by the driver
+    """
+    if fields is None:
+        return [{**document, "parsed": dict(document["parsed"])} for document in documents]
+    return [{field: document[field] for field in fields} for document in documents]
+
+
+def legacy_turn(documents: List[dict]) -> List[dict]:
+    messages = [LegacyMessageDto(role=Role(document["role"]), content=document["content"], image=document.get("image"),
+                                 audio=document.get("audio"), seq=document.get("seq"))
+                for document in decode(documents)]
+    return [message.to_chat_gpt_dict() for message in messages]
+
+
+def turn(documents: List[dict]) -> List[dict]:
+    # MessageStore.find with CHAT_PROJECTION
+    return decode(documents, fields=("role", "content"))
+
+
+def legacy_history(documents: List[dict]) -> dict:
+    messages = []
+    for document in decode(documents):
+        stored = document.get("parsed")
+        if stored is None or stored.get("version") != PARSER_VERSION:
+            content = get_selections(document["content"])
+        else:
+            content = GameMessageWithSelections(message=stored["message"], selections=stored["selections"])
+        messages.append(LegacyMessageDto(role=Role(document["role"]), content=content, image=document.get("image"),
+                                         audio=document.get("audio"), seq=document.get("seq")))
+    return {"user": SESSION["user"], "messages": [message.to_response_dict() for message in messages],
+            "prompt": SESSION["prompt_name"], "message_count": SESSION.get("message_count")}
+
+
+def history(documents: List[dict]) -> dict:
+    return GetGameSessionDto.response_dict_from_documents(SESSION, decode(documents))
+
+
+def measure(function: Callable, documents: List[dict]):
+    """
+    :return: peak of the memory allocated during the call, including the result, and the duration without tracing
+    """
+    tracemalloc.start()
+    result = function(documents)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    started = time.perf_counter()
+    function(documents)
+    return peak, time.perf_counter() - started
+
+
+def main():
+    print(f"{'messages':>9} {'path':>17} {'peak KB':>9} {'ms':>8}")
+    for count in (100, 1000, 10000):
+        documents = build_documents(count)
+        for name, function in [("turn (legacy)", legacy_turn), ("turn", turn),
+                               ("history (legacy)", legacy_history), ("history", history)]:
+            peak, seconds = measure(function, documents)
+            print(f"{count:>9} {name:>17} {peak / 1024:>9.0f} {seconds * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Cold start of a worker: importing the app and running its startup hooks, in a fresh interpreter each time.
+
+Run with: python -m benchmarks.bench_startup
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+
+# run in a child process, so that nothing is imported or cached yet
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+asyncio.run(main.app.router.startup())
+ready = time.perf_counter()
+print(json.dumps({"import": imported - started, "startup": ready - imported}))
+"""
+
+
+def main():
+    env = {
+        **os.environ,
+        # nothing listens on this port, the app must start anyway
+        "DB_URL": os.getenv("DB_URL", "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=500"),
+        "JWT_SECRET_KEY": "benchmark",
+        "LLM_PROVIDER": os.getenv("LLM_PROVIDER", "stub"),
+    }
+    results = []
+    for _ in range(RUNS):
+        output = subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    print(f"{'stage':>8} {'median (ms)':>12} {'max (ms)':>10}")
+    for stage in ["import", "startup"]:
+        values = [result[stage] for result in results]
+        print(f"{stage:>8} {statistics.median(values) * 1e3:>12.1f} {max(values) * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
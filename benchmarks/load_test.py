@@ -0,0 +1,335 @@
+"""
+Load test of the app with simulated players, an in-memory Mongo and the stub language model.
+
+Each player registers, logs in, creates a session, waits for the opening turn and then plays a number of turns,
+each one a POST /chat followed by a GET /chat for the new messages. The app runs in-process through its ASGI
+interface, so the numbers measure the app itself and not the network.
+
+Run with: python -m benchmarks.load_test --players 50 --turns 10 --llm-latency 0.2
+Compare with a previous run: python -m benchmarks.load_test --compare benchmarks/results/baseline.json
+
+Needs the dev packages mongomock and httpx. Use --db-url to run against a real Mongo instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PROMPT_FILE = Path(__file__).parent.parent / "prompts" / "sci_fi_game.md"
+ADMIN = ("benchmark", "benchmark")
+
+
+class OpCounter:
+    """
+    Number of mongo operations by collection and method
+    """
+
+    def __init__(self):
+        self.ops: Counter = Counter()
+
+    def total(self) -> int:
+        return sum(self.ops.values())
+
+    def snapshot(self) -> Counter:
+        return Counter(self.ops)
+
+
+class CountingCollection:
+    def __init__(self, collection, counter: OpCounter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        def call(*args, **kwargs):
+            self._counter.ops[f"{self._collection.name}.{name}"] += 1
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class CountingDatabase:
+    def __init__(self, database, counter: OpCounter):
+        self._database = database
+        self._counter = counter
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+class CountingClient:
+    """
+    Wraps a pymongo compatible client and counts the calls to the collection methods
+    """
+
+    def __init__(self, client, counter: OpCounter):
+        self._client = client
+        self._counter = counter
+
+    def __getitem__(self, name):
+        return CountingDatabase(self._client[name], self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def start_app(args: argparse.Namespace, counter: OpCounter):
+    """
+    Import the app configured for the benchmark
+    :return: the main module
+    """
+    os.environ.update(
+        JWT_SECRET_KEY="benchmark",
+        ADMIN_USERNAME=ADMIN[0],
+        ADMIN_PASSWORD=ADMIN[1],
+        LLM_PROVIDER="stub",
+        STUB_LLM_LATENCY=str(args.llm_latency),
+        STUB_LLM_TOKEN_LATENCY=str(args.llm_token_latency),
+        ASYNC_MODE="true" if args.async_mode else "false",
+        DB_URL=args.db_url or "mongodb://localhost",
+    )
+    import utils.mongo
+
+    if args.db_url is None:
+        import mongomock
+
+        # mongomock is blocking, so it always runs in the threadpool like pymongo does in the sync mode
+        def create_mongo_client(db_url: str, use_async_driver: bool):
+            return utils.mongo.ThreadedMongoClient(CountingClient(mongomock.MongoClient(), counter))
+
+        utils.mongo.create_mongo_client = create_mongo_client
+    else:
+        from pymongo import monitoring
+
+        class CommandCounter(monitoring.CommandListener):
+            def started(self, event):
+                counter.ops[f"{event.command.get(event.command_name)}.{event.command_name}"] += 1
+
+            def succeeded(self, event):
+                pass
+
+            def failed(self, event):
+                pass
+
+        monitoring.register(CommandCounter())
+
+    import main
+    return main
+
+
+class Recorder:
+    """
+    Latencies of the requests by endpoint
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def request(self, client, method: str, endpoint: str, url: Optional[str] = None, expected=(200,),
+                      **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url or endpoint, **kwargs)
+        self.latencies[f"{method} {endpoint}"].append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            self.errors[f"{method} {endpoint} {response.status_code}"] += 1
+        return response
+
+
+async def play(client, recorder: Recorder, player: int, turns: int, run_id: str):
+    name = f"player-{run_id}-{player}"
+    await recorder.request(client, "POST", "/register", json={"name": name, "password": "password"})
+    response = await recorder.request(client, "POST", "/login", json={"name": name, "password": "password"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await recorder.request(client, "POST", "/chat/new", json={"prompt_name": "benchmark"}, headers=headers)
+
+    # the opening turn is generated in the background
+    seq = -1
+    while seq < 0:
+        response = await recorder.request(client, "GET", "/chat", url="/chat?limit=20", headers=headers)
+        messages = response.json().get("messages", [])
+        if len(messages) > 0:
+            seq = messages[-1]["seq"]
+        else:
+            await asyncio.sleep(0.01)
+
+    for _ in range(turns):
+        response = await recorder.request(client, "POST", "/chat", json={"content": str(random.randint(1, 3))},
+                                          headers=headers, expected=(200, 409))
+        if response.status_code == 409:
+            # the summary or a previous turn is still running
+            await asyncio.sleep(0.01)
+            continue
+        response = await recorder.request(client, "GET", "/chat", url=f"/chat?since={seq}", headers=headers)
+        seq = response.json()["messages"][-1]["seq"]
+
+
+async def measure_turn(client, counter: OpCounter, run_id: str) -> Counter:
+    """
+    Mongo operations of a single turn of a player that is alone on the server
+    """
+    recorder = Recorder()
+    await play(client, recorder, player=-1, turns=1, run_id=run_id)
+    headers = await login(client, f"player-{run_id}--1")
+    before = counter.snapshot()
+    await client.post("/chat", json={"content": "1"}, headers=headers)
+    return counter.snapshot() - before
+
+
+async def login(client, name: str) -> dict:
+    response = await client.post("/login", json={"name": name, "password": "password"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+
+    counter = OpCounter()
+    app_module = start_app(args, counter)
+    await app_module.app.router.startup()
+    run_id = f"{int(time.time())}-{random.randint(0, 9999)}"
+    try:
+        async with httpx.AsyncClient(app=app_module.app, base_url="http://benchmark", timeout=None) as client:
+            await client.post("/prompt", auth=ADMIN, json={
+                "name": "benchmark",
+                "prompt": PROMPT_FILE.read_text(encoding="utf-8"),
+                "first_user_message": "开始游戏",
+            })
+
+            recorder = Recorder()
+            ops_before = counter.total()
+            started = time.perf_counter()
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def player_task(player: int):
+                async with semaphore:
+                    await play(client, recorder, player=player, turns=args.turns, run_id=run_id)
+
+            await asyncio.gather(*[player_task(player) for player in range(args.players)])
+            duration = time.perf_counter() - started
+            ops_total = counter.total() - ops_before
+            turn_ops = await measure_turn(client, counter, run_id=run_id)
+    finally:
+        await app_module.app.router.shutdown()
+
+    requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    turns = len(recorder.latencies["POST /chat"])
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "config": {
+            "players": args.players,
+            "turns": args.turns,
+            "concurrency": args.concurrency,
+            "llm_latency": args.llm_latency,
+            "llm_token_latency": args.llm_token_latency,
+            "async_mode": args.async_mode,
+            "mongo": "mongodb" if args.db_url is not None else "mongomock",
+        },
+        "duration": duration,
+        "requests": requests,
+        "requests_per_second": requests / duration,
+        "turns_per_second": turns / duration,
+        "errors": dict(recorder.errors),
+        "mongo_ops": ops_total,
+        "mongo_ops_per_turn": sum(turn_ops.values()),
+        "mongo_ops_of_a_turn": dict(turn_ops),
+        "endpoints": {
+            endpoint: {
+                "count": len(latencies),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies),
+            } for endpoint, latencies in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: dict, baseline: Optional[dict] = None):
+    print(f"{result['requests']} requests in {result['duration']:.2f}s: {result['requests_per_second']:.1f} req/s, "
+          f"{result['turns_per_second']:.1f} turns/s, {result['mongo_ops_per_turn']} mongo ops per turn")
+    if len(result["errors"]) > 0:
+        print(f"errors: {result['errors']}")
+    print(f"{'endpoint':<16} {'count':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'p95 vs baseline':>16}")
+    for endpoint, stats in result["endpoints"].items():
+        change = ""
+        if baseline is not None and endpoint in baseline["endpoints"]:
+            change = f"{(stats['p95'] / baseline['endpoints'][endpoint]['p95'] - 1) * 100:+.1f}%"
+        print(f"{endpoint:<16} {stats['count']:>6} {stats['p50'] * 1e3:>9.2f} {stats['p95'] * 1e3:>9.2f} "
+              f"{stats['p99'] * 1e3:>9.2f} {change:>16}")
+
+
+def find_regressions(result: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for endpoint, stats in result["endpoints"].items():
+        previous = baseline["endpoints"].get(endpoint)
+        if previous is not None and stats["p95"] > previous["p95"] * (1 + threshold):
+            regressions.append(f"{endpoint} p95 {previous['p95'] * 1e3:.2f}ms -> {stats['p95'] * 1e3:.2f}ms")
+    if result["mongo_ops_per_turn"] > baseline["mongo_ops_per_turn"]:
+        regressions.append(f"mongo ops per turn {baseline['mongo_ops_per_turn']} -> {result['mongo_ops_per_turn']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=50, help="number of simulated players")
+    parser.add_argument("--turns", type=int, default=10, help="turns per player")
+    parser.add_argument("--concurrency", type=int, default=50, help="players playing at the same time")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds until the first token of the stub")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="seconds between two chunks")
+    parser.add_argument("--sync", dest="async_mode", action="store_false", help="run with ASYNC_MODE=false")
+    parser.add_argument("--db-url", default=None, help="use this mongo instead of mongomock")
+    parser.add_argument("--output", default=None, help="result file. Defaults to results/<timestamp>.json")
+    parser.add_argument("--compare", default=None, help="previous result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 increase reported as a regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare is not None else None
+    print_report(result, baseline)
+
+    output = Path(args.output) if args.output is not None else \
+        RESULTS_DIR / f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"saved to {output}")
+
+    if baseline is not None:
+        regressions = find_regressions(result, baseline, threshold=args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Tuple
+
+from fastapi import HTTPException
+
+from utils.metrics import metrics
+
+
+class AdmissionControl:
+    """
+    Limits the calls to the language model, so that traffic spikes queue some requests and shed the rest quickly
+    instead of failing all of them with errors of the provider.
+    A global limit of concurrent calls with a bounded FIFO queue, and a token bucket per user. Rejected requests get
+    a 503 when the queue is full or the wait times out, and a 429 when the user is over the rate, both with a
+    Retry-After header. The limits are per process.
+    Background work, such as refilling the opening pool or updating summaries, has a lower priority: it never waits,
+    only takes a slot that no request is waiting for, and has its own smaller budget of slots.
+    """
+
+    def __init__(self, max_concurrency: int = 0, max_queue: int = 100, queue_timeout: float = 30,
+                 user_rate: float = 0, user_burst: int = 5, max_users: int = 100000, max_background: int = 1):
+        """
+        :param max_concurrency: calls to the model running at the same time. 0 disables the limit
+        :param max_queue: calls waiting for a slot. Further calls are rejected right away
+        :param queue_timeout: seconds a call waits for a slot before it is rejected
+        :param user_rate: turns per second allowed per user, on average. 0 disables the per-user limit
+        :param user_burst: turns a user can send at once after being idle
+        :param max_users: number of users whose bucket is remembered. Least recently seen users start over with a
+        full bucket
+        :param max_background: slots that background work can hold at the same time, out of max_concurrency
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+        self.in_flight = 0
+        self.background_in_flight = 0
+        self.max_background = max_background
+        self._waiters: Deque[asyncio.Future] = deque()
+        # user id -> (tokens, last update on the monotonic clock)
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        # moving average of the seconds a slot is held, to estimate Retry-After
+        self._average_duration = 1.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_user_rate = 0
+        self.rejected_background = 0
+
+    def admit_user(self, user_id: str):
+        """
+        Take a token from the bucket of a user
+        :param user_id: id of the JWT
+        :return:
+        :raises HTTPException: 429 if the bucket is empty
+        """
+        if self.user_rate <= 0:
+            return
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(user_id, (self.user_burst, now))
+        tokens = min(self.user_burst, tokens + (now - updated) * self.user_rate)
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now)
+            self._buckets.move_to_end(user_id)
+            self.rejected_user_rate += 1
+            metrics.inc("admission_rejected_total", reason="user_rate")
+            raise HTTPException(status_code=429, detail="Too many messages. Please slow down.",
+                                headers={"Retry-After": str(math.ceil((1 - tokens) / self.user_rate))})
+        self._buckets[user_id] = (tokens - 1, now)
+        self._buckets.move_to_end(user_id)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+
+    async def acquire(self, background: bool = False):
+        """
+        Wait for a slot to call the model. Call release once the call is done
+        :param background: the call is background work, which is rejected instead of waiting
+        :return:
+        :raises HTTPException: 503 if the queue is full or the wait times out, or for background work, if no slot
+        of its budget is free
+        """
+        if background:
+            self.__acquire_background__()
+            return
+        if self.max_concurrency <= 0 or (self.in_flight < self.max_concurrency and len(self._waiters) == 0):
+            self.in_flight += 1
+            self.admitted += 1
+            metrics.observe("llm_queue_wait_seconds", 0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            metrics.inc("admission_rejected_total", reason="queue_full")
+            raise self.__overloaded__()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as the wait ended
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                metrics.inc("admission_rejected_total", reason="queue_timeout")
+                raise self.__overloaded__()
+            raise
+        self.admitted += 1
+        metrics.observe("llm_queue_wait_seconds", time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def slot(self, background: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a slot while calling the model
+        :param background: the call is background work, see acquire
+        :return: context manager
+        """
+        await self.acquire(background=background)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started, background=background)
+
+    def release(self, duration: Optional[float] = None, background: bool = False):
+        """
+        Give the slot to the next waiting call
+        :param duration: seconds the slot was held, used to estimate Retry-After
+        :param background: the slot was acquired for background work
+        :return:
+        """
+        if background:
+            self.background_in_flight -= 1
+        if duration is not None:
+            self._average_duration = 0.9 * self._average_duration + 0.1 * duration
+        while len(self._waiters) > 0:
+            future = self._waiters.popleft()
+            if not future.done():
+                # the slot goes to the waiter, so in_flight stays the same
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        """
+        Queue depth and counters of the admission control
+        :return:
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "rejected_user_rate": self.rejected_user_rate,
+            "background_in_flight": self.background_in_flight,
+            "rejected_background": self.rejected_background,
+        }
+
+    def __acquire_background__(self):
+        if self.max_concurrency > 0 and (self.in_flight >= self.max_concurrency or len(self._waiters) > 0 or
+                                         self.background_in_flight >= self.max_background):
+            self.rejected_background += 1
+            metrics.inc("admission_rejected_total", reason="background")
+            raise self.__overloaded__()
+        self.in_flight += 1
+        self.background_in_flight += 1
+        self.admitted += 1
+
+    def __overloaded__(self) -> HTTPException:
+        # time for the queue ahead to drain at the current pace
+        retry_after = self._average_duration * (len(self._waiters) + 1) / max(self.max_concurrency, 1)
+        return HTTPException(status_code=503, detail="The game is busy. Please try again shortly.",
+                             headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
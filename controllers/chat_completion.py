@@ -0,0 +1,40 @@
+from contextlib import nullcontext
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from controllers.admission_control import AdmissionControl
+from providers.llm_provider import LLMProvider, LLMProviderError, LLMTimeoutError
+from utils.metrics import metrics
+
+
+async def create_chat_completion(llm_provider: LLMProvider, messages: List[dict], model: str,
+                                 admission_control: Optional[AdmissionControl] = None,
+                                 background: bool = False) -> str:
+    """
+    Call the chat completion API through the admission control, recording the outcome, the latency and the tokens
+    :param llm_provider: language model backend
+    :param messages: messages in the chat gpt format
+    :param model: model name
+    :param admission_control: limits the calls to the model. Unlimited without it
+    :param background: the call is background work, which gets a lower priority
+    :return: content of the reply
+    :raises HTTPException: 503 if the admission control rejects the call, 504 on timeout, 502 if the model fails
+    """
+    slot = admission_control.slot(background=background) if admission_control is not None else nullcontext()
+    try:
+        async with slot:
+            with metrics.span("llm"):
+                completion = await llm_provider.complete(messages=messages, model=model)
+    except LLMTimeoutError as e:
+        metrics.inc("llm_requests_total", model=model, outcome="timeout")
+        raise HTTPException(status_code=504, detail=str(e))
+    except LLMProviderError as e:
+        metrics.inc("llm_requests_total", model=model, outcome="error")
+        raise HTTPException(status_code=502, detail=f"The language model failed to answer: {e}")
+    metrics.inc("llm_requests_total", model=model, outcome="ok")
+    if completion.prompt_tokens is not None:
+        metrics.inc("llm_tokens_total", completion.prompt_tokens, model=model, type="prompt")
+    if completion.completion_tokens is not None:
+        metrics.inc("llm_tokens_total", completion.completion_tokens, model=model, type="completion")
+    return completion.content
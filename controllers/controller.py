@@ -1,9 +1,16 @@
-from pymongo import MongoClient
+from utils.mongo import AsyncMongoClient
 
 
 class Controller:
-    client: MongoClient
+    client: AsyncMongoClient
 
-    def __init__(self, client: MongoClient):
+    def __init__(self, client: AsyncMongoClient):
         self.client = client
         self.db = self.client["gamebot"]
+
+    async def create_indexes(self):
+        """
+        Create the indexes used by the controller. Safe to call multiple times.
+        :return:
+        """
+        pass
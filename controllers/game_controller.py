@@ -1,91 +1,177 @@
-from typing import Optional
+import asyncio
+import logging
+import time
+from dataclasses import asdict
+from typing import AsyncIterator, List, Optional, Set, Tuple
 
-import openai
+from bson import ObjectId
 from fastapi import HTTPException
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from motor.motor_asyncio import AsyncIOMotorCollection
 
+from controllers.admission_control import AdmissionControl
+from controllers.chat_completion import create_chat_completion
 from controllers.controller import Controller
+from controllers.idempotency_store import IdempotencyStore
+from controllers.message_store import CHAT_PROJECTION, MessageStore
+from controllers.media_pipeline import MediaPipeline
+from controllers.opening_pool import OpeningPool
+from controllers.response_cache import ResponseCache, request_key
+from controllers.session_archiver import SessionArchiver
+from controllers.prompt_cache import PromptCache
 from models.message_models import CreateMessageDto, Role, ChatMessageResponseDto
-from models.prompt_models import GetPromptDto
-from models.session_models import GetGameSessionDto, CreateGameSessionDto
-from utils.get_selections import get_selections
+from models.session_models import GetGameSessionDto, CreateGameSessionDto, SessionSummaryDto, GameSessionDto
+from providers.llm_provider import LLMProvider, LLMProviderError, LLMTimeoutError
+from utils.context_window import build_context, select_messages_to_summarize
+from utils.get_selections import GameMessageWithSelections, SelectionsParser
+from utils.metrics import metrics
+from utils.mongo import AsyncMongoClient
+
+SUMMARY_INSTRUCTION = "You summarize a text adventure game. Update the current summary with the new part of the " \
+                      "story. Keep the characters, places, items, decisions of the player and open plot threads. " \
+                      "Write in the language of the story and use at most {tokens} tokens."
+# Attempts to generate an opening turn in the background, and seconds before the first retry, doubled on each retry
+OPENING_ATTEMPTS = 3
+OPENING_RETRY_DELAY = 2.0
 
 
 class GameController(Controller):
 
-    def __init__(self, client: MongoClient):
+    def __init__(self, client: AsyncMongoClient, prompt_cache: PromptCache, idempotency_store: IdempotencyStore,
+                 llm_provider: LLMProvider, default_model: str = "gpt-3.5-turbo-0301",
+                 context_token_budget: int = 3000, summary_token_budget: int = 500, context_message_limit: int = 50,
+                 turn_timeout: float = 120, opening_pool: Optional[OpeningPool] = None,
+                 media_pipeline: Optional[MediaPipeline] = None, response_cache: Optional[ResponseCache] = None,
+                 session_archiver: Optional[SessionArchiver] = None,
+                 admission_control: Optional[AdmissionControl] = None):
+        """
+        :param client: mongo client
+        :param prompt_cache: prompt cache shared with the PromptController
+        :param idempotency_store: store of the responses of requests with an idempotency key
+        :param llm_provider: language model backend
+        :param default_model: model used for prompts that don't set one, and for the summaries
+        :param context_token_budget: maximum number of tokens sent to the model, excluding the reply
+        :param summary_token_budget: target length of the rolling summary of the older messages
+        :param context_message_limit: maximum number of messages loaded per turn
+        :param turn_timeout: seconds after which the lock of a turn expires, if it was neither committed nor cancelled
+        :param opening_pool: pre-generated opening turns. Without it, every opening turn calls the model
+        :param media_pipeline: renders the audio and image of the replies in the background. Disabled without it
+        :param response_cache: replies reused for identical requests of the prompts that enable cache_responses
+        :param session_archiver: brings back the sessions that were archived while idle
+        :param admission_control: limits the calls to the model globally and per user. Unlimited without it
+        """
         super().__init__(client=client)
-        self.collection: Collection = self.db["game-sessions"]
-        self.collection.create_index("user", unique=True)
+        self.collection: AsyncIOMotorCollection = self.db["game-sessions"]
+        self.message_store = MessageStore(client=client)
+        self.prompt_cache = prompt_cache
+        self.idempotency_store = idempotency_store
+        self.context_message_limit = context_message_limit
+        self.turn_timeout = turn_timeout
+        self.llm_provider = llm_provider
+        self.default_model = default_model
+        self.opening_pool = opening_pool
+        self.media_pipeline = media_pipeline
+        self.response_cache = response_cache
+        self.session_archiver = session_archiver
+        self.admission_control = admission_control
+        self.context_token_budget = context_token_budget
+        self.summary_token_budget = summary_token_budget
+        # users whose summary is being updated, and the running background tasks
+        self.summarizing: Set[str] = set()
+        self.background_tasks: Set[asyncio.Task] = set()
 
-    def delete_session(self, user_id: str):
+    async def create_indexes(self):
+        await self.collection.create_index("user", unique=True)
+        await self.message_store.create_indexes()
+        await self.idempotency_store.create_indexes()
+
+    async def delete_session(self, user_id: str):
         try:
-            data = self.collection.delete_one({"user": user_id})
-            if data is None:
-                raise HTTPException(status_code=500, detail="Failed to delete session")
+            session = await self.collection.find_one_and_delete({"user": user_id}, projection={"_id": 1})
+            if session is not None:
+                await self.message_store.delete(session["_id"])
+            if self.session_archiver is not None:
+                await self.session_archiver.discard(user_id)
             return {"message": "Session deleted successfully"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    def create_new_game_session(self, user_id: str, data: CreateGameSessionDto):
-        self.__create_new_game_session__(user_id=user_id, data=data)
+    async def create_new_game_session(self, user_id: str, data: CreateGameSessionDto):
+        await self.__create_new_game_session__(user_id=user_id, data=data)
         return {"message": "Session created successfully"}
 
-    def get_history(self, user_id: str) -> GetGameSessionDto:
+    async def get_history(self, user_id: str, limit: Optional[int] = None, before: Optional[int] = None,
+                          since: Optional[int] = None) -> dict:
         """
         Get the history of the game session
         :param user_id:
-        :return:
+        :param limit: maximum number of messages. Without since, the most recent messages are returned
+        :param before: only messages with a lower sequence number, to load older pages
+        :param since: only messages with a higher sequence number, to load the messages a client doesn't have yet
+        :return: the response in the format of GetGameSessionDto
         """
-        session = self.collection.find_one({"user": user_id})
+        with metrics.span("find_session"):
+            session = await self.__find_session__(user_id=user_id)
         if session is None:
             raise HTTPException(status_code=404, detail="No session found. Please create a new session.")
-        messages = []
-        # Get the selections for each message
-        for message in session['messages']:
-            message_with_selections = get_selections(message['content'])
-            message['content'] = message_with_selections
-            messages.append(message)
-        session['messages'] = messages
-        return GetGameSessionDto.from_dict(session)
-
-    def chat(self, user_id: str, message: Optional[str] = None,
-             extra_data: Optional[dict] = None) -> ChatMessageResponseDto:
+        with metrics.span("find_messages"):
+            # messages of a turn that is being committed are not part of the history yet
+            message_count = session.get("message_count", 0)
+            before = message_count if before is None else min(before, message_count)
+            page = await self.message_store.find_page(session["_id"], limit=limit, before=before, since=since)
+        with metrics.span("format_messages"):
+            # Selections are parsed when the messages are saved
+            return GetGameSessionDto.response_dict_from_documents(session, page)
+
+    async def chat(self, user_id: str, message: Optional[str] = None,
+                   extra_data: Optional[dict] = None, idempotency_key: Optional[str] = None) -> ChatMessageResponseDto:
         """
         Chat with the bot
         :param user_id: user id
         :param message: message from the user
         :param extra_data: extra data to be used in the prompt. This is used to render the prompt
+        :param idempotency_key: key sent by the client. Retries with the same key get the response of the first request
         :return:
         """
-        previous_session = self.__get_previous_game_session__(user_id=user_id)
-        user_message = CreateMessageDto(role=Role.USER, content=message, audio=None,
-                                        image=None) if message is not None else None
-        if previous_session is None:
-            raise HTTPException(status_code=404, detail="No session found. Please create a new session.")
-        # Prepare the messages for the GPT-3 API
-        system_message = CreateMessageDto(role=Role.SYSTEM, content=previous_session.prompt.prompt, audio=None,
-                                          image=None)
-        system_message.render(extra_data=extra_data)
-
-        messages = [system_message.to_chat_gpt_dict()] + [message.to_chat_gpt_dict() for message in
-                                                          previous_session.messages]
-        if user_message is not None:
-            user_message.render(extra_data=extra_data)
-            messages = messages + [user_message.to_chat_gpt_dict()]
-            # Add the user message to the game session
-            self.__add_message_to_game_session__(user_id=user_id, message=user_message)
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-0301",
-            messages=messages,
-        )
+        if idempotency_key is None:
+            return await self.__chat__(user_id=user_id, message=message, extra_data=extra_data)
+
+        async def handler() -> dict:
+            return asdict(await self.__chat__(user_id=user_id, message=message, extra_data=extra_data))
 
-        # Add the bot message to the game session
-        bot_message = CreateMessageDto(role=Role.ASSISTANT, content=response['choices'][0]['message']['content'],
-                                       audio=None, image=None)
-        self.__add_message_to_game_session__(user_id=user_id, message=bot_message)
-        message_with_selection = get_selections(bot_message.content)
+        response = await self.idempotency_store.run(user_id=user_id, key=idempotency_key, handler=handler)
+        return ChatMessageResponseDto(**response)
+
+    async def __chat__(self, user_id: str, message: Optional[str], extra_data: Optional[dict]) \
+            -> ChatMessageResponseDto:
+        self.__admit_user__(user_id)
+        session = await self.__start_turn__(user_id=user_id)
+        return await self.__run_turn__(session=session, message=message, extra_data=extra_data)
+
+    async def __run_turn__(self, session: GameSessionDto, message: Optional[str], extra_data: Optional[dict],
+                           reply: Optional[str] = None) -> ChatMessageResponseDto:
+        """
+        Generate the reply of a locked session and commit the turn
+        :param session: session returned by __start_turn__
+        :param message: message from the user
+        :param extra_data: extra data to be used in the prompt
+        :param reply: reply generated beforehand. The model is only called without it
+        :return:
+        """
+        messages, user_message = await self.__prepare_chat_messages__(session=session, message=message,
+                                                                      extra_data=extra_data)
+        try:
+            content = reply if reply is not None else await self.__complete__(session=session, messages=messages)
+        except Exception:
+            await self.message_store.cancel_turn(session.id, session.turn_id)
+            raise
+
+        # Add the user and the bot message to the game session
+        bot_message = CreateMessageDto(role=Role.ASSISTANT, content=content, audio=None, image=None)
+        with metrics.span("parse"):
+            message_with_selection = bot_message.parse()
+        with metrics.span("commit"):
+            seq = await self.__commit_turn__(session=session, messages=[user_message, bot_message])
+        self.__schedule_media__(session, seq=seq, message=message_with_selection)
         return ChatMessageResponseDto(
             message=message_with_selection.message,
             selections=message_with_selection.selections,
@@ -93,65 +179,429 @@ class GameController(Controller):
             image=None,
         )
 
-    def __get_previous_game_session__(self, user_id: str) -> Optional[GetGameSessionDto]:
+    async def chat_stream(self, user_id: str, message: Optional[str] = None,
+                          extra_data: Optional[dict] = None) -> AsyncIterator[Tuple[str, dict]]:
         """
-        Get the previous game session for a user
-        :param user_id: id
+        Chat with the bot and stream the reply as it is generated.
+        Errors such as a missing session are raised before the stream starts.
+        :param user_id: user id
+        :param message: message from the user
+        :param extra_data: extra data to be used in the prompt. This is used to render the prompt
+        :return: iterator of (event, data). "text" events carry narrative text and "selection" events carry
+        a selection as soon as they are parsed. A final "done" event with the parsed message is sent once the
+        messages have been saved
+        """
+        self.__admit_user__(user_id)
+        session = await self.__start_turn__(user_id=user_id)
+        messages, user_message = await self.__prepare_chat_messages__(session=session, message=message,
+                                                                      extra_data=extra_data)
+        model = self.__get_model__(session)
+        cache_key = self.__response_cache_key__(session, messages=messages, model=model)
+        # the slot is held until the stream ends
+        slot_started: Optional[float] = None
+        try:
+            cached = await self.response_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                chunks = self.__replay__(cached)
+            else:
+                if self.admission_control is not None:
+                    with metrics.span("admission"):
+                        await self.admission_control.acquire()
+                    slot_started = time.perf_counter()
+                chunks = await self.__create_chat_completion_stream__(messages=messages, model=model)
+        except Exception:
+            if slot_started is not None:
+                self.admission_control.release(time.perf_counter() - slot_started)
+            await self.message_store.cancel_turn(session.id, session.turn_id)
+            raise
+
+        async def events() -> AsyncIterator[Tuple[str, dict]]:
+            committed = False
+            try:
+                contents = []
+                parser = SelectionsParser()
+                async for content in chunks:
+                    contents.append(content)
+                    for event in parser.feed(content):
+                        yield event.type.value, {"content": event.content}
+                for event in parser.close():
+                    yield event.type.value, {"content": event.content}
+
+                # The turn is only saved when the whole reply has been received
+                message_with_selection = parser.result()
+                bot_message = CreateMessageDto(role=Role.ASSISTANT, content="".join(contents), audio=None,
+                                               image=None, parsed=message_with_selection)
+                with metrics.span("commit"):
+                    seq = await self.__commit_turn__(session=session, messages=[user_message, bot_message])
+                committed = True
+                if cache_key is not None and cached is None:
+                    await self.response_cache.put(cache_key, bot_message.content)
+                self.__schedule_media__(session, seq=seq, message=message_with_selection)
+                yield "done", asdict(ChatMessageResponseDto(
+                    message=message_with_selection.message,
+                    selections=message_with_selection.selections,
+                    audio=None,
+                    image=None,
+                ))
+            finally:
+                if slot_started is not None:
+                    self.admission_control.release(time.perf_counter() - slot_started)
+                if not committed:
+                    # the stream failed or the client disconnected
+                    await self.message_store.cancel_turn(session.id, session.turn_id)
+
+        return events()
+
+    async def __prepare_chat_messages__(self, session: GameSessionDto, message: Optional[str],
+                                        extra_data: Optional[dict]) -> Tuple[List[dict], Optional[CreateMessageDto]]:
+        """
+        Build the messages for the chat completion API. The turn is cancelled if this fails
+        :param session: session returned by __start_turn__
+        :param message: message from the user
+        :param extra_data: extra data to be used in the prompt
+        :return: the messages in the chat gpt format and the user message to save with the reply
+        """
+        if message is None and session.message_count == 0:
+            # the opening turn of a session whose opening failed
+            message = session.prompt.first_user_message
+        try:
+            with metrics.span("render"):
+                user_message = CreateMessageDto(role=Role.USER, content=message, audio=None,
+                                                image=None) if message is not None else None
+                # Prepare the messages for the GPT-3 API
+                system_message = CreateMessageDto(role=Role.SYSTEM, content=session.prompt.prompt, audio=None,
+                                                  image=None)
+                system_message.render(extra_data=extra_data, cache=True)
+
+                # the messages are loaded in the chat gpt format
+                history = session.messages
+                if user_message is not None:
+                    user_message.render(extra_data=extra_data)
+                    user_message.parse()
+                    history.append(user_message.to_chat_gpt_dict())
+        except Exception:
+            await self.message_store.cancel_turn(session.id, session.turn_id)
+            raise
+
+        # Older messages are only sent through the rolling summary, so that the request size stays flat
+        summary = session.summary
+        with metrics.span("build_context"):
+            context = build_context(system_message=system_message.to_chat_gpt_dict(), history=history,
+                                    budget=self.context_token_budget,
+                                    summary=summary.content if summary is not None else None)
+        first_kept = session.first_seq + context.first_kept
+        if first_kept > (summary.until if summary is not None else 0):
+            self.__schedule_summary__(session_id=session.id, user_id=session.user, history=history,
+                                      first_seq=session.first_seq, summary=summary, end=first_kept)
+        return context.messages, user_message
+
+    def __get_model__(self, session: GameSessionDto) -> str:
+        return session.prompt.model or self.default_model
+
+    async def __complete__(self, session: GameSessionDto, messages: List[dict]) -> str:
+        """
+        Generate the reply of a turn, or reuse the reply to an identical request if the prompt enables it
+        :param session: session of the turn
+        :param messages: messages in the chat gpt format
+        :return: the reply
+        """
+        model = self.__get_model__(session)
+        cache_key = self.__response_cache_key__(session, messages=messages, model=model)
+        if cache_key is not None:
+            with metrics.span("response_cache"):
+                cached = await self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        content = await self.__create_chat_completion__(messages=messages, model=model)
+        if cache_key is not None:
+            await self.response_cache.put(cache_key, content)
+        return content
+
+    def __response_cache_key__(self, session: GameSessionDto, messages: List[dict], model: str) -> Optional[str]:
+        """
+        :return: the key of the request in the response cache, or None if the prompt doesn't use the cache
+        """
+        if self.response_cache is None or not self.response_cache.enabled or not session.prompt.cache_responses:
+            return None
+        return request_key(messages, model)
+
+    @staticmethod
+    async def __replay__(content: str) -> AsyncIterator[str]:
+        yield content
+
+    async def __create_chat_completion__(self, messages: list, model: str, background: bool = False) -> str:
+        """
+        Call the chat completion API
+        :param messages: messages in the chat gpt format
+        :param model: model name
+        :param background: the call is background work, which gets a lower priority
+        :return: content of the reply
+        """
+        return await create_chat_completion(self.llm_provider, messages=messages, model=model,
+                                            admission_control=self.admission_control, background=background)
+
+    def __admit_user__(self, user_id: str):
+        """
+        Count a turn against the rate limit of a user, before the session is locked
+        :param user_id: user id
+        :return:
+        """
+        if self.admission_control is not None:
+            self.admission_control.admit_user(user_id)
+
+    def __schedule_summary__(self, session_id: ObjectId, user_id: str, history: List[dict], first_seq: int,
+                             summary: Optional[SessionSummaryDto], end: int):
+        """
+        Fold the messages that are no longer sent verbatim into the summary, in the background
+        :param session_id: id of the game session
+        :param user_id: user id
+        :param history: loaded messages of the session in the chat gpt format
+        :param first_seq: sequence number of the first loaded message
+        :param summary: current summary
+        :param end: sequence number of the first message that is still sent verbatim
         :return:
         """
+        if user_id in self.summarizing:
+            return
+        self.summarizing.add(user_id)
+        task = asyncio.create_task(self.__update_summary__(session_id=session_id, user_id=user_id, history=history,
+                                                           first_seq=first_seq, summary=summary, end=end))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        task.add_done_callback(lambda _: self.summarizing.discard(user_id))
+
+    async def __update_summary__(self, session_id: ObjectId, user_id: str, history: List[dict], first_seq: int,
+                                 summary: Optional[SessionSummaryDto], end: int):
+        summarized = summary.until if summary is not None else 0
         try:
-            session = self.collection.aggregate([
-                {
-                    '$match': {
-                        'user': user_id
-                    }
-                }, {
-                    '$lookup': {
-                        'from': 'prompts',
-                        'localField': 'prompt_name',
-                        'foreignField': 'name',
-                        'as': 'prompt'
-                    }
-                }, {
-                    '$unwind': {
-                        'path': '$prompt',
-                        'includeArrayIndex': 'string',
-                        'preserveNullAndEmptyArrays': True
-                    }
-                }
-            ]).next()
-            if session is None:
-                return None
-            return GetGameSessionDto.from_dict(session)
+            if summarized < first_seq:
+                # The summary lags behind the loaded messages, e.g. because summaries were skipped while the model
+                # was busy. The older messages are summarized first, one page per turn, so that none is left out
+                history = await self.message_store.find(session_id, start=summarized,
+                                                        end=min(first_seq, summarized + self.context_message_limit),
+                                                        projection=CHAT_PROJECTION)
+                first_seq = summarized
+                end = summarized + len(history)
+            start = summarized - first_seq
+            # Limit the size of one summary request. The rest is summarized on the next turns
+            until = select_messages_to_summarize(history, start=start, end=end - first_seq,
+                                                 budget=self.context_token_budget)
+            transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in history[start:until])
+            request = [
+                {"role": "system", "content": SUMMARY_INSTRUCTION.format(tokens=self.summary_token_budget)},
+                {"role": "user", "content": f"Current summary:\n{summary.content if summary is not None else ''}\n\n"
+                                            f"New part of the story:\n{transcript}"},
+            ]
+            # skipped when the model is busy, the next turns try again
+            content = await self.__create_chat_completion__(messages=request, model=self.default_model,
+                                                            background=True)
+            new_summary = SessionSummaryDto(content=content, until=first_seq + until)
+            # Only update the summary this one was based on, in case another process updated it meanwhile
+            query = {"user": user_id, "summary.until": summary.until} if summary is not None else \
+                {"user": user_id, "summary": {"$exists": False}}
+            await self.collection.update_one(query, {"$set": {"summary": new_summary.to_dict()}})
         except Exception as e:
-            print("error: " + str(e))
-            raise HTTPException(status_code=404, detail="No session found. Please create a new session.")
+            logging.warning(f"Failed to update the summary of {user_id}: {e}")
+            metrics.inc("background_errors_total", task="summary")
 
-    def __create_new_game_session__(self, user_id: str, data: CreateGameSessionDto):
+    async def __create_chat_completion_stream__(self, messages: list, model: str) -> AsyncIterator[str]:
+        """
+        Call the chat completion API in streaming mode
+        :param messages: messages in the chat gpt format
+        :param model: model name
+        :return: iterator of the content chunks
+        """
+        try:
+            # only the time until the stream starts. The completion of streams has no token usage
+            with metrics.span("llm_first_chunk"):
+                chunks = await self.llm_provider.stream(messages=messages, model=model)
+        except LLMTimeoutError as e:
+            metrics.inc("llm_requests_total", model=model, outcome="timeout")
+            raise HTTPException(status_code=504, detail=str(e))
+        except LLMProviderError as e:
+            metrics.inc("llm_requests_total", model=model, outcome="error")
+            raise HTTPException(status_code=502, detail=f"The language model failed to answer: {e}")
+        metrics.inc("llm_requests_total", model=model, outcome="ok")
+        return chunks
+
+    async def __find_session__(self, user_id: str) -> Optional[dict]:
+        """
+        Find the game-sessions document of a user, bringing it back if it was archived and moving embedded messages
+        of older sessions to the message store
+        :param user_id: id
+        :return:
+        """
+        session = await self.collection.find_one({"user": user_id})
+        if session is None and self.session_archiver is not None and await self.session_archiver.rehydrate(user_id):
+            session = await self.collection.find_one({"user": user_id})
+        if session is not None and session.get("messages") is not None:
+            session = await self.message_store.migrate(session)
+        return session
+
+    async def __start_turn__(self, user_id: str) -> GameSessionDto:
+        """
+        Lock the game session of a user for a turn and load the messages that are not in the summary yet
+        :param user_id: id
+        :return:
+        """
+        with metrics.span("lock_session"):
+            session = await self.message_store.start_turn(user_id=user_id, timeout=self.turn_timeout)
+        if session is None:
+            if await self.collection.find_one({"user": user_id}, projection={"_id": 1}) is None:
+                if self.session_archiver is not None and await self.session_archiver.rehydrate(user_id):
+                    return await self.__start_turn__(user_id=user_id)
+                raise HTTPException(status_code=404, detail="No session found. Please create a new session.")
+            raise HTTPException(status_code=409,
+                                detail="Another message is being processed. Please wait for the reply.")
+        return await self.__load_turn__(session)
+
+    async def __load_turn__(self, session: dict) -> GameSessionDto:
+        """
+        Load the prompt and the messages of a locked session. The turn is cancelled if this fails
+        :param session: locked game-sessions document
+        :return:
+        """
+        try:
+            if session.get("messages") is not None:
+                session = await self.message_store.migrate(session)
+            prompt = await self.prompt_cache.get(session["prompt_name"])
+            if prompt is None:
+                raise HTTPException(status_code=404, detail="Prompt not found: " + session["prompt_name"])
+            summary = session.get("summary")
+            first_seq = max(summary["until"] if summary is not None else 0,
+                            session.get("message_count", 0) - self.context_message_limit, 0)
+            with metrics.span("load_messages"):
+                messages = await self.message_store.find(session["_id"], start=first_seq,
+                                                         end=session.get("message_count", 0),
+                                                         projection=CHAT_PROJECTION)
+        except Exception:
+            await self.message_store.cancel_turn(session["_id"], session["turn"]["id"])
+            raise
+        game_session = GameSessionDto.from_dict(session, messages=messages, first_seq=first_seq)
+        game_session.prompt = prompt
+        return game_session
+
+    async def __create_new_game_session__(self, user_id: str, data: CreateGameSessionDto):
         """
         Create a new game session for a user
         :param user_id: id
         :return:
         """
-        prompt_collection = self.db["prompts"]
-        prompt = prompt_collection.find_one({"name": data.prompt_name})
+        prompt = await self.prompt_cache.get(data.prompt_name)
         if prompt is None:
             raise HTTPException(status_code=404, detail="Prompt not found: " + data.prompt_name)
-        prompt = GetPromptDto.from_dict(prompt)
-        data = self.collection.insert_one(data.to_dict(user=user_id))
         if prompt.first_user_message is not None:
-            self.chat(user_id=user_id, message=prompt.first_user_message, extra_data=None)
+            # the opening turn calls the model
+            self.__admit_user__(user_id)
+        if self.session_archiver is not None and \
+                await self.collection.find_one({"user": user_id}, projection={"_id": 1}) is None:
+            # an archived session counts as an existing session, as if it had not been archived
+            await self.session_archiver.rehydrate(user_id)
+        document = data.to_dict(user=user_id)
+        if prompt.first_user_message is not None:
+            # locked until the opening turn is saved, so that no message of the user can come before it
+            document["turn"] = self.message_store.new_turn(self.turn_timeout)
+        with metrics.span("insert_session"):
+            data = await self.collection.insert_one(document)
         if data is None:
             raise HTTPException(status_code=500, detail="Failed to create new game session")
+        if prompt.first_user_message is None:
+            return
+        document["_id"] = data.inserted_id
+        session = await self.__load_turn__(document)
+        reply = self.opening_pool.take(prompt) if self.opening_pool is not None else None
+        if reply is not None:
+            await self.__run_turn__(session=session, message=prompt.first_user_message, extra_data=None, reply=reply)
+            return
+        # the client gets the opening turn from GET /chat once it is generated
+        task = asyncio.create_task(self.__run_opening_turn__(session=session))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
 
-    def __add_message_to_game_session__(self, user_id: str, message: CreateMessageDto):
+    async def __run_opening_turn__(self, session: GameSessionDto):
         """
-        Add a message to a game session
-        :param user_id: id
-        :param message: message
+        Generate the opening turn of a new session, retrying when the model fails or is busy. If every attempt fails,
+        the error is recorded on the session for GET /chat, and the client can ask for the opening with POST /chat
+        :param session: locked session
         :return:
         """
+        delay = OPENING_RETRY_DELAY
+        for attempt in range(1, OPENING_ATTEMPTS + 1):
+            try:
+                await self.__run_turn__(session=session, message=session.prompt.first_user_message, extra_data=None)
+                return
+            except Exception as e:
+                error = e.detail if isinstance(e, HTTPException) else repr(e)
+                logging.warning(f"Failed to generate the opening turn of {session.user} "
+                                f"(attempt {attempt} of {OPENING_ATTEMPTS}): {error}")
+                metrics.inc("background_errors_total", task="opening")
+                retry_after = (e.headers or {}).get("Retry-After") if isinstance(e, HTTPException) else None
+            if attempt == OPENING_ATTEMPTS:
+                break
+            try:
+                # locked again right away, so that no message of the user comes before the opening
+                session = await self.__relock_opening__(session)
+            except Exception as e:
+                logging.warning(f"Failed to retry the opening turn of {session.user}: {e!r}")
+                metrics.inc("background_errors_total", task="opening")
+                return
+            if session is None:
+                return
+            if retry_after is not None:
+                delay = max(delay, float(retry_after))
+            # the lock must outlive the wait
+            await asyncio.sleep(min(delay, self.turn_timeout / 2))
+            delay *= 2
+        try:
+            await self.collection.update_one({"_id": session.id, "message_count": 0},
+                                             {"$set": {"opening_error": error}})
+        except Exception as e:
+            logging.warning(f"Failed to record the failed opening turn of {session.user}: {e!r}")
+
+    async def __relock_opening__(self, session: GameSessionDto) -> Optional[GameSessionDto]:
+        """
+        Lock a session again to retry its opening turn
+        :param session: session whose opening turn failed
+        :return: the locked session, or None if it was deleted, is locked or got messages meanwhile
+        """
+        locked = await self.message_store.start_turn(user_id=session.user, timeout=self.turn_timeout)
+        if locked is None:
+            return None
+        if locked["_id"] != session.id or locked.get("message_count", 0) > 0:
+            await self.message_store.cancel_turn(locked["_id"], locked["turn"]["id"])
+            return None
+        return await self.__load_turn__(locked)
+
+    async def __commit_turn__(self, session: GameSessionDto, messages: List[Optional[CreateMessageDto]]) -> int:
+        """
+        Add the messages of a turn to the game session in one atomic update and release the lock
+        :param session: session returned by __start_turn__
+        :param messages: messages of the turn. None values are skipped
+        :return: sequence number of the last message
+        """
+        documents = [message.to_dict() for message in messages if message is not None]
         try:
-            self.collection.update_one({"user": user_id}, {"$push": {"messages": message.to_dict()}})
+            committed = await self.message_store.commit_turn(
+                session_id=session.id,
+                turn_id=session.turn_id,
+                version=session.message_count,
+                messages=documents,
+            )
         except Exception as e:
+            # the messages of the turn were discarded, so the session can take the next turn
+            await self.message_store.cancel_turn(session.id, session.turn_id)
             raise HTTPException(status_code=500, detail=str(e))
+        if not committed:
+            raise HTTPException(status_code=409, detail="The session was changed by another request. Please try again.")
+        return session.message_count + len(documents) - 1
+
+    def __schedule_media__(self, session: GameSessionDto, seq: int, message: GameMessageWithSelections):
+        """
+        Render the audio and image of a saved reply in the background
+        :param session: session of the turn
+        :param seq: sequence number of the reply
+        :param message: parsed reply
+        :return:
+        """
+        if self.media_pipeline is not None:
+            self.media_pipeline.schedule(session.id, seq=seq, content=message.message)
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from utils.metrics import metrics
+from utils.mongo import AsyncMongoClient
+
+
+class IdempotencyStore:
+    """
+    Deduplicates retried requests that carry the same idempotency key.
+    Concurrent duplicates in the same process wait for the request that is in flight, and completed responses
+    are stored for the duration of the window, so that a retry gets the same response without calling the model again.
+    """
+
+    def __init__(self, client: AsyncMongoClient, window: float = 600):
+        """
+        :param client: mongo client
+        :param window: seconds during which a completed response is returned for the same key
+        """
+        self.collection: AsyncIOMotorCollection = client["gamebot"]["idempotency-keys"]
+        self.window = window
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.replayed = 0
+        self.coalesced = 0
+
+    async def create_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def run(self, user_id: str, key: str, handler: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Run the handler once per user and key
+        :param user_id: user id
+        :param key: idempotency key sent by the client
+        :param handler: produces the json serializable response. Failed requests are not stored
+        :return: the response of the first request with this key
+        """
+        document_id = f"{user_id}:{key}"
+        task = self.in_flight.get(document_id)
+        if task is None:
+            stored = await self.collection.find_one({"_id": document_id, "expires_at": {"$gt": datetime.utcnow()}})
+            if stored is not None:
+                self.replayed += 1
+                return stored["response"]
+            # check again, another duplicate may have started while the stored response was looked up
+            task = self.in_flight.get(document_id)
+        if task is None:
+            task = asyncio.create_task(self.__run_and_store__(document_id, handler))
+            self.in_flight[document_id] = task
+            task.add_done_callback(lambda done: self.__forget__(document_id, done))
+        else:
+            self.coalesced += 1
+        # the generation continues for the other duplicates if this request is cancelled
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """
+        Number of duplicates answered with a stored response, and of duplicates that waited for the first request
+        :return:
+        """
+        return {
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+        }
+
+    def __forget__(self, document_id: str, task: asyncio.Task):
+        self.in_flight.pop(document_id, None)
+        if not task.cancelled():
+            # mark the exception as retrieved, in case every waiting request was cancelled
+            task.exception()
+
+    async def __run_and_store__(self, document_id: str, handler: Callable[[], Awaitable[dict]]) -> dict:
+        response = await handler()
+        try:
+            await self.collection.update_one(
+                {"_id": document_id},
+                {"$set": {"response": response, "expires_at": datetime.utcnow() + timedelta(seconds=self.window)}},
+                upsert=True,
+            )
+        except Exception as e:
+            # the turn is already saved, so the response must reach the client. Only a later retry runs it again
+            logging.warning(f"Failed to store the response of the idempotency key {document_id}: {e}")
+            metrics.inc("background_errors_total", task="idempotency")
+        return response
@@ -0,0 +1,50 @@
+import io
+from typing import Dict
+
+from botocore.exceptions import ClientError
+
+
+class InMemoryS3:
+    """
+    The calls of the S3 client used by the MediaPipeline and the SessionArchiver, for the tests
+    """
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.puts = 0
+
+    def get(self):
+        return self
+
+    def head_object(self, Bucket: str, Key: str):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs):
+        self.puts += 1
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket: str, Key: str):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def delete_object(self, Bucket: str, Key: str):
+        self.objects.pop(Key, None)
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        self.uploads[Key] = {}
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes):
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        self.uploads.pop(UploadId)
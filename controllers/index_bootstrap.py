@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+
+class IndexBootstrap:
+    """
+    Creates the indexes of all controllers and stores. create_index does nothing for an index that already exists,
+    so this is safe to run on every start and from several processes at once.
+    """
+
+    def __init__(self, owners: List, max_delay: float = 60):
+        """
+        :param owners: objects with an async create_indexes method
+        :param max_delay: maximum seconds between two attempts when the database is unavailable
+        """
+        self.owners = owners
+        self.max_delay = max_delay
+        self.created = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def create_indexes(self):
+        for owner in self.owners:
+            await owner.create_indexes()
+        self.created = True
+
+    def start(self):
+        """
+        Create the indexes in the background, retrying until the database is available, so that a worker can start
+        and report that it isn't ready instead of crashing while the database is down
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.__run__())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def __run__(self):
+        delay = 1.0
+        while True:
+            try:
+                await self.create_indexes()
+                logging.info("Indexes created")
+                return
+            except Exception as e:
+                logging.warning(f"Failed to create the indexes, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
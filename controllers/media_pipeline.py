@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Set
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from starlette.concurrency import run_in_threadpool
+
+from providers.media_generator import MediaAsset, MediaGenerator
+from utils.metrics import metrics
+from utils.mongo import AsyncMongoClient
+from utils.s3 import LazyS3Client
+
+# S3 rejects parts smaller than this, except for the last part of an upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MediaPipeline:
+    """
+    Renders the audio and image of the replies in the background and fills the fields of the saved messages once
+    they are uploaded, so that the turn doesn't wait for them. Clients get them from GET /chat.
+    Objects are keyed by the hash of their content, so identical assets are stored once. Assets larger than a part
+    are uploaded with a multipart upload whose parts are sent concurrently.
+    """
+
+    def __init__(self, client: AsyncMongoClient, s3_client: LazyS3Client, bucket_name: str, public_url: str,
+                 generator: MediaGenerator, part_size: int = 8 * 1024 * 1024, max_concurrency: int = 4,
+                 known_keys_size: int = 10000):
+        """
+        :param client: mongo client
+        :param s3_client: s3 client
+        :param bucket_name: bucket of the assets
+        :param public_url: url under which the objects of the bucket are served
+        :param generator: renders the assets
+        :param part_size: bytes per part of a multipart upload. At least 5 MiB
+        :param max_concurrency: parts uploaded at the same time
+        :param known_keys_size: number of keys remembered as uploaded, so that duplicates skip the existence check
+        """
+        self.collection: AsyncIOMotorCollection = client["gamebot"]["game-messages"]
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.public_url = public_url.rstrip("/")
+        self.generator = generator
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max_concurrency
+        self.known_keys_size = known_keys_size
+        self.known_keys: OrderedDict[str, None] = OrderedDict()
+        self.background_tasks: Set[asyncio.Task] = set()
+        self.generated = 0
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def schedule(self, session_id: ObjectId, seq: int, content: str):
+        """
+        Render and upload the assets of a saved message in the background
+        :param session_id: session id
+        :param seq: sequence number of the message
+        :param content: narrative text of the message
+        :return:
+        """
+        task = asyncio.create_task(self.__process__(session_id, seq=seq, content=content))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def store(self, asset: MediaAsset) -> str:
+        """
+        Upload an asset unless an identical one is stored already
+        :param asset: asset
+        :return: public url of the object
+        """
+        key = f"media/{hashlib.sha256(asset.data).hexdigest()}.{asset.extension}"
+        if key in self.known_keys:
+            self.known_keys.move_to_end(key)
+            self.deduplicated += 1
+        elif await run_in_threadpool(self.__exists__, key):
+            self.__remember__(key)
+            self.deduplicated += 1
+        else:
+            await self.__upload__(key, asset)
+            self.__remember__(key)
+            self.uploaded += 1
+        return f"{self.public_url}/{key}"
+
+    def stats(self) -> dict:
+        """
+        Counters of the pipeline
+        :return:
+        """
+        return {
+            "generated": self.generated,
+            "uploaded": self.uploaded,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "pending": len(self.background_tasks),
+        }
+
+    async def close(self):
+        await self.generator.close()
+
+    async def __process__(self, session_id: ObjectId, seq: int, content: str):
+        try:
+            with metrics.span("media_generate"):
+                assets: List[MediaAsset] = await self.generator.generate(content)
+            self.generated += len(assets)
+            fields = {}
+            with metrics.span("media_upload"):
+                for asset in assets:
+                    fields[asset.kind] = await self.store(asset)
+            if len(fields) > 0:
+                await self.collection.update_one({"session": session_id, "seq": seq}, {"$set": fields})
+        except Exception as e:
+            self.failed += 1
+            logging.warning(f"Failed to create the media of message {seq} of session {session_id}: {e}")
+            metrics.inc("background_errors_total", task="media")
+
+    def __exists__(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.s3_client.get().head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def __upload__(self, key: str, asset: MediaAsset):
+        s3 = self.s3_client.get()
+        # stored under the hash of the content, so the object never changes
+        arguments = {"Bucket": self.bucket_name, "Key": key, "ContentType": asset.content_type,
+                     "CacheControl": "public, max-age=31536000, immutable"}
+        if len(asset.data) <= self.part_size:
+            await run_in_threadpool(s3.put_object, Body=asset.data, **arguments)
+            return
+
+        upload = await run_in_threadpool(s3.create_multipart_upload, **arguments)
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def upload_part(number: int, start: int) -> dict:
+            async with semaphore:
+                part = await run_in_threadpool(s3.upload_part, Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                                               PartNumber=number, Body=asset.data[start:start + self.part_size])
+            return {"PartNumber": number, "ETag": part["ETag"]}
+
+        try:
+            parts = await asyncio.gather(*[upload_part(index + 1, start) for index, start in
+                                           enumerate(range(0, len(asset.data), self.part_size))])
+            await run_in_threadpool(s3.complete_multipart_upload, Bucket=self.bucket_name, Key=key,
+                                    UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except Exception:
+            # parts of an unfinished upload are billed until the upload is aborted
+            await run_in_threadpool(s3.abort_multipart_upload, Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+            raise
+
+    def __remember__(self, key: str):
+        self.known_keys[key] = None
+        if len(self.known_keys) > self.known_keys_size:
+            self.known_keys.popitem(last=False)
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+from uuid import uuid4
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.mongo import AsyncMongoClient
+
+# Only the fields of the chat gpt format, so that the loaded messages can be sent to the model as they are
+CHAT_PROJECTION = {"_id": 0, "role": 1, "content": 1}
+
+
+class MessageStore:
+    """
+    Messages of the game sessions, stored as one document per message keyed by session id and sequence number.
+    The next sequence number of a session is the message_count field of its game-sessions document,
+    so appending or reading the last messages costs the same no matter how long the session is.
+    Messages are only part of the session once message_count covers them, so readers ignore the messages of turns
+    that are being committed or died while committing.
+    """
+
+    def __init__(self, client: AsyncMongoClient):
+        db = client["gamebot"]
+        self.collection: AsyncIOMotorCollection = db["game-messages"]
+        self.sessions: AsyncIOMotorCollection = db["game-sessions"]
+
+    async def create_indexes(self):
+        await self.collection.create_index([("session", 1), ("seq", 1)], unique=True)
+
+    async def start_turn(self, user_id: str, timeout: float) -> Optional[dict]:
+        """
+        Lock the session of a user for a turn, so that concurrent turns are rejected before calling the model.
+        The lock expires after the timeout in case the process handling the turn dies
+        :param user_id: user id
+        :param timeout: seconds until the lock expires
+        :return: the locked game-sessions document. None if there is no session or another turn is in flight
+        """
+        now = datetime.utcnow()
+        return await self.sessions.find_one_and_update(
+            {"user": user_id, "$or": [{"turn": None}, {"turn.expires_at": {"$lt": now}}]},
+            {"$set": {"turn": self.new_turn(timeout)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    def new_turn(timeout: float) -> dict:
+        """
+        Create the lock of a turn, e.g. to insert a session that is locked from the start
+        :param timeout: seconds until the lock expires
+        :return: the turn field of a game-sessions document
+        """
+        return {"id": uuid4().hex, "expires_at": datetime.utcnow() + timedelta(seconds=timeout)}
+
+    async def commit_turn(self, session_id: ObjectId, turn_id: str, version: int, messages: List[dict]) -> bool:
+        """
+        Append the messages of a turn and release the lock.
+        The messages are inserted first, the unique index on (session, seq) rejecting them if another turn took the
+        sequence numbers. They are then committed in one atomic update of the session, which only succeeds if the
+        turn still holds the lock and no message was added since the turn started. Otherwise they are removed again
+        :param session_id: session id
+        :param turn_id: id of the lock returned by start_turn
+        :param version: message_count of the session when the turn started
+        :param messages: messages to append
+        :return: False if the session was changed by another turn
+        """
+        documents = [{**message, "_id": ObjectId(), "session": session_id, "seq": version + index}
+                     for index, message in enumerate(messages)]
+        try:
+            if len(documents) > 0 and not await self.__insert__(session_id, turn_id, version, documents):
+                return False
+            result = await self.sessions.update_one(
+                {"_id": session_id, "turn.id": turn_id, "message_count": version},
+                {"$inc": {"message_count": len(documents)}, "$set": {"updated_at": datetime.utcnow()},
+                 # a failed opening turn no longer matters once the session has messages
+                 "$unset": {"turn": "", "opening_error": ""}},
+            )
+            committed = result.modified_count > 0
+        except Exception:
+            await self.__discard__(documents)
+            raise
+        if not committed:
+            await self.__discard__(documents)
+        return committed
+
+    async def cancel_turn(self, session_id: ObjectId, turn_id: str):
+        """
+        Release the lock of a turn without adding messages
+        :param session_id: session id
+        :param turn_id: id of the lock returned by start_turn
+        :return:
+        """
+        await self.sessions.update_one({"_id": session_id, "turn.id": turn_id}, {"$unset": {"turn": ""}})
+
+    async def find(self, session_id: ObjectId, start: int = 0, end: Optional[int] = None,
+                   projection: Optional[dict] = None) -> List[dict]:
+        """
+        Get the messages of a session, oldest first
+        :param session_id: session id
+        :param start: sequence number of the first message
+        :param end: sequence number after the last message, usually the message_count of the session
+        :param projection: fields to load. Defaults to all fields of the messages
+        :return:
+        """
+        query = {"session": session_id}
+        seq_range = {}
+        if start > 0:
+            seq_range["$gte"] = start
+        if end is not None:
+            seq_range["$lt"] = end
+        if len(seq_range) > 0:
+            query["seq"] = seq_range
+        if projection is None:
+            projection = {"_id": 0, "session": 0}
+        return await self.collection.find(query, projection=projection).sort("seq", 1).to_list(length=None)
+
+    async def find_page(self, session_id: ObjectId, limit: Optional[int] = None, before: Optional[int] = None,
+                        since: Optional[int] = None) -> List[dict]:
+        """
+        Get a page of the messages of a session, oldest first
+        :param session_id: session id
+        :param limit: maximum number of messages
+        :param before: only messages with a lower sequence number
+        :param since: only messages with a higher sequence number. With a limit, the page starts right after since,
+        otherwise it ends at the most recent matching message
+        :return:
+        """
+        query = {"session": session_id}
+        seq_range = {}
+        if before is not None:
+            seq_range["$lt"] = before
+        if since is not None:
+            seq_range["$gt"] = since
+        if len(seq_range) > 0:
+            query["seq"] = seq_range
+        # without since, the page is taken from the end of the history
+        newest_first = since is None and limit is not None
+        cursor = self.collection.find(query, projection={"_id": 0, "session": 0})
+        cursor = cursor.sort("seq", -1 if newest_first else 1)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        messages = await cursor.to_list(length=None)
+        if newest_first:
+            messages.reverse()
+        return messages
+
+    async def __insert__(self, session_id: ObjectId, turn_id: str, version: int, documents: List[dict]) -> bool:
+        """
+        Insert the messages of a turn before it is committed
+        :return: False if another turn took the sequence numbers
+        """
+        try:
+            await self.collection.insert_many(documents)
+            return True
+        except BulkWriteError:
+            # the sequence numbers are taken, either by a turn that committed or is committing, or by a turn that died
+            # between its two writes. Only the latter leaves the session unchanged and unlocked for another turn
+            if await self.sessions.find_one({"_id": session_id, "turn.id": turn_id, "message_count": version},
+                                            projection={"_id": 1}) is None:
+                await self.__discard__(documents)
+                return False
+        await self.collection.delete_many({"session": session_id, "seq": {"$gte": version}})
+        await self.collection.insert_many(documents)
+        return True
+
+    async def __discard__(self, documents: List[dict]):
+        if len(documents) > 0:
+            await self.collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+
+    async def delete(self, session_id: ObjectId):
+        await self.collection.delete_many({"session": session_id})
+
+    async def migrate(self, session: dict) -> dict:
+        """
+        Move the messages embedded in a game-sessions document to the messages collection.
+        Safe to run concurrently and multiple times.
+        :param session: game-sessions document
+        :return: the migrated document
+        """
+        while session is not None and session.get("messages") is not None:
+            legacy_messages = session["messages"]
+            # sessions that were migrated already and got messages pushed by an older version continue the sequence
+            first_seq = session.get("message_count", 0)
+            if len(legacy_messages) > 0:
+                await self.collection.bulk_write([
+                    UpdateOne({"session": session["_id"], "seq": first_seq + index},
+                              {"$setOnInsert": message}, upsert=True)
+                    for index, message in enumerate(legacy_messages)
+                ], ordered=False)
+            session = await self.sessions.find_one_and_update(
+                {"_id": session["_id"], "messages": {"$size": len(legacy_messages)}},
+                {"$set": {"message_count": first_seq + len(legacy_messages)}, "$unset": {"messages": ""}},
+                return_document=ReturnDocument.AFTER,
+            ) or await self.sessions.find_one({"_id": session["_id"]})
+        return session
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from controllers.admission_control import AdmissionControl
+from controllers.chat_completion import create_chat_completion
+from controllers.response_cache import request_key
+from models.message_models import CreateMessageDto, Role
+from models.prompt_models import GetPromptDto
+from providers.llm_provider import LLMProvider
+from utils.metrics import metrics
+
+
+def build_opening_messages(prompt: GetPromptDto) -> List[dict]:
+    """
+    Build the request of the opening turn of a prompt. It is the same for every new session, since the
+    first user message is sent without extra data
+    :param prompt: prompt with a first user message
+    :return: messages in the chat gpt format
+    """
+    system_message = CreateMessageDto(role=Role.SYSTEM, content=prompt.prompt, audio=None, image=None)
+    system_message.render(extra_data=None, cache=True)
+    user_message = CreateMessageDto(role=Role.USER, content=prompt.first_user_message, audio=None, image=None)
+    user_message.render(extra_data=None)
+    return [system_message.to_chat_gpt_dict(), user_message.to_chat_gpt_dict()]
+
+
+class OpeningPool:
+    """
+    Pre-generated replies to the opening turn, per prompt, so that new sessions can start without waiting for the
+    model. A prompt gets a pool once a session was created with it, and the pool is refilled in the background
+    whenever a reply is taken. Replies are keyed by the request they answer, so replies generated for an older
+    version of a prompt are never used.
+    """
+
+    def __init__(self, llm_provider: LLMProvider, default_model: str, size: int = 2,
+                 admission_control: Optional[AdmissionControl] = None):
+        """
+        :param llm_provider: language model backend
+        :param default_model: model used for prompts that don't set one
+        :param size: number of replies kept per prompt. 0 disables the pool
+        :param admission_control: limits the calls to the model. Refills are background work, skipped when the
+        model is busy and retried on the next take
+        """
+        self.llm_provider = llm_provider
+        self.admission_control = admission_control
+        self.default_model = default_model
+        self.size = size
+        # (request key, reply) per prompt name
+        self.pools: Dict[str, Deque[Tuple[str, str]]] = {}
+        self.filling: Dict[str, int] = {}
+        # incremented when a prompt is cleared, so that replies still being generated for it are discarded
+        self.generations: Dict[str, int] = {}
+        self.background_tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def take(self, prompt: GetPromptDto) -> Optional[str]:
+        """
+        Take a pre-generated reply to the opening turn of a prompt and start generating a new one
+        :param prompt: prompt with a first user message
+        :return: the reply, or None if none is ready
+        """
+        if self.size <= 0 or prompt.first_user_message is None:
+            return None
+        messages = build_opening_messages(prompt)
+        model = prompt.model or self.default_model
+        key = request_key(messages, model)
+        reply = None
+        pool = self.pools.setdefault(prompt.name, deque())
+        while len(pool) > 0:
+            reply_key, content = pool.popleft()
+            # replies for an older version of the prompt are dropped
+            if reply_key == key:
+                reply = content
+                break
+        self.__refill__(prompt.name, messages=messages, model=model, key=key)
+        if reply is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return reply
+
+    def clear(self, prompt_name: str):
+        """
+        Drop the replies of a prompt. Call it when the prompt is changed or deleted
+        :param prompt_name: prompt name
+        :return:
+        """
+        self.pools.pop(prompt_name, None)
+        self.generations[prompt_name] = self.generations.get(prompt_name, 0) + 1
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the pool
+        :return:
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "replies": sum(len(pool) for pool in self.pools.values()),
+            "generating": sum(self.filling.values()),
+        }
+
+    def __refill__(self, prompt_name: str, messages: List[dict], model: str, key: str):
+        missing = self.size - len(self.pools[prompt_name]) - self.filling.get(prompt_name, 0)
+        for _ in range(missing):
+            self.filling[prompt_name] = self.filling.get(prompt_name, 0) + 1
+            task = asyncio.create_task(self.__generate__(prompt_name, messages=messages, model=model, key=key,
+                                                         generation=self.generations.get(prompt_name, 0)))
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
+
+    async def __generate__(self, prompt_name: str, messages: List[dict], model: str, key: str, generation: int):
+        try:
+            content = await create_chat_completion(self.llm_provider, messages=messages, model=model,
+                                                   admission_control=self.admission_control, background=True)
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else repr(e)
+            logging.warning(f"Failed to generate an opening for {prompt_name}: {error}")
+            metrics.inc("background_errors_total", task="opening_pool")
+            return
+        finally:
+            self.filling[prompt_name] -= 1
+        if self.generations.get(prompt_name, 0) == generation:
+            self.pools.setdefault(prompt_name, deque()).append((key, content))
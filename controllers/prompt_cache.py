@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from models.prompt_models import GetPromptDto
+from utils.mongo import AsyncMongoClient
+
+
+class PromptCache:
+    """
+    In-process cache of all prompts, shared by the controllers.
+    Writes through the PromptController increment a version counter in the database. Each process checks the
+    counter at most once per refresh interval and reloads the prompts when it changed.
+    """
+
+    def __init__(self, client: AsyncMongoClient, refresh_interval: float = 1.0):
+        """
+        :param client: mongo client
+        :param refresh_interval: seconds between two checks of the version counter
+        """
+        db = client["gamebot"]
+        self.collection: AsyncIOMotorCollection = db["prompts"]
+        self.versions: AsyncIOMotorCollection = db["versions"]
+        self.refresh_interval = refresh_interval
+        self.version: Optional[int] = None
+        self._prompts: Optional[Dict[str, GetPromptDto]] = None
+        self._checked_at = 0.0
+        # incremented on every local invalidation, so that a reload started before it is discarded
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.reloads = 0
+
+    async def get(self, name: str) -> Optional[GetPromptDto]:
+        """
+        Get a prompt by name
+        :param name: prompt name
+        :return: prompt or None if it doesn't exist
+        """
+        prompts = await self.__get_prompts__()
+        return prompts.get(name)
+
+    async def list(self) -> List[GetPromptDto]:
+        """
+        Get all prompts
+        :return:
+        """
+        prompts = await self.__get_prompts__()
+        return list(prompts.values())
+
+    async def invalidate(self):
+        """
+        Drop the cached prompts and increment the version counter, so that the other processes reload them as well.
+        Call it after every write to the prompts collection
+        :return:
+        """
+        self._generation += 1
+        self._prompts = None
+        await self.versions.update_one({"_id": "prompts"}, {"$inc": {"version": 1}}, upsert=True)
+
+    def stats(self) -> dict:
+        """
+        Hit and reload counters of the cache
+        :return:
+        """
+        return {
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "version": self.version if self.version is not None else -1,
+        }
+
+    async def __get_prompts__(self) -> Dict[str, GetPromptDto]:
+        prompts = self._prompts
+        if prompts is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            self.hits += 1
+            return prompts
+        async with self._lock:
+            if self._prompts is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+                return self._prompts
+            generation = self._generation
+            version_document = await self.versions.find_one({"_id": "prompts"})
+            version = version_document["version"] if version_document is not None else 0
+            prompts = self._prompts
+            if prompts is None or version != self.version:
+                documents = await self.collection.find().to_list(length=None)
+                self.reloads += 1
+                prompts = {document["name"]: GetPromptDto.from_dict(document) for document in documents}
+            if generation == self._generation:
+                self._prompts = prompts
+                self.version = version
+                self._checked_at = time.monotonic()
+            return prompts
@@ -1,27 +1,39 @@
+import hashlib
+from typing import Dict, List, Optional
+
 from fastapi import HTTPException
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
 
 from controllers.controller import Controller
-from models.prompt_models import CreatePromptDto, GetPromptDto, UpdatePromptDto, ListPromptDto
+from controllers.opening_pool import OpeningPool
+from controllers.prompt_cache import PromptCache
+from models.prompt_models import CreatePromptDto, UpdatePromptDto, ListPromptDto
+from utils.mongo import AsyncMongoClient
+from utils.template_cache import template_cache
 
 
 class PromptController(Controller):
-    def __init__(self, client: MongoClient):
+    def __init__(self, client: AsyncMongoClient, prompt_cache: PromptCache, opening_pool: Optional[OpeningPool] = None):
         super().__init__(client=client)
-        self.collection: Collection = self.db["prompts"]
-        self.collection.create_index("name", unique=True)
+        self.collection: AsyncIOMotorCollection = self.db["prompts"]
+        self.prompt_cache = prompt_cache
+        self.opening_pool = opening_pool
+
+    async def create_indexes(self):
+        await self.collection.create_index("name", unique=True)
 
-    def add_new_prompt(self, prompt: CreatePromptDto):
+    async def add_new_prompt(self, prompt: CreatePromptDto):
         """
         Add a new prompt
         :param prompt: prompt to add
         :return:
         """
         try:
-            data = self.collection.insert_one(prompt.to_dict())
+            data = await self.collection.insert_one(prompt.to_dict())
             if data is None:
                 raise HTTPException(status_code=500, detail="Failed to add prompt")
+            await self.prompt_cache.invalidate()
             return {"message": "Prompt added successfully"}
 
         except Exception as e:
@@ -29,35 +41,69 @@ class PromptController(Controller):
                 raise HTTPException(status_code=400, detail="Prompt already exists")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def get_prompt(self, prompt_name: str):
+    async def get_prompt(self, prompt_name: str):
         """
         Get a prompt
         :param prompt_name: prompt name
         :return:
         """
-        prompt = self.collection.find_one({"name": prompt_name})
+        prompt = await self.prompt_cache.get(prompt_name)
         if prompt is None:
             raise HTTPException(status_code=404, detail="Prompt not found")
-        return GetPromptDto.from_dict(prompt)
+        return prompt
 
-    def get_all_prompts(self):
+    async def get_all_prompts(self):
         """
         Get all prompts
         :return:
         """
-        prompts = self.collection.find()
-        if prompts is None:
-            return HTTPException(status_code=404, detail="No prompts found")
-        return ListPromptDto.from_list(prompts)
+        prompts = await self.prompt_cache.list()
+        return [ListPromptDto(name=prompt.name) for prompt in prompts]
 
-    def update_prompt(self, prompt_name: str, prompt: UpdatePromptDto):
+    async def update_prompt(self, prompt_name: str, prompt: UpdatePromptDto):
         data = prompt.to_dict()
-        updated_result = self.collection.update_one({"name": prompt_name}, {"$set": data})
+        updated_result = await self.collection.update_one({"name": prompt_name}, {"$set": data})
         if updated_result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Prompt not found")
+        await self.prompt_cache.invalidate()
+        if self.opening_pool is not None:
+            self.opening_pool.clear(prompt_name)
+            if prompt.name is not None:
+                self.opening_pool.clear(prompt.name)
         return {"message": "Prompt updated successfully"}
 
-    def delete_prompt(self, prompt_name: str):
-        self.collection.delete_one({"name": prompt_name})
+    async def delete_prompt(self, prompt_name: str):
+        await self.collection.delete_one({"name": prompt_name})
+        await self.prompt_cache.invalidate()
+        if self.opening_pool is not None:
+            self.opening_pool.clear(prompt_name)
         return {"message": "Prompt deleted successfully"}
 
+    async def sync_prompts(self, prompts: Dict[str, str]) -> List[str]:
+        """
+        Insert or update prompts in a single bulk write, e.g. from the files of the prompts directory.
+        Prompts whose content didn't change since their last sync are skipped. Only the prompt text is written,
+        so the other fields set through the api are kept
+        :param prompts: prompt text by prompt name
+        :return: names of the prompts that were written
+        """
+        hashes = {name: hashlib.sha256(content.encode("utf-8")).hexdigest() for name, content in prompts.items()}
+        stored = await self.collection.find({"name": {"$in": list(prompts)}},
+                                            projection={"_id": 0, "name": 1, "source_hash": 1}).to_list(length=None)
+        stored_hashes = {document["name"]: document.get("source_hash") for document in stored}
+        changed = [name for name in prompts if stored_hashes.get(name) != hashes[name]]
+        if len(changed) == 0:
+            return changed
+        # the previous versions, whose compiled templates are dropped once they are replaced
+        previous = [await self.prompt_cache.get(name) for name in changed]
+        await self.collection.bulk_write([
+            UpdateOne({"name": name}, {"$set": {"prompt": prompts[name], "source_hash": hashes[name]}}, upsert=True)
+            for name in changed
+        ], ordered=False)
+        await self.prompt_cache.invalidate()
+        for name, prompt in zip(changed, previous):
+            if self.opening_pool is not None:
+                self.opening_pool.clear(name)
+            if prompt is not None:
+                template_cache.discard(prompt.prompt)
+        return changed
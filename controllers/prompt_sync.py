@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from controllers.prompt_controller import PromptController
+from utils.metrics import metrics
+
+
+def read_prompt_files(directory: Path) -> Dict[str, str]:
+    """
+    Read the prompts of a directory: one markdown file per prompt, named after the file without the extension
+    :param directory: directory of the prompts
+    :return: prompt text by prompt name
+    """
+    return {path.stem: path.read_text(encoding="utf-8") for path in sorted(directory.glob("*.md"))}
+
+
+class PromptSync:
+    """
+    Keeps the prompts in the database in sync with the markdown files of a directory, once or by watching the
+    directory. Deleting a file doesn't delete the prompt, since sessions may still use it.
+    """
+
+    def __init__(self, prompt_controller: PromptController, directory: Path):
+        """
+        :param prompt_controller: writes the prompts and invalidates their cached copies
+        :param directory: directory of the prompts
+        """
+        self.prompt_controller = prompt_controller
+        self.directory = directory
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event: Optional[asyncio.Event] = None
+
+    async def sync(self) -> List[str]:
+        """
+        Write the prompts whose file changed since the last sync
+        :return: names of the prompts that were written
+        """
+        prompts = await run_in_threadpool(read_prompt_files, self.directory)
+        changed = await self.prompt_controller.sync_prompts(prompts)
+        if len(changed) > 0:
+            logging.info(f"Synced prompts: {', '.join(changed)}")
+        return changed
+
+    async def watch(self, stop_event: Optional[asyncio.Event] = None):
+        """
+        Sync the prompts whenever a file of the directory changes
+        :param stop_event: stops watching once set. Without it, runs until cancelled
+        :return:
+        """
+        # watchfiles comes with uvicorn[standard]
+        from watchfiles import awatch
+
+        async for changes in awatch(self.directory, stop_event=stop_event):
+            if any(path.endswith(".md") for _, path in changes):
+                await self.__sync_logged__()
+
+    def start(self, watch: bool = False):
+        """
+        Sync the prompts in the background, and keep watching the directory if enabled
+        :param watch: push the changes of the files as they are saved
+        :return:
+        """
+        if self._task is None:
+            self._stop_event = asyncio.Event()
+            self._task = asyncio.create_task(self.__run__(watch, self._stop_event))
+
+    async def stop(self):
+        if self._task is not None:
+            # the watcher is stopped through its stop event and exits within its polling step. Cancelling it while
+            # it waits for changes fails in watchfiles
+            self._stop_event.set()
+            task, self._task = self._task, None
+            await task
+
+    async def __run__(self, watch: bool, stop_event: asyncio.Event):
+        await self.__sync_logged__()
+        if watch and not stop_event.is_set():
+            try:
+                await self.watch(stop_event=stop_event)
+            except Exception as e:
+                logging.warning(f"Stopped watching {self.directory}: {e}")
+                metrics.inc("background_errors_total", task="prompt_sync")
+
+    async def __sync_logged__(self):
+        try:
+            await self.sync()
+        except Exception as e:
+            logging.warning(f"Failed to sync the prompts of {self.directory}: {e}")
+            metrics.inc("background_errors_total", task="prompt_sync")
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from utils.metrics import metrics
+from utils.mongo import AsyncMongoClient
+
+
+def request_key(messages: List[dict], model: str) -> str:
+    """
+    Key of a chat completion request. Requests with the same model and messages get the same key
+    :param messages: messages in the chat gpt format
+    :param model: model name
+    :return:
+    """
+    return hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Replies of the model by request, for the prompts that enable cache_responses.
+    A size-bounded LRU in process, optionally backed by a collection shared by all processes, whose documents are
+    removed by a TTL index.
+    """
+
+    def __init__(self, client: AsyncMongoClient, max_size: int = 1000, ttl: float = 86400, shared: bool = False):
+        """
+        :param client: mongo client
+        :param max_size: number of replies kept in process. 0 disables the cache
+        :param ttl: seconds during which a reply is reused
+        :param shared: also store the replies in the database, so that the other processes can reuse them
+        """
+        self.collection: AsyncIOMotorCollection = client["gamebot"]["response-cache"]
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        # key -> (reply, expiry on the monotonic clock)
+        self._entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    async def create_indexes(self):
+        if self.shared:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get the cached reply of a request
+        :param key: see request_key
+        :return: the reply, or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+        if self.shared:
+            # the TTL monitor only runs once a minute, so expired documents are filtered out here
+            try:
+                document = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+            except Exception as e:
+                # the turn calls the model instead
+                logging.warning(f"Failed to read the response cache: {e}")
+                metrics.inc("background_errors_total", task="response_cache")
+                document = None
+            if document is not None:
+                remaining = (document["expires_at"] - datetime.utcnow()).total_seconds()
+                self.__put_local__(key, document["content"], remaining)
+                self.shared_hits += 1
+                return document["content"]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, content: str):
+        """
+        Cache the reply of a request
+        :param key: see request_key
+        :param content: reply of the model
+        :return:
+        """
+        self.__put_local__(key, content, self.ttl)
+        if self.shared:
+            try:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {"$set": {"content": content, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+                    upsert=True,
+                )
+            except Exception as e:
+                logging.warning(f"Failed to write the response cache: {e}")
+                metrics.inc("background_errors_total", task="response_cache")
+
+    def stats(self) -> dict:
+        """
+        Hit counters of the cache
+        :return:
+        """
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups > 0 else 0.0,
+            "size": len(self._entries),
+        }
+
+    def __put_local__(self, key: str, content: str, ttl: float):
+        self._entries[key] = (content, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from utils.mongo import AsyncMongoClient
+from utils.token_cache import TokenCache, hash_token
+
+# Revocations are loaded again for this long, in case of clock skew between the processes
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class RevokedTokenStore:
+    """
+    Revoked tokens, shared by all processes through the database.
+    A revocation applies immediately in the process that made it, and in the other processes after at most
+    one refresh interval, when they load the new revocations into their token cache.
+    """
+
+    def __init__(self, client: AsyncMongoClient, token_cache: TokenCache, refresh_interval: float = 5):
+        """
+        :param client: mongo client
+        :param token_cache: token cache used by the JWTBearer
+        :param refresh_interval: seconds between two loads of the revocations of the other processes
+        """
+        self.collection: AsyncIOMotorCollection = client["gamebot"]["revoked-tokens"]
+        self.token_cache = token_cache
+        self.refresh_interval = refresh_interval
+        self._synced_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def create_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("revoked_at")
+
+    async def revoke(self, token: str, payload: dict):
+        """
+        Revoke a token until it expires
+        :param token: jwt token
+        :param payload: decoded payload of the token
+        :return:
+        """
+        token_hash = hash_token(token)
+        expires_at = payload.get("exp")
+        self.token_cache.revoke(token_hash, expires_at)
+        document = {"revoked_at": datetime.utcnow()}
+        if expires_at is not None:
+            document["expires_at"] = datetime.utcfromtimestamp(expires_at)
+        await self.collection.update_one({"_id": token_hash}, {"$set": document}, upsert=True)
+
+    async def refresh(self):
+        """
+        Load the revocations made since the last refresh into the token cache
+        :return:
+        """
+        query = {} if self._synced_at is None else {"revoked_at": {"$gte": self._synced_at - SYNC_OVERLAP}}
+        synced_at = datetime.utcnow()
+        async for document in self.collection.find(query):
+            expires_at = document.get("expires_at")
+            self.token_cache.revoke(document["_id"], expires_at.replace(tzinfo=timezone.utc).timestamp()
+                                    if expires_at is not None else None)
+        self._synced_at = synced_at
+        self.token_cache.prune()
+
+    def start(self):
+        """
+        Refresh the revocations periodically in the background
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self.__run__())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def __run__(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.warning(f"Failed to load the revoked tokens: {e}")
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,247 @@
+import asyncio
+import gzip
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from uuid import uuid4
+
+from bson import json_util
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from controllers.message_store import MessageStore
+from utils.metrics import metrics
+from utils.mongo import AsyncMongoClient
+from utils.s3 import LazyS3Client
+
+
+class SessionArchiver:
+    """
+    Moves idle game sessions and their messages to gzipped json objects in S3, and brings them back when their user
+    returns. An archived session leaves a pointer document keyed by user id, so that a miss on game-sessions costs a
+    single lookup by id.
+    A session is claimed with the lock of a turn before it is archived, so that several processes can run the
+    archiver and no turn changes the session while it is archived. Its messages are deleted before the session, so
+    that a session that can be brought back never has messages left in the database.
+    """
+
+    def __init__(self, client: AsyncMongoClient, s3_client: LazyS3Client, bucket_name: str, archive_after: float = 0,
+                 batch_size: int = 100, rate: float = 10, interval: float = 300, prefix: str = "archives/sessions",
+                 claim_timeout: float = 300):
+        """
+        :param client: mongo client
+        :param s3_client: s3 client
+        :param bucket_name: bucket of the archives
+        :param archive_after: seconds without a turn after which a session is archived. 0 disables the archiving,
+        archived sessions are still brought back
+        :param batch_size: sessions archived per run
+        :param rate: maximum number of sessions archived per second
+        :param interval: seconds between two runs, unless the previous run found a full batch
+        :param prefix: prefix of the object keys
+        :param claim_timeout: seconds after which the claim of a process that died while archiving a session expires.
+        Turns get a 409 while a session is claimed
+        """
+        db = client["gamebot"]
+        self.sessions: AsyncIOMotorCollection = db["game-sessions"]
+        self.pointers: AsyncIOMotorCollection = db["archived-sessions"]
+        self.message_store = MessageStore(client=client)
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.rate = rate
+        self.interval = interval
+        self.prefix = prefix.rstrip("/")
+        self.claim_timeout = claim_timeout
+        self.rehydrating: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.rehydrated = 0
+        self.failed = 0
+
+    async def create_indexes(self):
+        await self.sessions.create_index("updated_at")
+
+    async def archive_batch(self) -> int:
+        """
+        Archive up to a batch of idle sessions, at most rate sessions per second
+        :return: number of sessions archived
+        """
+        archived = 0
+        for _ in range(self.batch_size):
+            started = asyncio.get_running_loop().time()
+            claim_id = uuid4().hex
+            session = await self.__claim__(claim_id)
+            if session is None:
+                break
+            try:
+                if await self.__archive__(session, claim_id):
+                    archived += 1
+                    self.archived += 1
+            except Exception as e:
+                self.failed += 1
+                logging.warning(f"Failed to archive the session of {session['user']}: {e!r}")
+                metrics.inc("background_errors_total", task="session_archiver")
+                await self.message_store.cancel_turn(session["_id"], claim_id)
+            await asyncio.sleep(max(0.0, 1 / self.rate - (asyncio.get_running_loop().time() - started)))
+        return archived
+
+    async def rehydrate(self, user_id: str) -> bool:
+        """
+        Bring the archived session of a user back. Concurrent calls for the same user share the same restore
+        :param user_id: user id
+        :return: False if the user has no archived session
+        """
+        task = self.rehydrating.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self.__rehydrate__(user_id))
+            self.rehydrating[user_id] = task
+            task.add_done_callback(lambda done: self.rehydrating.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def discard(self, user_id: str):
+        """
+        Delete the archived session of a user, e.g. when the user deletes the session or starts a new one
+        :param user_id: user id
+        :return:
+        """
+        pointer = await self.pointers.find_one_and_delete({"_id": user_id})
+        if pointer is not None:
+            await self.__delete_object__(pointer["key"])
+
+    def stats(self) -> dict:
+        """
+        Counters of the archiver
+        :return:
+        """
+        return {
+            "archived": self.archived,
+            "rehydrated": self.rehydrated,
+            "failed": self.failed,
+        }
+
+    def start(self):
+        """
+        Archive the idle sessions periodically in the background
+        :return:
+        """
+        if self._task is None and self.archive_after > 0:
+            self._task = asyncio.create_task(self.__run__())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def __run__(self):
+        while True:
+            archived = 0
+            try:
+                archived = await self.archive_batch()
+            except Exception as e:
+                logging.warning(f"Failed to archive the idle sessions: {e}")
+                metrics.inc("background_errors_total", task="session_archiver")
+            if archived < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+    async def __claim__(self, claim_id: str) -> Optional[dict]:
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.archive_after)
+        return await self.sessions.find_one_and_update(
+            {"$and": [
+                {"$or": [{"turn": None}, {"turn.expires_at": {"$lt": now}}]},
+                # created_at for the sessions created before updated_at was recorded
+                {"$or": [{"updated_at": {"$lt": cutoff}}, {"updated_at": None, "created_at": {"$lt": cutoff}}]},
+            ]},
+            {"$set": {"turn": {"id": claim_id, "expires_at": now + timedelta(seconds=self.claim_timeout)}}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def __archive__(self, session: dict, claim_id: str) -> bool:
+        messages = await self.message_store.find(session["_id"], end=session.get("message_count", 0),
+                                                 projection={"_id": 0})
+        key = f"{self.prefix}/{session['_id']}.json.gz"
+        archived_session = {field: value for field, value in session.items() if field != "turn"}
+        body = await run_in_threadpool(self.__compress__, {"session": archived_session, "messages": messages})
+        await run_in_threadpool(self.s3_client.get().put_object, Bucket=self.bucket_name, Key=key, Body=body,
+                                ContentType="application/gzip")
+        await self.pointers.replace_one({"_id": session["user"]}, {
+            "key": key,
+            "claim_id": claim_id,
+            "session": session["_id"],
+            "message_count": session.get("message_count", 0),
+            "archived_at": datetime.utcnow(),
+        }, upsert=True)
+        # the claim expires if archiving takes too long, and a turn may have locked the session since
+        if await self.sessions.find_one({"_id": session["_id"], "turn.id": claim_id}, projection={"_id": 1}) is None:
+            await self.__abort__(session, claim_id, key)
+            return False
+        await self.message_store.delete(session["_id"])
+        deleted = await self.sessions.delete_one({"_id": session["_id"], "turn.id": claim_id})
+        if deleted.deleted_count == 0:
+            # the claim expired while the messages were deleted, so the session stays and gets them back
+            if len(messages) > 0:
+                try:
+                    await self.message_store.collection.insert_many(messages, ordered=False)
+                except BulkWriteError:
+                    pass
+            await self.__abort__(session, claim_id, key)
+            return False
+        return True
+
+    async def __abort__(self, session: dict, claim_id: str, key: str):
+        await self.pointers.delete_one({"_id": session["user"], "claim_id": claim_id})
+        await self.message_store.cancel_turn(session["_id"], claim_id)
+        await self.__delete_object__(key)
+
+    async def __rehydrate__(self, user_id: str) -> bool:
+        pointer = await self.pointers.find_one({"_id": user_id})
+        if pointer is None:
+            return False
+        if await self.sessions.find_one({"user": user_id}, projection={"_id": 1}) is not None:
+            # the session is still being archived, or another process restored it. The archiver deletes or keeps
+            # the pointer and the object once it is done, so they must stay until then
+            return True
+        with metrics.span("rehydrate"):
+            try:
+                response = await run_in_threadpool(self.s3_client.get().get_object, Bucket=self.bucket_name,
+                                                   Key=pointer["key"])
+            except Exception:
+                # another process may have restored the session and deleted the object in the meantime
+                if await self.sessions.find_one({"user": user_id}, projection={"_id": 1}) is not None:
+                    return True
+                raise
+            archive = await run_in_threadpool(self.__decompress__, response["Body"])
+            session = archive["session"]
+            session["updated_at"] = datetime.utcnow()
+            if len(archive["messages"]) > 0:
+                try:
+                    await self.message_store.collection.insert_many(archive["messages"], ordered=False)
+                except BulkWriteError:
+                    # messages restored by an earlier attempt that didn't finish
+                    pass
+            try:
+                await self.sessions.insert_one(session)
+            except DuplicateKeyError:
+                pass
+            await self.pointers.delete_one({"_id": user_id, "claim_id": pointer["claim_id"]})
+        await self.__delete_object__(pointer["key"])
+        self.rehydrated += 1
+        return True
+
+    async def __delete_object__(self, key: str):
+        try:
+            await run_in_threadpool(self.s3_client.get().delete_object, Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            # the pointer is gone, so the object is only an orphan
+            logging.warning(f"Failed to delete the archive {key}: {e}")
+
+    @staticmethod
+    def __compress__(archive: dict) -> bytes:
+        return gzip.compress(json_util.dumps(archive).encode("utf-8"))
+
+    @staticmethod
+    def __decompress__(body) -> dict:
+        return json_util.loads(gzip.decompress(body.read()).decode("utf-8"))
@@ -0,0 +1,82 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi import HTTPException
+
+from controllers.admission_control import AdmissionControl
+
+
+class TestAdmissionControl(IsolatedAsyncioTestCase):
+    async def test_queues_in_order(self):
+        admission = AdmissionControl(max_concurrency=1, max_queue=2)
+        order = []
+
+        async def call(name: str):
+            async with admission.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(call("a"), call("b"), call("c"))
+        self.assertEqual(order, ["a", "b", "c"])
+        stats = admission.stats()
+        self.assertEqual((stats["in_flight"], stats["queue_depth"], stats["queued"]), (0, 0, 2))
+
+    async def test_sheds_when_the_queue_is_full(self):
+        admission = AdmissionControl(max_concurrency=1, max_queue=1)
+        await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as context:
+            await admission.acquire()
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("Retry-After", context.exception.headers)
+        admission.release()
+        await waiting
+        admission.release()
+        self.assertEqual(admission.stats()["in_flight"], 0)
+
+    async def test_queue_timeout(self):
+        admission = AdmissionControl(max_concurrency=1, queue_timeout=0.01)
+        await admission.acquire()
+        with self.assertRaises(HTTPException) as context:
+            await admission.acquire()
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(admission.stats()["queue_depth"], 0)
+        admission.release()
+        self.assertEqual(admission.stats()["in_flight"], 0)
+
+    async def test_cancelled_waiter_gives_up_its_place(self):
+        admission = AdmissionControl(max_concurrency=1)
+        await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        admission.release()
+        stats = admission.stats()
+        self.assertEqual((stats["in_flight"], stats["queue_depth"]), (0, 0))
+
+    async def test_background_work_has_a_lower_priority(self):
+        admission = AdmissionControl(max_concurrency=2, max_background=1)
+        await admission.acquire(background=True)
+        with self.assertRaises(HTTPException):
+            await admission.acquire(background=True)
+        await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        # the slot of the background work goes to the waiting request
+        admission.release(background=True)
+        await waiting
+        stats = admission.stats()
+        self.assertEqual((stats["in_flight"], stats["background_in_flight"], stats["rejected_background"]), (2, 0, 1))
+
+    def test_user_token_bucket(self):
+        admission = AdmissionControl(user_rate=0.5, user_burst=2)
+        admission.admit_user("a")
+        admission.admit_user("a")
+        with self.assertRaises(HTTPException) as context:
+            admission.admit_user("a")
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(context.exception.headers["Retry-After"], "2")
+        # other users have their own bucket
+        admission.admit_user("b")
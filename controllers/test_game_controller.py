@@ -0,0 +1,171 @@
+import asyncio
+from datetime import datetime
+from typing import List
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from fastapi import HTTPException
+
+from controllers.admission_control import AdmissionControl
+from controllers.game_controller import GameController
+from controllers.idempotency_store import IdempotencyStore
+from controllers.prompt_cache import PromptCache
+from models.session_models import CreateGameSessionDto
+from providers.llm_provider import LLMProviderError
+from providers.stub_provider import StubProvider
+from utils.mongo import ThreadedMongoClient
+
+
+class TestGameController(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+        self.sessions = self.client.delegate["gamebot"]["game-sessions"]
+        self.messages = self.client.delegate["gamebot"]["game-messages"]
+        self.client.delegate["gamebot"]["prompts"].insert_one(
+            {"name": "game", "prompt": "You are a game", "first_user_message": "start"})
+        self.controller = GameController(client=self.client, prompt_cache=PromptCache(client=self.client),
+                                         idempotency_store=IdempotencyStore(client=self.client, window=60),
+                                         llm_provider=StubProvider(), default_model="model",
+                                         context_message_limit=4)
+        await self.controller.create_indexes()
+        self.requests: List[list] = []
+        create_chat_completion = self.controller.__create_chat_completion__
+
+        async def record(messages: list, model: str, background: bool = False) -> str:
+            self.requests.append(messages)
+            return await create_chat_completion(messages=messages, model=model, background=background)
+
+        self.controller.__create_chat_completion__ = record
+
+    def fail_completions(self):
+        async def complete(**kwargs):
+            raise LLMProviderError("The model is down")
+
+        self.controller.llm_provider.complete = complete
+
+    def insert_session(self, message_count: int, **fields) -> ObjectId:
+        session_id = ObjectId()
+        self.sessions.insert_one({"_id": session_id, "user": "user", "prompt_name": "game",
+                                  "message_count": message_count, "created_at": datetime.now(),
+                                  "updated_at": datetime.utcnow(), **fields})
+        if message_count > 0:
+            self.messages.insert_many([
+                {"session": session_id, "seq": seq, "role": "user" if seq % 2 else "assistant",
+                 "content": f"message {seq}"}
+                for seq in range(message_count)
+            ])
+        return session_id
+
+    async def test_lagging_summary_stays_contiguous(self):
+        # the summary was skipped while more than context_message_limit messages were added
+        self.insert_session(10, summary={"content": "The story so far", "until": 2})
+
+        await self.controller.chat("user", message="look around")
+        await asyncio.gather(*self.controller.background_tasks)
+
+        transcript = self.requests[-1][-1]["content"]
+        self.assertIn("The story so far", transcript)
+        self.assertIn("message 2", transcript)
+        self.assertIn("message 5", transcript)
+        self.assertNotIn("message 1", transcript)
+        self.assertNotIn("message 6", transcript)
+        self.assertEqual(self.sessions.find_one({"user": "user"})["summary"]["until"], 6)
+
+    async def test_first_summary_starts_at_the_first_message(self):
+        self.insert_session(10)
+
+        await self.controller.chat("user", message="look around")
+        await asyncio.gather(*self.controller.background_tasks)
+
+        transcript = self.requests[-1][-1]["content"]
+        self.assertIn("message 0", transcript)
+        self.assertEqual(self.sessions.find_one({"user": "user"})["summary"]["until"], 4)
+
+    async def test_concurrent_turn_gets_409(self):
+        self.insert_session(2)
+        self.controller.llm_provider.latency = 0.05
+
+        results = await asyncio.gather(self.controller.chat("user", message="go left"),
+                                       self.controller.chat("user", message="go right"), return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, HTTPException)]
+        self.assertEqual([error.status_code for error in errors], [409])
+        self.assertEqual(self.sessions.find_one({"user": "user"})["message_count"], 4)
+
+    async def test_failed_completion_cancels_the_turn(self):
+        self.insert_session(2)
+        self.fail_completions()
+
+        with self.assertRaises(HTTPException) as context:
+            await self.controller.chat("user", message="look around")
+        self.assertEqual(context.exception.status_code, 502)
+        session = self.sessions.find_one({"user": "user"})
+        self.assertNotIn("turn", session)
+        self.assertEqual(session["message_count"], 2)
+
+    async def test_failed_commit_cancels_the_turn(self):
+        self.insert_session(2)
+
+        async def commit_turn(**kwargs):
+            raise ConnectionError("The database is down")
+
+        self.controller.message_store.commit_turn = commit_turn
+        with self.assertRaises(HTTPException) as context:
+            await self.controller.chat("user", message="look around")
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertNotIn("turn", self.sessions.find_one({"user": "user"}))
+
+    async def test_failed_opening_turn_records_the_error(self):
+        self.fail_completions()
+
+        with patch("controllers.game_controller.OPENING_RETRY_DELAY", 0), self.assertLogs(level="WARNING") as logs:
+            await self.controller.create_new_game_session("user", CreateGameSessionDto(prompt_name="game"))
+            await asyncio.gather(*self.controller.background_tasks)
+        self.assertEqual(len(logs.records), 3)
+
+        session = self.sessions.find_one({"user": "user"})
+        self.assertNotIn("turn", session)
+        self.assertEqual(session["message_count"], 0)
+        self.assertIn("The model is down", session["opening_error"])
+        self.assertIn("The model is down", (await self.controller.get_history("user"))["opening_error"])
+
+        # the client asks for the opening turn again
+        del self.controller.llm_provider.complete
+        await self.controller.chat("user")
+        session = self.sessions.find_one({"user": "user"})
+        self.assertEqual(session["message_count"], 2)
+        self.assertNotIn("opening_error", session)
+        self.assertEqual(self.messages.find_one({"session": session["_id"], "seq": 0})["content"], "start")
+
+    async def test_stream_saves_the_turn_before_done(self):
+        self.insert_session(2)
+        self.controller.admission_control = AdmissionControl(max_concurrency=1)
+
+        events = await self.controller.chat_stream("user", message="look around")
+        self.assertEqual(self.controller.admission_control.in_flight, 1)
+        names = []
+        async for event, _ in events:
+            names.append(event)
+            if event == "done":
+                session = self.sessions.find_one({"user": "user"})
+                self.assertEqual(session["message_count"], 4)
+                self.assertNotIn("turn", session)
+                self.assertEqual(self.messages.count_documents({"session": session["_id"]}), 4)
+        self.assertEqual(names[-1], "done")
+        self.assertIn("selection", names)
+        self.assertEqual(self.controller.admission_control.in_flight, 0)
+
+    async def test_disconnected_stream_releases_the_slot(self):
+        self.insert_session(2)
+        self.controller.admission_control = AdmissionControl(max_concurrency=1)
+
+        events = await self.controller.chat_stream("user", message="look around")
+        await events.__anext__()
+        await events.aclose()
+
+        self.assertEqual(self.controller.admission_control.in_flight, 0)
+        session = self.sessions.find_one({"user": "user"})
+        self.assertNotIn("turn", session)
+        self.assertEqual(session["message_count"], 2)
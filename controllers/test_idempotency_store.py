@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+
+from controllers.idempotency_store import IdempotencyStore
+from utils.mongo import ThreadedMongoClient
+
+
+class TestIdempotencyStore(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+        self.store = IdempotencyStore(client=self.client, window=60)
+        self.calls = 0
+
+    async def handler(self) -> dict:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"message": f"reply {self.calls}"}
+
+    async def test_coalesces_concurrent_duplicates(self):
+        responses = await asyncio.gather(self.store.run("user", "key", self.handler),
+                                         self.store.run("user", "key", self.handler))
+        self.assertEqual(responses, [{"message": "reply 1"}, {"message": "reply 1"}])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.store.stats(), {"replayed": 0, "coalesced": 1, "in_flight": 0})
+
+    async def test_replays_the_stored_response(self):
+        await self.store.run("user", "key", self.handler)
+        self.assertEqual(await self.store.run("user", "key", self.handler), {"message": "reply 1"})
+        self.assertEqual(await self.store.run("other", "key", self.handler), {"message": "reply 2"})
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.store.stats()["replayed"], 1)
+
+    async def test_expired_response_is_not_replayed(self):
+        self.client.delegate["gamebot"]["idempotency-keys"].insert_one(
+            {"_id": "user:key", "response": {"message": "old"}, "expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        self.assertEqual(await self.store.run("user", "key", self.handler), {"message": "reply 1"})
+
+    async def test_failed_request_is_not_stored(self):
+        async def fail() -> dict:
+            raise ValueError("The model is down")
+
+        with self.assertRaises(ValueError):
+            await self.store.run("user", "key", fail)
+        self.assertEqual(await self.store.run("user", "key", self.handler), {"message": "reply 1"})
+
+    async def test_response_is_returned_when_storing_it_fails(self):
+        async def update_one(*args, **kwargs):
+            raise ConnectionError("The database is down")
+
+        self.store.collection.update_one = update_one
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(await self.store.run("user", "key", self.handler), {"message": "reply 1"})
+        self.assertEqual(self.store.stats()["in_flight"], 0)
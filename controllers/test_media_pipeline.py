@@ -0,0 +1,44 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+
+from controllers.in_memory_s3 import InMemoryS3
+from controllers.media_pipeline import MediaPipeline
+from providers.media_generator import MediaAsset
+from providers.stub_media_generator import StubMediaGenerator
+from utils.mongo import ThreadedMongoClient
+
+
+class TestMediaPipeline(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.s3 = InMemoryS3()
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+        self.pipeline = MediaPipeline(client=self.client, s3_client=self.s3, bucket_name="bucket",
+                                      public_url="https://media.example.com/", generator=StubMediaGenerator())
+
+    async def test_fills_the_message_fields(self):
+        messages = self.client.delegate["gamebot"]["game-messages"]
+        messages.insert_one({"session": "session", "seq": 1, "role": "assistant", "content": "reply"})
+        self.pipeline.schedule("session", seq=1, content="reply")
+        await asyncio.gather(*self.pipeline.background_tasks)
+        message = messages.find_one({"seq": 1})
+        self.assertTrue(message["audio"].startswith("https://media.example.com/media/"))
+        self.assertTrue(message["image"].endswith(".svg"))
+        self.assertEqual(len(self.s3.objects), 2)
+
+    async def test_identical_assets_are_stored_once(self):
+        asset = MediaAsset(kind="image", data=b"image", content_type="image/png", extension="png")
+        url = await self.pipeline.store(asset)
+        self.assertEqual(await self.pipeline.store(asset), url)
+        self.pipeline.known_keys.clear()
+        self.assertEqual(await self.pipeline.store(asset), url)
+        self.assertEqual(self.s3.puts, 1)
+        self.assertEqual(self.pipeline.deduplicated, 2)
+
+    async def test_multipart_upload(self):
+        self.pipeline.part_size = 4
+        data = b"0123456789"
+        await self.pipeline.store(MediaAsset(kind="audio", data=data, content_type="audio/wav", extension="wav"))
+        self.assertEqual(list(self.s3.objects.values()), [data])
+        self.assertEqual(self.s3.puts, 0)
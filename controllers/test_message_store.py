@@ -0,0 +1,66 @@
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+from bson import ObjectId
+
+from controllers.message_store import MessageStore
+from utils.mongo import ThreadedMongoClient
+
+
+class TestMessageStore(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+        self.store = MessageStore(client=self.client)
+        await self.store.create_indexes()
+        self.session_id = ObjectId()
+        self.client.delegate["gamebot"]["game-sessions"].insert_one({"_id": self.session_id, "user": "user",
+                                                                      "message_count": 0})
+
+    async def commit(self, *contents: str) -> bool:
+        session = await self.store.start_turn("user", timeout=60)
+        return await self.store.commit_turn(session["_id"], turn_id=session["turn"]["id"],
+                                            version=session["message_count"],
+                                            messages=[{"role": "user", "content": content} for content in contents])
+
+    async def contents(self):
+        return [message["content"] for message in await self.store.find(self.session_id)]
+
+    async def test_commit_turn(self):
+        self.assertTrue(await self.commit("a", "b"))
+        self.assertTrue(await self.commit("c"))
+        self.assertEqual(await self.contents(), ["a", "b", "c"])
+        session = self.client.delegate["gamebot"]["game-sessions"].find_one({"_id": self.session_id})
+        self.assertEqual(session["message_count"], 3)
+        self.assertNotIn("turn", session)
+
+    async def test_lost_lock_leaves_no_messages(self):
+        session = await self.store.start_turn("user", timeout=60)
+        self.assertFalse(await self.store.commit_turn(session["_id"], turn_id="expired", version=0,
+                                                      messages=[{"role": "user", "content": "a"}]))
+        self.assertEqual(await self.contents(), [])
+
+    async def test_replaces_the_messages_of_a_dead_turn(self):
+        # a turn that died after inserting its messages, before committing them
+        self.client.delegate["gamebot"]["game-messages"].insert_one({"session": self.session_id, "seq": 0,
+                                                                     "role": "user", "content": "dead"})
+        self.assertEqual(await self.store.find(self.session_id, end=0), [])
+        self.assertTrue(await self.commit("a"))
+        self.assertEqual(await self.contents(), ["a"])
+
+    async def test_find_page(self):
+        await self.commit("a", "b", "c", "d", "e")
+
+        async def page(**kwargs):
+            return [message["content"] for message in await self.store.find_page(self.session_id, **kwargs)]
+
+        self.assertEqual(await page(), ["a", "b", "c", "d", "e"])
+        # the most recent messages, oldest first
+        self.assertEqual(await page(limit=2), ["d", "e"])
+        self.assertEqual(await page(limit=2, before=3), ["b", "c"])
+        self.assertEqual(await page(limit=10, before=2), ["a", "b"])
+        self.assertEqual(await page(before=2), ["a", "b"])
+        # the messages right after since
+        self.assertEqual(await page(limit=2, since=0), ["b", "c"])
+        self.assertEqual(await page(since=2), ["d", "e"])
+        self.assertEqual(await page(limit=2, since=1, before=3), ["c"])
+        self.assertEqual(await page(limit=2, since=4), [])
@@ -0,0 +1,50 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from controllers.admission_control import AdmissionControl
+from controllers.opening_pool import OpeningPool
+from models.prompt_models import GetPromptDto
+from providers.stub_provider import StubProvider
+
+
+class TestOpeningPool(IsolatedAsyncioTestCase):
+    prompt = GetPromptDto(name="game", prompt="You are a game", first_user_message="start")
+
+    def setUp(self):
+        self.pool = OpeningPool(llm_provider=StubProvider(), default_model="model", size=2)
+
+    async def __wait_for_refill__(self):
+        await asyncio.gather(*self.pool.background_tasks)
+
+    async def test_refills_after_take(self):
+        self.assertIsNone(self.pool.take(self.prompt))
+        await self.__wait_for_refill__()
+        self.assertEqual(len(self.pool.pools["game"]), 2)
+        self.assertIsNotNone(self.pool.take(self.prompt))
+        await self.__wait_for_refill__()
+        self.assertEqual(len(self.pool.pools["game"]), 2)
+
+    async def test_changed_prompt_is_not_served_from_the_pool(self):
+        self.pool.take(self.prompt)
+        await self.__wait_for_refill__()
+        changed = GetPromptDto(name="game", prompt="You are another game", first_user_message="start")
+        self.assertIsNone(self.pool.take(changed))
+
+    async def test_clear_discards_replies_in_flight(self):
+        self.pool.take(self.prompt)
+        self.pool.clear("game")
+        await self.__wait_for_refill__()
+        self.assertEqual(len(self.pool.pools.get("game", [])), 0)
+
+    async def test_prompt_without_opening(self):
+        self.assertIsNone(self.pool.take(GetPromptDto(name="chat", prompt="You are a bot")))
+        self.assertEqual(len(self.pool.background_tasks), 0)
+
+    async def test_refill_is_skipped_when_the_model_is_busy(self):
+        admission = AdmissionControl(max_concurrency=1)
+        await admission.acquire()
+        pool = OpeningPool(llm_provider=StubProvider(), default_model="model", size=2, admission_control=admission)
+        pool.take(self.prompt)
+        await asyncio.gather(*pool.background_tasks)
+        self.assertEqual(len(pool.pools["game"]), 0)
+        self.assertEqual(pool.stats()["generating"], 0)
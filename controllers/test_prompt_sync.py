@@ -0,0 +1,44 @@
+import tempfile
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+
+from controllers.prompt_cache import PromptCache
+from controllers.prompt_controller import PromptController
+from controllers.prompt_sync import PromptSync
+from utils.mongo import ThreadedMongoClient
+
+
+class TestPromptSync(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        client = ThreadedMongoClient(mongomock.MongoClient())
+        self.prompt_cache = PromptCache(client=client, refresh_interval=0)
+        self.prompt_controller = PromptController(client=client, prompt_cache=self.prompt_cache)
+        self.prompt_sync = PromptSync(prompt_controller=self.prompt_controller, directory=self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_unchanged_files_are_skipped(self):
+        (self.path / "game.md").write_text("You are a game", encoding="utf-8")
+        (self.path / "bot.md").write_text("You are a bot", encoding="utf-8")
+        (self.path / "notes.txt").write_text("not a prompt", encoding="utf-8")
+        self.assertEqual(sorted(await self.prompt_sync.sync()), ["bot", "game"])
+        self.assertEqual(await self.prompt_sync.sync(), [])
+
+        (self.path / "game.md").write_text("You are another game", encoding="utf-8")
+        self.assertEqual(await self.prompt_sync.sync(), ["game"])
+        self.assertEqual((await self.prompt_cache.get("game")).prompt, "You are another game")
+
+    async def test_fields_set_through_the_api_are_kept(self):
+        (self.path / "game.md").write_text("You are a game", encoding="utf-8")
+        await self.prompt_sync.sync()
+        await self.prompt_controller.collection.update_one({"name": "game"}, {"$set": {"first_user_message": "start"}})
+        (self.path / "game.md").write_text("You are another game", encoding="utf-8")
+        await self.prompt_sync.sync()
+        prompt = await self.prompt_cache.get("game")
+        self.assertEqual(prompt.prompt, "You are another game")
+        self.assertEqual(prompt.first_user_message, "start")
@@ -0,0 +1,43 @@
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+
+from controllers.response_cache import ResponseCache, request_key
+from utils.mongo import ThreadedMongoClient
+
+
+class TestResponseCache(IsolatedAsyncioTestCase):
+    messages = [{"role": "system", "content": "You are a game"}, {"role": "user", "content": "start"}]
+
+    def setUp(self):
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+
+    def test_request_key(self):
+        self.assertEqual(request_key(self.messages, "model"), request_key([dict(m) for m in self.messages], "model"))
+        self.assertNotEqual(request_key(self.messages, "model"), request_key(self.messages, "other"))
+        self.assertNotEqual(request_key(self.messages, "model"), request_key(self.messages[:1], "model"))
+
+    async def test_lru(self):
+        cache = ResponseCache(client=self.client, max_size=2)
+        await cache.put("a", "reply a")
+        await cache.put("b", "reply b")
+        self.assertEqual(await cache.get("a"), "reply a")
+        await cache.put("c", "reply c")
+        self.assertIsNone(await cache.get("b"))
+        self.assertEqual(await cache.get("a"), "reply a")
+        self.assertEqual(cache.stats()["hit_rate"], 2 / 3)
+
+    async def test_expiry(self):
+        cache = ResponseCache(client=self.client, max_size=2, ttl=-1)
+        await cache.put("a", "reply a")
+        self.assertIsNone(await cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    async def test_shared_tier(self):
+        writer = ResponseCache(client=self.client, shared=True)
+        reader = ResponseCache(client=self.client, shared=True)
+        await writer.put("a", "reply a")
+        self.assertEqual(await reader.get("a"), "reply a")
+        self.assertEqual(await reader.get("a"), "reply a")
+        self.assertEqual(reader.stats()["shared_hits"], 1)
+        self.assertEqual(reader.stats()["hits"], 1)
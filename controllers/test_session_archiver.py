@@ -0,0 +1,114 @@
+import io
+from datetime import datetime, timedelta
+from unittest import IsolatedAsyncioTestCase
+
+import mongomock
+from bson import ObjectId
+
+from controllers.in_memory_s3 import InMemoryS3
+from controllers.message_store import MessageStore
+from controllers.session_archiver import SessionArchiver
+from utils.mongo import ThreadedMongoClient
+
+
+class TestSessionArchiver(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.s3 = InMemoryS3()
+        self.client = ThreadedMongoClient(mongomock.MongoClient())
+        self.sessions = self.client.delegate["gamebot"]["game-sessions"]
+        self.messages = self.client.delegate["gamebot"]["game-messages"]
+        self.archiver = SessionArchiver(client=self.client, s3_client=self.s3, bucket_name="bucket",
+                                        archive_after=3600, rate=1000)
+
+    def s3_session(self) -> dict:
+        body = next(iter(self.s3.objects.values()))
+        return SessionArchiver.__decompress__(io.BytesIO(body))["session"]
+
+    def insert_session(self, user: str, idle: timedelta) -> ObjectId:
+        session_id = ObjectId()
+        self.sessions.insert_one({"_id": session_id, "user": user, "prompt_name": "prompt", "message_count": 2,
+                                  "created_at": datetime.utcnow() - idle, "updated_at": datetime.utcnow() - idle})
+        self.messages.insert_many([
+            {"session": session_id, "seq": 0, "role": "assistant", "content": "You wake up"},
+            {"session": session_id, "seq": 1, "role": "user", "content": "look around"},
+        ])
+        return session_id
+
+    async def test_archive_and_rehydrate(self):
+        session_id = self.insert_session("idle", timedelta(days=2))
+        self.insert_session("active", timedelta(minutes=1))
+
+        self.assertEqual(await self.archiver.archive_batch(), 1)
+        self.assertIsNone(self.sessions.find_one({"user": "idle"}))
+        self.assertEqual(self.messages.count_documents({"session": session_id}), 0)
+        self.assertIsNotNone(self.sessions.find_one({"user": "active"}))
+        self.assertEqual(len(self.s3.objects), 1)
+
+        self.assertTrue(await self.archiver.rehydrate("idle"))
+        session = self.sessions.find_one({"user": "idle"})
+        self.assertEqual(session["_id"], session_id)
+        self.assertNotIn("turn", session)
+        self.assertIsNone(self.client.delegate["gamebot"]["archived-sessions"].find_one({"_id": "idle"}))
+        messages = await MessageStore(client=self.client).find(session_id)
+        self.assertEqual([message["content"] for message in messages], ["You wake up", "look around"])
+        self.assertEqual(len(self.s3.objects), 0)
+        self.assertFalse(await self.archiver.rehydrate("idle"))
+        self.assertEqual(self.archiver.stats(), {"archived": 1, "rehydrated": 1, "failed": 0})
+
+    async def test_keeps_a_session_whose_claim_expired(self):
+        session_id = self.insert_session("idle", timedelta(days=2))
+        original_put = self.s3.put_object
+
+        def put_after_the_claim_expired(**kwargs):
+            original_put(**kwargs)
+            # a turn locks the session once the claim has expired
+            self.sessions.update_one({"_id": session_id}, {"$set": {"turn": {"id": "turn"}}})
+
+        self.s3.put_object = put_after_the_claim_expired
+        self.assertEqual(await self.archiver.archive_batch(), 0)
+        self.assertEqual(self.messages.count_documents({"session": session_id}), 2)
+        self.assertEqual(self.sessions.find_one({"_id": session_id})["turn"], {"id": "turn"})
+        self.assertIsNone(self.client.delegate["gamebot"]["archived-sessions"].find_one({"_id": "idle"}))
+        self.assertEqual(len(self.s3.objects), 0)
+
+    async def test_claim_locks_the_session(self):
+        session_id = self.insert_session("idle", timedelta(days=2))
+        original_put = self.s3.put_object
+        locked = []
+
+        def put_and_start_a_turn(**kwargs):
+            original_put(**kwargs)
+            locked.append(self.sessions.find_one({"_id": session_id, "turn": None}))
+
+        self.s3.put_object = put_and_start_a_turn
+        self.assertEqual(await self.archiver.archive_batch(), 1)
+        self.assertEqual(locked, [None])
+        self.assertNotIn("turn", self.s3_session())
+
+    async def test_rehydrate_while_archiving(self):
+        session_id = self.insert_session("idle", timedelta(days=2))
+        original_delete = self.archiver.message_store.delete
+        rehydrated = []
+
+        async def rehydrate_and_delete(session):
+            # a request for the session comes in after the pointer was written
+            rehydrated.append(await self.archiver.rehydrate("idle"))
+            await original_delete(session)
+
+        self.archiver.message_store.delete = rehydrate_and_delete
+        self.assertEqual(await self.archiver.archive_batch(), 1)
+        self.assertEqual(rehydrated, [True])
+        self.assertIsNone(self.sessions.find_one({"user": "idle"}))
+        self.assertEqual(len(self.s3.objects), 1)
+        self.assertIsNotNone(self.client.delegate["gamebot"]["archived-sessions"].find_one({"_id": "idle"}))
+
+        self.assertTrue(await self.archiver.rehydrate("idle"))
+        self.assertEqual(self.sessions.find_one({"user": "idle"})["_id"], session_id)
+        self.assertEqual(self.messages.count_documents({"session": session_id}), 2)
+
+    async def test_discard(self):
+        self.insert_session("idle", timedelta(days=2))
+        await self.archiver.archive_batch()
+        await self.archiver.discard("idle")
+        self.assertEqual(len(self.s3.objects), 0)
+        self.assertFalse(await self.archiver.rehydrate("idle"))
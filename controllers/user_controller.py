@@ -1,25 +1,27 @@
 from fastapi import HTTPException
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from motor.motor_asyncio import AsyncIOMotorCollection
 
 from controllers.controller import Controller
 from models.user_models import CreateUserDto, LoginDto
+from utils.mongo import AsyncMongoClient
 
 
 class UserController(Controller):
-    def __init__(self, client: MongoClient):
+    def __init__(self, client: AsyncMongoClient):
         super().__init__(client=client)
-        self.collection: Collection = self.db["users"]
-        self.collection.create_index("name", unique=True)
+        self.collection: AsyncIOMotorCollection = self.db["users"]
 
-    def register(self, user: CreateUserDto):
+    async def create_indexes(self):
+        await self.collection.create_index("name", unique=True)
+
+    async def register(self, user: CreateUserDto):
         """
         Register a new user
         :param user: user to register
         :return:
         """
         try:
-            data = self.collection.insert_one(user.to_dict())
+            data = await self.collection.insert_one(user.to_dict())
             if data is None:
                 raise HTTPException(status_code=500, detail="Failed to register user")
             return data
@@ -29,13 +31,13 @@ class UserController(Controller):
                 raise HTTPException(status_code=400, detail="User already exists")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def login(self, credentials: LoginDto):
+    async def login(self, credentials: LoginDto):
         """
         Login a user
         :param credentials: user credentials
         :return:
         """
-        user = self.collection.find_one({"name": credentials.name, "password": credentials.password})
+        user = await self.collection.find_one({"name": credentials.name, "password": credentials.password})
         if user is None:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         return user
\ No newline at end of file
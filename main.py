@@ -1,23 +1,43 @@
+import asyncio
 import logging
 import os
+import re
+from pathlib import Path
 from typing import Optional
 
-import boto3
-import certifi
-import openai
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBasicCredentials
-from pymongo import MongoClient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasicCredentials, HTTPBearer
 
 from auth import generate_token, JWTBearer, admin_auth
+from controllers.admission_control import AdmissionControl
 from controllers.game_controller import GameController
+from controllers.idempotency_store import IdempotencyStore
+from controllers.index_bootstrap import IndexBootstrap
+from controllers.media_pipeline import MediaPipeline
+from controllers.opening_pool import OpeningPool
+from controllers.prompt_cache import PromptCache
 from controllers.prompt_controller import PromptController
+from controllers.prompt_sync import PromptSync
+from controllers.response_cache import ResponseCache
+from controllers.revoked_token_store import RevokedTokenStore
+from controllers.session_archiver import SessionArchiver
 from controllers.user_controller import UserController
 from models.message_models import PostMessageDto
 from models.prompt_models import CreatePromptDto, UpdatePromptDto
 from models.session_models import CreateGameSessionDto
 from models.user_models import CreateUserDto, LoginDto
+from providers.create_provider import create_llm_provider, create_media_generator
+from utils.fast_response import response_encoder
+from utils.http_cache import conditional_json_response
+from utils.metrics import MetricsMiddleware, metrics
+from utils.mongo import LazyMongoClient, create_mongo_client
+from utils.s3 import LazyS3Client
+from utils.sse import to_event_stream
+from utils.template_cache import template_cache
+from utils.token_cache import token_cache
 
 app = FastAPI()
 app.add_middleware(
@@ -30,6 +50,13 @@ app.add_middleware(
 
 logging.basicConfig(level=logging.INFO)
 
+# Prometheus metrics on GET /metrics, and Server-Timing headers with the duration of each stage of a request
+metrics_enabled = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+server_timing_enabled = os.getenv("SERVER_TIMING", "false").lower() == "true"
+metrics.configure(enabled=metrics_enabled, server_timing=server_timing_enabled)
+if metrics_enabled or server_timing_enabled:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 db_url = os.getenv("DB_URL")
 endpoint_url = os.getenv("AWS_ENDPOINT_URL")
 public_url = os.getenv("PUBLIC_URL")
@@ -37,106 +64,350 @@ bucket_name = os.getenv("AWS_BUCKET_NAME")
 region_name = os.getenv("AWS_REGION_NAME")
 aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
 aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+# Set to path for S3 compatible stand-ins such as MinIO that don't serve buckets as subdomains
+s3_addressing_style = os.getenv("AWS_S3_ADDRESSING_STYLE")
 open_ai_key = os.getenv("OPENAI_API_KEY")
-
-logging.info(f"DB_URL: {db_url}")
+# Use motor and the async openai client. Set to false to run the blocking clients in the threadpool instead
+async_mode = os.getenv("ASYNC_MODE", "true").lower() == "true"
+# openai, openai-sdk or stub. Defaults to openai in async mode and openai-sdk otherwise
+llm_provider_name = os.getenv("LLM_PROVIDER")
+openai_api_base = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+# Model of the prompts that don't set one
+openai_model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo-0301")
+# Seconds until the model has to answer, including retries, and the number of retries of failed calls
+llm_timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+llm_pool_size = int(os.getenv("LLM_POOL_SIZE", "100"))
+# Seconds until the first token and between two chunks of the stub provider
+stub_llm_latency = float(os.getenv("STUB_LLM_LATENCY", "0"))
+stub_llm_token_latency = float(os.getenv("STUB_LLM_TOKEN_LATENCY", "0"))
+# Number of compiled prompt templates, and of rendered system messages per (prompt, user name). 0 disables the latter
+template_cache_size = int(os.getenv("TEMPLATE_CACHE_SIZE", "128"))
+rendered_prompt_cache_size = int(os.getenv("RENDERED_PROMPT_CACHE_SIZE", "0"))
+# Responses of GET /chat of at least this many bytes are compressed with brotli or gzip. -1 disables compression
+compression_min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+gzip_level = int(os.getenv("GZIP_LEVEL", "6"))
+brotli_quality = int(os.getenv("BROTLI_QUALITY", "4"))
+# Answer GET /chat with MessagePack when the client sends Accept: application/msgpack and msgpack is installed
+msgpack_responses = os.getenv("MSGPACK_RESPONSES", "true").lower() == "true"
+# Seconds between two checks whether another process changed the prompts
+prompt_cache_refresh_interval = float(os.getenv("PROMPT_CACHE_REFRESH_INTERVAL", "1"))
+# Seconds during which clients may use a fetched prompt without revalidating it with its ETag
+prompt_max_age = int(os.getenv("PROMPT_MAX_AGE", "0"))
+# Maximum number of tokens sent to the model per turn. Older messages are folded into a summary
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+summary_token_budget = int(os.getenv("SUMMARY_TOKEN_BUDGET", "500"))
+context_message_limit = int(os.getenv("CONTEXT_MESSAGE_LIMIT", "50"))
+# Seconds after which a turn that neither finished nor failed no longer blocks the session
+turn_timeout = float(os.getenv("TURN_TIMEOUT", "120"))
+# Seconds during which a retried POST /chat with the same Idempotency-Key gets the stored response
+idempotency_window = float(os.getenv("IDEMPOTENCY_WINDOW", "600"))
+# Number of pre-generated opening turns kept per prompt. 0 disables the pool
+opening_pool_size = int(os.getenv("OPENING_POOL_SIZE", "2"))
+# Number of verified tokens kept in memory, and seconds until a token revoked by another process is rejected
+token_cache_size = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+revoked_token_refresh_interval = float(os.getenv("REVOKED_TOKEN_REFRESH_INTERVAL", "5"))
+# Replies kept for the prompts with cache_responses, seconds until they are generated again, and whether they are
+# shared with the other processes through the database. A size of 0 disables the cache
+response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+response_cache_shared = os.getenv("RESPONSE_CACHE_SHARED", "false").lower() == "true"
+# Calls to the model running at the same time, calls waiting for a slot, and seconds they wait before getting a 503.
+# A concurrency of 0 disables the limit
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+llm_max_queue = int(os.getenv("LLM_MAX_QUEUE", "100"))
+llm_queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Slots out of LLM_MAX_CONCURRENCY that background work, i.e. opening pool refills and summaries, can hold at once.
+# Background work never waits and is skipped when the model is busy
+llm_max_background = int(os.getenv("LLM_MAX_BACKGROUND_CONCURRENCY", "1"))
+# Turns per minute allowed per user, and turns a user can send at once. Above it, requests get a 429. 0 disables it
+user_turns_per_minute = float(os.getenv("USER_TURNS_PER_MINUTE", "0"))
+user_turn_burst = int(os.getenv("USER_TURN_BURST", "5"))
+# stub, or none to leave the audio and image of the replies empty. Needs AWS_BUCKET_NAME and PUBLIC_URL
+media_generator_name = os.getenv("MEDIA_GENERATOR", "none")
+stub_media_latency = float(os.getenv("STUB_MEDIA_LATENCY", "0"))
+# Bytes per part of the multipart uploads of the media, at least 5 MiB, and parts uploaded at the same time
+media_part_size = int(os.getenv("MEDIA_PART_SIZE", str(8 * 1024 * 1024)))
+media_upload_concurrency = int(os.getenv("MEDIA_UPLOAD_CONCURRENCY", "4"))
+# Seconds without a turn after which a session is moved to AWS_BUCKET_NAME, e.g. 604800 for a week. 0 disables it.
+# Archived sessions come back on the next request of their user
+session_archive_after = float(os.getenv("SESSION_ARCHIVE_AFTER", "0"))
+# Sessions archived per run, at most this many per second, and seconds between two runs
+session_archive_batch_size = int(os.getenv("SESSION_ARCHIVE_BATCH_SIZE", "100"))
+session_archive_rate = float(os.getenv("SESSION_ARCHIVE_RATE", "10"))
+session_archive_interval = float(os.getenv("SESSION_ARCHIVE_INTERVAL", "300"))
+# Directory of the prompt files, whether to sync them when a worker starts and whether to push edits of the files live.
+# Prefer scripts.sync_prompts on deploy with several workers, and the watch mode for development
+prompts_dir = Path(os.getenv("PROMPTS_DIR", str(Path(__file__).parent / "prompts")))
+sync_prompts_on_startup = os.getenv("SYNC_PROMPTS_ON_STARTUP", "false").lower() == "true"
+watch_prompts = os.getenv("WATCH_PROMPTS", "false").lower() == "true"
+# Create the indexes in the background when a worker starts. Disable it when scripts.create_indexes runs on deploy
+create_indexes_on_startup = os.getenv("CREATE_INDEXES_ON_STARTUP", "true").lower() == "true"
+# Seconds until GET /readyz gives up on the database
+readiness_timeout = float(os.getenv("READINESS_TIMEOUT", "2"))
+
+# credentials in the connection string are not logged
+logging.info(f"DB_URL: {re.sub(r'//[^/@]*@', '//***@', db_url) if db_url else db_url}")
 logging.info(f"AWS_ENDPOINT_URL: {endpoint_url}")
 logging.info(f"PUBLIC_URL: {public_url}")
 logging.info(f"AWS_BUCKET_NAME: {bucket_name}")
 logging.info(f"AWS_REGION_NAME: {region_name}")
-logging.info(f"AWS_ACCESS_KEY_ID: {aws_access_key_id}")
-logging.info(f"AWS_SECRET_ACCESS_KEY: {aws_secret_access_key}")
-
-mongo_client = MongoClient(db_url, tlsCAFile=certifi.where() if db_url.startswith("mongodb+srv") else None)
-openai.api_key = open_ai_key
-s3_client = boto3.client('s3',
-                         aws_access_key_id=aws_access_key_id,
-                         aws_secret_access_key=aws_secret_access_key,
-                         region_name=region_name,
-                         endpoint_url=endpoint_url,
-                         )
+logging.info(f"ASYNC_MODE: {async_mode}")
+logging.info(f"LLM_PROVIDER: {llm_provider_name}")
+logging.info(f"MEDIA_GENERATOR: {media_generator_name}")
+
+template_cache.configure(max_templates=template_cache_size, max_rendered=rendered_prompt_cache_size)
+response_encoder.configure(compression_min_size=compression_min_size, gzip_level=gzip_level,
+                           brotli_quality=brotli_quality, msgpack_enabled=msgpack_responses)
+token_cache.configure(max_size=token_cache_size)
+
+# clients are created on first use, so that importing the app doesn't connect to anything
+mongo_client = LazyMongoClient(lambda: create_mongo_client(db_url, use_async_driver=async_mode))
+llm_provider = create_llm_provider(llm_provider_name, api_key=open_ai_key, use_async_client=async_mode,
+                                   api_base=openai_api_base, pool_size=llm_pool_size, timeout=llm_timeout,
+                                   max_retries=llm_max_retries, stub_latency=stub_llm_latency,
+                                   stub_token_latency=stub_llm_token_latency)
+s3_client = LazyS3Client(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key,
+                         region_name=region_name, endpoint_url=endpoint_url, addressing_style=s3_addressing_style)
+media_generator = create_media_generator(media_generator_name, stub_latency=stub_media_latency)
+
+prompt_cache = PromptCache(client=mongo_client, refresh_interval=prompt_cache_refresh_interval)
+idempotency_store = IdempotencyStore(client=mongo_client, window=idempotency_window)
+revoked_token_store = RevokedTokenStore(client=mongo_client, token_cache=token_cache,
+                                        refresh_interval=revoked_token_refresh_interval)
+admission_control = AdmissionControl(max_concurrency=llm_max_concurrency, max_queue=llm_max_queue,
+                                     queue_timeout=llm_queue_timeout, user_rate=user_turns_per_minute / 60,
+                                     user_burst=user_turn_burst, max_background=llm_max_background)
+opening_pool = OpeningPool(llm_provider=llm_provider, default_model=openai_model, size=opening_pool_size,
+                           admission_control=admission_control)
+response_cache = ResponseCache(client=mongo_client, max_size=response_cache_size, ttl=response_cache_ttl,
+                               shared=response_cache_shared)
+session_archiver = None
+if bucket_name is not None:
+    session_archiver = SessionArchiver(client=mongo_client, s3_client=s3_client, bucket_name=bucket_name,
+                                       archive_after=session_archive_after, batch_size=session_archive_batch_size,
+                                       rate=session_archive_rate, interval=session_archive_interval)
+elif session_archive_after > 0:
+    logging.warning("Sessions are not archived: AWS_BUCKET_NAME is required")
+media_pipeline = None
+if media_generator is not None:
+    if bucket_name is None or public_url is None:
+        logging.warning("The media pipeline is disabled: AWS_BUCKET_NAME and PUBLIC_URL are required")
+    else:
+        media_pipeline = MediaPipeline(client=mongo_client, s3_client=s3_client, bucket_name=bucket_name,
+                                       public_url=public_url, generator=media_generator, part_size=media_part_size,
+                                       max_concurrency=media_upload_concurrency)
 
 # controller
 user_controller = UserController(client=mongo_client)
-game_controller = GameController(client=mongo_client)
-prompt_controller = PromptController(client=mongo_client)
+game_controller = GameController(client=mongo_client, prompt_cache=prompt_cache, idempotency_store=idempotency_store,
+                                 llm_provider=llm_provider, default_model=openai_model,
+                                 context_token_budget=context_token_budget, summary_token_budget=summary_token_budget,
+                                 context_message_limit=context_message_limit, turn_timeout=turn_timeout,
+                                 opening_pool=opening_pool, media_pipeline=media_pipeline,
+                                 response_cache=response_cache, session_archiver=session_archiver,
+                                 admission_control=admission_control)
+prompt_controller = PromptController(client=mongo_client, prompt_cache=prompt_cache, opening_pool=opening_pool)
+prompt_sync = PromptSync(prompt_controller=prompt_controller, directory=prompts_dir)
+index_bootstrap = IndexBootstrap([user_controller, game_controller, prompt_controller, revoked_token_store,
+                                  response_cache] + ([session_archiver] if session_archiver is not None else []))
+
+metrics.add_stats("template_cache", template_cache.stats)
+metrics.add_stats("token_cache", token_cache.stats)
+metrics.add_stats("prompt_cache", prompt_cache.stats)
+metrics.add_stats("opening_pool", opening_pool.stats)
+metrics.add_stats("idempotency", idempotency_store.stats)
+metrics.add_stats("response_cache", response_cache.stats)
+metrics.add_stats("admission", admission_control.stats)
+if media_pipeline is not None:
+    metrics.add_stats("media", media_pipeline.stats)
+if session_archiver is not None:
+    metrics.add_stats("session_archiver", session_archiver.stats)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if create_indexes_on_startup:
+        index_bootstrap.start()
+    revoked_token_store.start()
+    if session_archiver is not None:
+        session_archiver.start()
+    if sync_prompts_on_startup or watch_prompts:
+        prompt_sync.start(watch=watch_prompts)
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    index_bootstrap.stop()
+    revoked_token_store.stop()
+    await prompt_sync.stop()
+    if session_archiver is not None:
+        session_archiver.stop()
+    await llm_provider.close()
+    if media_pipeline is not None:
+        await media_pipeline.close()
+    mongo_client.close()
+
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """
+    Liveness probe. The process is up, whether or not the database is reachable
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """
+    Readiness probe. The database answers and the indexes exist
+    """
+    try:
+        await asyncio.wait_for(mongo_client["admin"].command("ping"), timeout=readiness_timeout)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {type(e).__name__}")
+    if create_indexes_on_startup and not index_bootstrap.created:
+        raise HTTPException(status_code=503, detail="Indexes are being created")
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/login")
-def login(user: LoginDto):
+async def login(user: LoginDto):
     """
     Login a user
     """
-    user = user_controller.login(credentials=user)
+    user = await user_controller.login(credentials=user)
     token = generate_token(data={"name": user["name"], "id": str(user["_id"])})
     return {"access_token": token}
 
 
+@app.post("/logout")
+async def logout(user: dict = Depends(JWTBearer()),
+                 credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
+    """
+    Revoke the token of the request
+    """
+    await revoked_token_store.revoke(token=credentials.credentials, payload=user)
+    return {"message": "Logged out successfully"}
+
+
 @app.post("/admin/login")
-def admin_login(credentials: HTTPBasicCredentials = Depends(admin_auth)):
+async def admin_login(credentials: HTTPBasicCredentials = Depends(admin_auth)):
     return {"message": "Logged in as admin"}
 
 
 @app.post("/register")
-def register(user: CreateUserDto):
+async def register(user: CreateUserDto):
     """
     Register a new user
     :param user: user to register
     :return:
     """
-    user_controller.register(user=user)
+    await user_controller.register(user=user)
     return {"message": "User registered successfully"}
 
 
 @app.post("/prompt")
-def create_prompt(data: CreatePromptDto, credentials: HTTPBasicCredentials = Depends(admin_auth)):
-    return prompt_controller.add_new_prompt(prompt=data)
+async def create_prompt(data: CreatePromptDto, credentials: HTTPBasicCredentials = Depends(admin_auth)):
+    return await prompt_controller.add_new_prompt(prompt=data)
 
 
 @app.get("/prompt/{name}")
-def get_prompt(name: str):
-    return prompt_controller.get_prompt(prompt_name=name)
+async def get_prompt(name: str, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Get a prompt. Answers 304 when the ETag in If-None-Match is still current
+    """
+    prompt = await prompt_controller.get_prompt(prompt_name=name)
+    return conditional_json_response(jsonable_encoder(prompt), if_none_match,
+                                     cache_control=f"public, max-age={prompt_max_age}")
 
 
 @app.get("/prompt")
-def get_all_prompts():
-    return prompt_controller.get_all_prompts()
+async def get_all_prompts(if_none_match: Optional[str] = Header(default=None)):
+    """
+    Get the names of all prompts. Answers 304 when the ETag in If-None-Match is still current
+    """
+    prompts = await prompt_controller.get_all_prompts()
+    return conditional_json_response(jsonable_encoder(prompts), if_none_match,
+                                     cache_control=f"public, max-age={prompt_max_age}")
 
 
 @app.patch("/prompt/{name}")
-def update_prompt(name: str, data: UpdatePromptDto, credentials: HTTPBasicCredentials = Depends(admin_auth)):
-    return prompt_controller.update_prompt(prompt_name=name, prompt=data)
+async def update_prompt(name: str, data: UpdatePromptDto, credentials: HTTPBasicCredentials = Depends(admin_auth)):
+    return await prompt_controller.update_prompt(prompt_name=name, prompt=data)
 
 
 @app.delete("/prompt/{name}")
-def delete_prompt(name: str, credentials: HTTPBasicCredentials = Depends(admin_auth)):
-    return prompt_controller.delete_prompt(prompt_name=name)
+async def delete_prompt(name: str, credentials: HTTPBasicCredentials = Depends(admin_auth)):
+    return await prompt_controller.delete_prompt(prompt_name=name)
 
 
 @app.post("/chat/new")
-def new_chat(data: CreateGameSessionDto, user: dict = Depends(JWTBearer())):
+async def new_chat(data: CreateGameSessionDto, user: dict = Depends(JWTBearer())):
+    """
+    Create a new session. If the prompt has an opening turn that isn't pre-generated yet, it is generated in the
+    background and shows up in GET /chat once it is ready
+    """
     user_id = user["id"]
-    return game_controller.create_new_game_session(user_id=user_id, data=data)
+    return await game_controller.create_new_game_session(user_id=user_id, data=data)
 
 
 @app.post("/chat")
-def chat(data: Optional[PostMessageDto] = None, user: dict = Depends(JWTBearer())):
+async def chat(data: Optional[PostMessageDto] = None, user: dict = Depends(JWTBearer()),
+               idempotency_key: Optional[str] = Header(default=None, max_length=255)):
+    """
+    Send a message. Clients that retry on timeout should send the same Idempotency-Key header with every retry
+    """
     user_id = user["id"]
     extra_data = {
         "name": user["name"],
     }
     if data is None:
-        return game_controller.chat(user_id=user_id, message=None, extra_data=extra_data)
-    return game_controller.chat(user_id=user_id, message=data.content, extra_data=extra_data)
+        return await game_controller.chat(user_id=user_id, message=None, extra_data=extra_data,
+                                          idempotency_key=idempotency_key)
+    return await game_controller.chat(user_id=user_id, message=data.content, extra_data=extra_data,
+                                      idempotency_key=idempotency_key)
+
+
+@app.post("/chat/stream")
+async def chat_stream(data: Optional[PostMessageDto] = None, user: dict = Depends(JWTBearer())):
+    """
+    Same as POST /chat, but the reply is sent as server sent events while it is generated
+    """
+    user_id = user["id"]
+    extra_data = {
+        "name": user["name"],
+    }
+    events = await game_controller.chat_stream(user_id=user_id, message=data.content if data is not None else None,
+                                               extra_data=extra_data)
+    return StreamingResponse(to_event_stream(events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.delete("/chat")
-def delete_chat(user: dict = Depends(JWTBearer())):  # type: ignore
+async def delete_chat(user: dict = Depends(JWTBearer())):  # type: ignore
     user_id = user["id"]
-    return game_controller.delete_session(user_id=user_id)
+    return await game_controller.delete_session(user_id=user_id)
 
 
 @app.get("/chat")
-def get_chat(user: dict = Depends(JWTBearer())):  # type: ignore
+async def get_chat(limit: Optional[int] = Query(default=None, ge=1), before: Optional[int] = None,
+                   since: Optional[int] = None, accept: Optional[str] = Header(default=None),
+                   accept_encoding: Optional[str] = Header(default=None),
+                   user: dict = Depends(JWTBearer())):  # type: ignore
+    """
+    Get the history of the session. Without parameters, the whole history is returned.
+    Use limit and before to page backwards, and since to only get the messages after a sequence number.
+    Large responses are compressed, and sent as MessagePack to clients that accept application/msgpack
+    """
     user_id = user["id"]
-    return game_controller.get_history(user_id=user_id)
+    history = await game_controller.get_history(user_id=user_id, limit=limit, before=before, since=since)
+    with metrics.span("encode_response"):
+        return response_encoder.response(history, accept=accept, accept_encoding=accept_encoding)
@@ -2,9 +2,8 @@ from dataclasses import dataclass
 from enum import Enum
 from typing import Optional
 
-from jinja2 import Environment
-
-from utils.get_selections import GameMessageWithSelections
+from utils.get_selections import PARSER_VERSION, GameMessageWithSelections, get_selections, to_stored_selections
+from utils.template_cache import template_cache
 
 
 class Role(Enum):
@@ -18,36 +17,53 @@ class PostMessageDto:
     content: str
 
 
-@dataclass
+@dataclass(slots=True)
 class CreateMessageDto:
     role: Role
     content: str
     audio: Optional[str]
     image: Optional[str]
+    """
+    Parsed selections. Stored with the message so that the history doesn't need to be parsed again
+    """
+    parsed: Optional[GameMessageWithSelections] = None
 
-    def render(self, extra_data: Optional[dict] = None, inplace = True) -> str:
+    def parse(self) -> GameMessageWithSelections:
+        """
+        Parse the selections of the message
+        :return: message with selections
+        """
+        self.parsed = get_selections(self.content)
+        return self.parsed
+
+    def render(self, extra_data: Optional[dict] = None, inplace = True, cache = False) -> str:
         """
         Render a message with extra data
         :param message: message
         :param extra_data: extra data
+        :param cache: use the shared template cache. Only enable it for contents that repeat, such as prompts
         :return:
         """
         if extra_data is None:
             return self.content
-        env = Environment()
-        template = env.from_string(self.content)
+        if cache:
+            rendered = template_cache.render(self.content, extra_data)
+        else:
+            rendered = template_cache.environment.from_string(self.content).render(**extra_data)
         if inplace:
-            self.content = template.render(**extra_data)
-            return self.content
-        return template.render(**extra_data)
+            self.content = rendered
+        return rendered
 
     def to_dict(self) -> dict:
-        return {
+        data = {
             "role": self.role.value,
             "content": self.content,
             "image": self.image,
             "audio": self.audio
         }
+        if self.parsed is not None:
+            data["parsed"] = to_stored_selections(self.parsed)
+        return data
 
     def to_chat_gpt_dict(self) -> dict:
         return {
@@ -56,21 +72,36 @@ class CreateMessageDto:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class GetMessageDto:
     role: Role
     content: str
     image: Optional[str]
     audio: Optional[str]
+    """
+    Sequence number of the message in the session. Used as cursor to page through the history
+    """
+    seq: Optional[int] = None
 
     @staticmethod
-    def from_dict(data: dict) -> "GetMessageDto":
-        return GetMessageDto(
-            role=Role(data["role"]),
-            content=data["content"],
-            image=data.get("image"),
-            audio=data.get("audio")
-        )
+    def response_dict_from_document(document: dict) -> dict:
+        """
+        Build the GET /chat format of a stored message straight from its document, without creating a
+        GetMessageDto. The parsed selections of the document are reused, so the document must not be used afterwards
+        :param document: message document
+        :return:
+        """
+        content = document.get("parsed")
+        if content is None or content.pop("version", None) != PARSER_VERSION:
+            parsed = get_selections(document["content"])
+            content = {"message": parsed.message, "selections": parsed.selections}
+        return {
+            "role": document["role"],
+            "content": content,
+            "image": document.get("image"),
+            "audio": document.get("audio"),
+            "seq": document.get("seq")
+        }
 
     def to_dict(self) -> dict:
         return {
@@ -87,7 +118,7 @@ class GetMessageDto:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatMessageResponseDto(GameMessageWithSelections):
     audio: Optional[str]
     image: Optional[str]
@@ -13,12 +13,23 @@ class CreatePromptDto:
     First user message. If this is set, the first message will be sent with the prompt
     """
     first_user_message: Optional[str] = None
+    """
+    Model used for the sessions of this prompt. Defaults to the model of the server
+    """
+    model: Optional[str] = None
+    """
+    Reuse the replies of the model for identical requests, e.g. the opening turn or a popular first selection.
+    Only enable it for prompts whose replies don't need to vary
+    """
+    cache_responses: bool = False
 
     def to_dict(self) -> dict:
         return {
             "name": self.name,
             "prompt": self.prompt,
-            "first_user_message": self.first_user_message
+            "first_user_message": self.first_user_message,
+            "model": self.model,
+            "cache_responses": self.cache_responses
         }
 
     @staticmethod
@@ -26,7 +37,9 @@ class CreatePromptDto:
         return CreatePromptDto(
             name=data["name"],
             prompt=data["prompt"],
-            first_user_message=data.get("first_user_message")
+            first_user_message=data.get("first_user_message"),
+            model=data.get("model"),
+            cache_responses=data.get("cache_responses", False)
         )
 
 
@@ -38,12 +51,23 @@ class GetPromptDto:
     name: str
     prompt: str
     first_user_message: Optional[str] = None
+    """
+    Model used for the sessions of this prompt. Defaults to the model of the server
+    """
+    model: Optional[str] = None
+    """
+    Reuse the replies of the model for identical requests, e.g. the opening turn or a popular first selection.
+    Only enable it for prompts whose replies don't need to vary
+    """
+    cache_responses: bool = False
 
     def to_dict(self) -> dict:
         return {
             "name": self.name,
             "prompt": self.prompt,
-            "first_user_message": self.first_user_message
+            "first_user_message": self.first_user_message,
+            "model": self.model,
+            "cache_responses": self.cache_responses
         }
 
     @staticmethod
@@ -51,7 +75,9 @@ class GetPromptDto:
         return GetPromptDto(
             name=data["name"],
             prompt=data["prompt"],
-            first_user_message=data.get("first_user_message")
+            first_user_message=data.get("first_user_message"),
+            model=data.get("model"),
+            cache_responses=data.get("cache_responses", False)
         )
 
 
@@ -78,6 +104,8 @@ class UpdatePromptDto:
     name: Optional[str] = None
     prompt: Optional[str] = None
     first_user_message: Optional[str] = None
+    model: Optional[str] = None
+    cache_responses: Optional[bool] = None
 
     def to_dict(self) -> dict:
         data = {}
@@ -90,6 +118,12 @@ class UpdatePromptDto:
         if self.first_user_message is not None:
             data["first_user_message"] = self.first_user_message
 
+        if self.model is not None:
+            data["model"] = self.model
+
+        if self.cache_responses is not None:
+            data["cache_responses"] = self.cache_responses
+
         return data
 
     @staticmethod
@@ -97,5 +131,7 @@ class UpdatePromptDto:
         return UpdatePromptDto(
             name=data.get("name"),
             prompt=data.get("prompt"),
-            first_user_message=data.get("first_user_message")
+            first_user_message=data.get("first_user_message"),
+            model=data.get("model"),
+            cache_responses=data.get("cache_responses")
         )
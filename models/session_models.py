@@ -2,6 +2,8 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Optional
 
+from bson import ObjectId
+
 from models.message_models import CreateMessageDto, GetMessageDto
 from models.prompt_models import GetPromptDto
 
@@ -14,10 +16,37 @@ class CreateGameSessionDto:
         return {
             "user": user,
             "prompt_name": self.prompt_name,
-            "messages": [],
-            "created_at": datetime.now()
+            "message_count": 0,
+            "created_at": datetime.now(),
+            # last activity, used to archive idle sessions
+            "updated_at": datetime.utcnow()
+        }
+
+
+@dataclass(slots=True)
+class SessionSummaryDto:
+    """
+    Rolling summary of the older messages of a session
+    """
+    content: str
+    """
+    Number of messages, from the start of the session, folded into the summary
+    """
+    until: int
+
+    def to_dict(self) -> dict:
+        return {
+            "content": self.content,
+            "until": self.until
         }
 
+    @staticmethod
+    def from_dict(data: dict) -> "SessionSummaryDto":
+        return SessionSummaryDto(
+            content=data["content"],
+            until=data["until"]
+        )
+
 
 @dataclass
 class GetGameSessionDto:
@@ -27,12 +56,76 @@ class GetGameSessionDto:
     user: str
     messages: List[CreateMessageDto]
     prompt: Optional[GetPromptDto]
+    """
+    Number of messages of the session. The sequence numbers of the messages go from 0 to message_count - 1
+    """
+    message_count: Optional[int] = None
+    """
+    Why the opening turn could not be generated. POST /chat without a message generates it again
+    """
+    opening_error: Optional[str] = None
+
+    @staticmethod
+    def response_dict_from_documents(session: dict, messages: List[dict]) -> dict:
+        """
+        Build the GET /chat response straight from the session and message documents, in the format of
+        GetGameSessionDto. The message documents must not be used afterwards
+        :param session: game-sessions document
+        :param messages: message documents, oldest first
+        :return:
+        """
+        prompt = session.get("prompt")
+        return {
+            "user": session["user"],
+            "messages": [GetMessageDto.response_dict_from_document(message) for message in messages],
+            "prompt": GetPromptDto.from_dict(prompt).to_dict() if prompt is not None else session.get("prompt_name"),
+            "message_count": session.get("message_count"),
+            "opening_error": session.get("opening_error")
+        }
+
+
+@dataclass(slots=True)
+class GameSessionDto:
+    """
+    Game session as stored in the database, with the messages needed for the next turn
+    """
+    id: ObjectId
+    user: str
+    prompt_name: str
+    """
+    Number of messages of the session, which is also the sequence number of the next message
+    """
+    message_count: int
+    """
+    Sequence number of the first message in messages
+    """
+    first_seq: int
+    """
+    Messages from first_seq on in the chat gpt format, as loaded from the database
+    """
+    messages: List[dict]
+    summary: Optional[SessionSummaryDto] = None
+    prompt: Optional[GetPromptDto] = None
+    """
+    Id of the turn that holds the lock on the session
+    """
+    turn_id: Optional[str] = None
 
     @staticmethod
-    def from_dict(data: dict) -> "GetGameSessionDto":
-        return GetGameSessionDto(
+    def from_dict(data: dict, messages: List[dict], first_seq: int) -> "GameSessionDto":
+        """
+        :param data: game-sessions document
+        :param messages: message documents with only the role and the content, see MessageStore.find
+        :param first_seq: sequence number of the first message
+        :return:
+        """
+        return GameSessionDto(
+            id=data["_id"],
             user=data["user"],
-            messages=[GetMessageDto.from_dict(message) for message in data["messages"]],
-            prompt=GetPromptDto.from_dict(data.get("prompt")) if data.get("prompt") is not None else data.get(
-                "prompt_name")
+            prompt_name=data["prompt_name"],
+            message_count=data.get("message_count", 0),
+            first_seq=first_seq,
+            messages=messages,
+            summary=SessionSummaryDto.from_dict(data["summary"]) if data.get("summary") is not None else None,
+            turn_id=data["turn"]["id"] if data.get("turn") is not None else None
         )
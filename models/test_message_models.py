@@ -1,6 +1,7 @@
 from unittest import TestCase
 
-from models.message_models import CreateMessageDto, Role
+from models.message_models import CreateMessageDto, GetMessageDto, Role
+from utils.get_selections import GameMessageWithSelections, PARSER_VERSION, to_stored_selections
 
 
 class TestCreateMessageDto(TestCase):
@@ -13,3 +14,29 @@ class TestCreateMessageDto(TestCase):
         )
         message.render(extra_data={"name": "John"})
         self.assertEqual(message.content, "Hello John")
+
+    def test_to_dict_stores_parsed_selections(self):
+        message = CreateMessageDto(
+            role=Role.ASSISTANT,
+            content="Hello\n---selections---\n1. selection 1\n---end selections---",
+            audio=None,
+            image=None
+        )
+        self.assertNotIn("parsed", message.to_dict())
+        message.parse()
+        self.assertEqual(message.to_dict()["parsed"]["selections"], ["1. selection 1"])
+
+
+class TestGetMessageDto(TestCase):
+    def test_stored_selections_are_used(self):
+        stored = to_stored_selections(GameMessageWithSelections(message="stored", selections=["1. stored"]))
+        response = GetMessageDto.response_dict_from_document({"role": "assistant", "content": "content",
+                                                              "parsed": stored, "seq": 1})
+        self.assertEqual(response, {"role": "assistant", "content": {"message": "stored", "selections": ["1. stored"]},
+                                    "image": None, "audio": None, "seq": 1})
+
+    def test_outdated_selections_are_parsed_again(self):
+        stored = {"message": "stored", "selections": [], "version": PARSER_VERSION - 1}
+        response = GetMessageDto.response_dict_from_document({
+            "role": "assistant", "content": "content\n---selections---\n1. selection 1\n", "parsed": stored})
+        self.assertEqual(response["content"], {"message": "content\n", "selections": ["1. selection 1"]})
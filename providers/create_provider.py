@@ -0,0 +1,53 @@
+from typing import Optional
+
+from providers.llm_provider import LLMProvider
+from providers.media_generator import MediaGenerator
+
+
+def create_llm_provider(name: Optional[str], api_key: Optional[str], use_async_client: bool = True,
+                        api_base: str = "https://api.openai.com/v1", pool_size: int = 100, timeout: float = 60,
+                        max_retries: int = 3, stub_latency: float = 0, stub_token_latency: float = 0) -> LLMProvider:
+    """
+    Create the language model provider
+    :param name: openai, openai-sdk or stub. Defaults to openai in async mode and openai-sdk otherwise
+    :param api_key: openai api key
+    :param use_async_client: whether the async mode is enabled
+    :param api_base: base url of the openai api
+    :param pool_size: maximum number of open connections to the api
+    :param timeout: deadline of a call in seconds, including retries
+    :param max_retries: maximum number of retries of a call
+    :param stub_latency: seconds until the first token of the stub
+    :param stub_token_latency: seconds between two chunks of the stub
+    :return:
+    """
+    if name is None:
+        name = "openai" if use_async_client else "openai-sdk"
+
+    # imported on demand, so that the stub doesn't need the openai dependencies
+    if name == "openai":
+        from providers.openai_provider import OpenAIProvider
+        return OpenAIProvider(api_key=api_key, api_base=api_base, pool_size=pool_size, timeout=timeout,
+                              max_retries=max_retries)
+    if name == "openai-sdk":
+        from providers.openai_sdk_provider import OpenAISDKProvider
+        return OpenAISDKProvider(api_key=api_key, timeout=timeout, max_retries=max_retries)
+    if name == "stub":
+        from providers.stub_provider import StubProvider
+        return StubProvider(latency=stub_latency, token_latency=stub_token_latency, timeout=timeout,
+                            max_retries=max_retries)
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def create_media_generator(name: Optional[str], stub_latency: float = 0) -> Optional[MediaGenerator]:
+    """
+    Create the generator of the audio and image of the replies
+    :param name: stub, or None to disable the media pipeline
+    :param stub_latency: seconds until the assets of the stub are ready
+    :return:
+    """
+    if name is None or name == "none":
+        return None
+    if name == "stub":
+        from providers.stub_media_generator import StubMediaGenerator
+        return StubMediaGenerator(latency=stub_latency)
+    raise ValueError(f"Unknown media generator: {name}")
@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+@dataclass
+class Completion:
+    content: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class LLMProviderError(Exception):
+    """
+    Error of a language model provider
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        """
+        :param message: error message
+        :param status_code: http status code returned by the provider, if any
+        :param retryable: the same request may succeed later, e.g. after a 429 or a 5xx
+        :param retry_after: seconds to wait before retrying, as requested by the provider
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(LLMProviderError):
+    def __init__(self, message: str = "The language model did not answer in time"):
+        super().__init__(message, retryable=True)
+
+
+class LLMProvider(ABC):
+    """
+    Chat completion backend used by the GameController.
+    Retryable errors are retried with exponential backoff and full jitter, within the deadline of the call.
+    """
+
+    def __init__(self, timeout: float = 60, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8):
+        """
+        :param timeout: default deadline of a call in seconds, including retries
+        :param max_retries: maximum number of retries after the first attempt
+        :param backoff_base: backoff before the first retry in seconds
+        :param backoff_max: maximum backoff in seconds
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @abstractmethod
+    async def complete(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> Completion:
+        """
+        Create a chat completion
+        :param messages: messages in the chat gpt format
+        :param model: model name
+        :param timeout: deadline of the call in seconds. Defaults to the timeout of the provider
+        :return:
+        """
+
+    @abstractmethod
+    async def stream(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Create a chat completion and stream it. Errors before the first chunk are raised by this call
+        :param messages: messages in the chat gpt format
+        :param model: model name
+        :param timeout: deadline until the response starts in seconds. Defaults to the timeout of the provider
+        :return: iterator of the content chunks
+        """
+
+    async def close(self):
+        """
+        Release the connections of the provider
+        :return:
+        """
+        pass
+
+    async def __retry__(self, call: Callable[[float], Awaitable[T]], timeout: Optional[float]) -> T:
+        """
+        Run a call and retry it on retryable errors
+        :param call: called with the remaining seconds until the deadline
+        :param timeout: deadline in seconds
+        :return: result of the call
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError()
+            try:
+                return await asyncio.wait_for(call(remaining), timeout=remaining)
+            except asyncio.TimeoutError:
+                error = LLMTimeoutError()
+            except LLMProviderError as e:
+                error = e
+            if not error.retryable or attempt >= self.max_retries:
+                raise error
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if error.retry_after is not None:
+                backoff = max(backoff, error.retry_after)
+            if time.monotonic() + backoff >= deadline:
+                raise error
+            await asyncio.sleep(backoff)
+            attempt += 1
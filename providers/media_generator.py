@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass
+class MediaAsset:
+    """
+    Asset rendered for a message. kind is the field of the message the asset is for: audio or image
+    """
+    kind: str
+    data: bytes
+    content_type: str
+    """
+    File extension of the stored object, without the dot
+    """
+    extension: str
+
+
+class MediaGenerator(ABC):
+    """
+    Renders the assets of a turn, e.g. the narration of a reply or an image of the scene.
+    Called by the MediaPipeline in the background, after the turn was saved
+    """
+
+    @abstractmethod
+    async def generate(self, content: str) -> List[MediaAsset]:
+        """
+        Render the assets of a reply
+        :param content: narrative text of the reply, without the selections
+        :return: at most one asset per kind
+        """
+
+    async def close(self):
+        pass
@@ -0,0 +1,118 @@
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+
+import aiohttp
+
+from providers.llm_provider import Completion, LLMProvider, LLMProviderError
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    OpenAI chat completion API over a pooled aiohttp session, so that connections are reused between calls
+    """
+
+    def __init__(self, api_key: str, api_base: str = "https://api.openai.com/v1", pool_size: int = 100,
+                 connect_timeout: float = 5, **kwargs):
+        """
+        :param api_key: openai api key
+        :param api_base: base url of the api
+        :param pool_size: maximum number of open connections
+        :param connect_timeout: seconds to establish a connection
+        """
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.api_base = api_base.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def complete(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> Completion:
+        async def call(remaining: float) -> Completion:
+            try:
+                async with self.__post__({"model": model, "messages": messages}, timeout=remaining) as response:
+                    await self.__raise_for_status__(response)
+                    data = await response.json()
+            except aiohttp.ClientError as e:
+                raise LLMProviderError(f"Failed to call the language model: {e}", retryable=True) from e
+            usage = data.get("usage") or {}
+            return Completion(
+                content=data["choices"][0]["message"]["content"],
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+            )
+
+        return await self.__retry__(call, timeout=timeout)
+
+    async def stream(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        async def call(remaining: float) -> aiohttp.ClientResponse:
+            # only the time until the response starts is limited. The stream itself is limited by the read timeout
+            try:
+                response = await self.__post__({"model": model, "messages": messages, "stream": True}, timeout=None)
+            except aiohttp.ClientError as e:
+                raise LLMProviderError(f"Failed to call the language model: {e}", retryable=True) from e
+            try:
+                await self.__raise_for_status__(response)
+            except LLMProviderError:
+                response.release()
+                raise
+            return response
+
+        response = await self.__retry__(call, timeout=timeout)
+        return self.__read_events__(response)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def __get_session__(self) -> aiohttp.ClientSession:
+        # created lazily, since the session has to be created inside the event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._session
+
+    def __post__(self, body: dict, timeout: Optional[float]):
+        return self.__get_session__().post(
+            f"{self.api_base}/chat/completions",
+            json=body,
+            timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=self.connect_timeout,
+                                          sock_read=self.timeout),
+        )
+
+    async def __raise_for_status__(self, response: aiohttp.ClientResponse):
+        if response.status < 400:
+            return
+        retry_after = response.headers.get("Retry-After")
+        try:
+            message = (await response.json())["error"]["message"]
+        except Exception:
+            message = await response.text()
+        raise LLMProviderError(
+            message,
+            status_code=response.status,
+            retryable=response.status in RETRYABLE_STATUS_CODES,
+            retry_after=float(retry_after) if retry_after is not None and retry_after.isdigit() else None,
+        )
+
+    async def __read_events__(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        try:
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                content = json.loads(data)["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMProviderError(f"The stream was interrupted: {e}") from e
+        finally:
+            response.release()
@@ -0,0 +1,55 @@
+from typing import AsyncIterator, List, Optional
+
+import openai
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from providers.llm_provider import Completion, LLMProvider, LLMProviderError
+
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.APIError, openai.error.Timeout,
+                    openai.error.APIConnectionError, openai.error.ServiceUnavailableError)
+
+
+class OpenAISDKProvider(LLMProvider):
+    """
+    Blocking openai client running in the threadpool. Used when the async mode is disabled
+    """
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        openai.api_key = api_key
+
+    async def complete(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> Completion:
+        async def call(remaining: float) -> Completion:
+            response = await self.__create__(model=model, messages=messages, request_timeout=remaining)
+            usage = response.get("usage") or {}
+            return Completion(
+                content=response['choices'][0]['message']['content'],
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+            )
+
+        return await self.__retry__(call, timeout=timeout)
+
+    async def stream(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        async def call(remaining: float):
+            return await self.__create__(model=model, messages=messages, stream=True, request_timeout=remaining)
+
+        chunks = await self.__retry__(call, timeout=timeout)
+        return self.__read_chunks__(chunks)
+
+    async def __create__(self, **kwargs):
+        try:
+            return await run_in_threadpool(openai.ChatCompletion.create, **kwargs)
+        except openai.error.OpenAIError as e:
+            raise LLMProviderError(str(e), status_code=e.http_status,
+                                   retryable=isinstance(e, RETRYABLE_ERRORS)) from e
+
+    @staticmethod
+    async def __read_chunks__(chunks) -> AsyncIterator[str]:
+        try:
+            async for chunk in iterate_in_threadpool(chunks):
+                content = chunk['choices'][0]['delta'].get('content')
+                if content:
+                    yield content
+        except openai.error.OpenAIError as e:
+            raise LLMProviderError(f"The stream was interrupted: {e}") from e
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import io
+import math
+import struct
+import wave
+from typing import List
+from xml.sax.saxutils import escape
+
+from providers.media_generator import MediaAsset, MediaGenerator
+
+SAMPLE_RATE = 8000
+
+
+class StubMediaGenerator(MediaGenerator):
+    """
+    Local generator for development and tests: a tone as narration and an svg card with the first line as the scene.
+    Both are derived from a hash of the content, so the same reply always gets the same assets
+    """
+
+    def __init__(self, latency: float = 0, audio: bool = True, image: bool = True, duration: float = 1.0):
+        """
+        :param latency: seconds until the assets are ready
+        :param audio: render the narration
+        :param image: render the scene
+        :param duration: seconds of the narration
+        """
+        self.latency = latency
+        self.audio = audio
+        self.image = image
+        self.duration = duration
+
+    async def generate(self, content: str) -> List[MediaAsset]:
+        await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(content.encode("utf-8")).digest()
+        assets = []
+        if self.audio:
+            assets.append(MediaAsset(kind="audio", data=self.__tone__(digest), content_type="audio/wav",
+                                     extension="wav"))
+        if self.image:
+            assets.append(MediaAsset(kind="image", data=self.__card__(digest, content), content_type="image/svg+xml",
+                                     extension="svg"))
+        return assets
+
+    def __tone__(self, digest: bytes) -> bytes:
+        frequency = 220 + digest[0] * 2
+        frames = int(SAMPLE_RATE * self.duration)
+        samples = struct.pack(f"<{frames}h", *(int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+                                               for i in range(frames)))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(samples)
+        return buffer.getvalue()
+
+    @staticmethod
+    def __card__(digest: bytes, content: str) -> bytes:
+        lines = content.strip().splitlines()
+        title = escape(lines[0][:40] if len(lines) > 0 else "")
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="512" height="288">'
+                f'<rect width="100%" height="100%" fill="#{digest[:3].hex()}"/>'
+                f'<text x="24" y="152" font-size="20" fill="#fff">{title}</text></svg>').encode("utf-8")
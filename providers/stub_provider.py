@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, List, Optional
+
+from providers.llm_provider import Completion, LLMProvider
+from utils.context_window import count_tokens
+from utils.get_selections import SELECTIONS_END, SELECTIONS_START
+
+
+class StubProvider(LLMProvider):
+    """
+    Local backend that answers without network calls, for development, tests and load testing.
+    The reply is derived from a hash of the messages, so the same request always gets the same reply
+    """
+
+    def __init__(self, latency: float = 0, token_latency: float = 0, chunk_size: int = 8, **kwargs):
+        """
+        :param latency: seconds until the first token
+        :param token_latency: seconds between two chunks
+        :param chunk_size: characters per streamed chunk
+        """
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_size = chunk_size
+
+    async def complete(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> Completion:
+        async def call(remaining: float) -> Completion:
+            content = self.__reply__(messages, model)
+            await asyncio.sleep(self.latency + self.token_latency * self.__count_chunks__(content))
+            return Completion(
+                content=content,
+                prompt_tokens=sum(count_tokens(message["content"]) for message in messages),
+                completion_tokens=count_tokens(content),
+            )
+
+        return await self.__retry__(call, timeout=timeout)
+
+    async def stream(self, messages: List[dict], model: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        async def call(remaining: float) -> str:
+            await asyncio.sleep(self.latency)
+            return self.__reply__(messages, model)
+
+        content = await self.__retry__(call, timeout=timeout)
+        return self.__stream_chunks__(content)
+
+    async def __stream_chunks__(self, content: str) -> AsyncIterator[str]:
+        for start in range(0, len(content), self.chunk_size):
+            if start > 0 and self.token_latency > 0:
+                await asyncio.sleep(self.token_latency)
+            yield content[start:start + self.chunk_size]
+
+    def __count_chunks__(self, content: str) -> int:
+        return max(0, (len(content) - 1) // self.chunk_size)
+
+    @staticmethod
+    def __reply__(messages: List[dict], model: str) -> str:
+        digest = hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode("utf-8")).hexdigest()
+        return (
+            f"You are standing in room {digest[:6]}. The air is still and the path splits ahead.\n"
+            f"{SELECTIONS_START}\n"
+            f"1. Go left towards {digest[6:10]}\n"
+            f"2. Go right towards {digest[10:14]}\n"
+            f"3. Wait and listen\n"
+            f"{SELECTIONS_END}"
+        )
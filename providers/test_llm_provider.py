@@ -0,0 +1,77 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from providers.llm_provider import LLMProviderError, LLMTimeoutError
+from providers.stub_provider import StubProvider
+from utils.get_selections import get_selections
+
+
+class TestRetry(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.provider = StubProvider(timeout=1, max_retries=2, backoff_base=0.001, backoff_max=0.001)
+        self.attempts = 0
+
+    async def test_retries_retryable_errors(self):
+        async def call(remaining: float) -> str:
+            self.attempts += 1
+            if self.attempts < 3:
+                raise LLMProviderError("busy", status_code=503, retryable=True)
+            return "ok"
+
+        self.assertEqual(await self.provider.__retry__(call, timeout=None), "ok")
+        self.assertEqual(self.attempts, 3)
+
+    async def test_gives_up_after_max_retries(self):
+        async def call(remaining: float) -> str:
+            self.attempts += 1
+            raise LLMProviderError("busy", status_code=503, retryable=True)
+
+        with self.assertRaises(LLMProviderError):
+            await self.provider.__retry__(call, timeout=None)
+        self.assertEqual(self.attempts, 3)
+
+    async def test_does_not_retry_other_errors(self):
+        async def call(remaining: float) -> str:
+            self.attempts += 1
+            raise LLMProviderError("bad request", status_code=400)
+
+        with self.assertRaises(LLMProviderError):
+            await self.provider.__retry__(call, timeout=None)
+        self.assertEqual(self.attempts, 1)
+
+    async def test_timeout(self):
+        async def call(remaining: float) -> str:
+            await asyncio.sleep(1)
+            return "ok"
+
+        with self.assertRaises(LLMTimeoutError):
+            await self.provider.__retry__(call, timeout=0.05)
+
+    async def test_does_not_wait_past_the_deadline(self):
+        async def call(remaining: float) -> str:
+            self.attempts += 1
+            raise LLMProviderError("busy", status_code=429, retryable=True, retry_after=10)
+
+        with self.assertRaises(LLMProviderError):
+            await self.provider.__retry__(call, timeout=0.5)
+        self.assertEqual(self.attempts, 1)
+
+
+class TestStubProvider(IsolatedAsyncioTestCase):
+    async def test_reply_is_deterministic(self):
+        provider = StubProvider()
+        messages = [{"role": "user", "content": "hello"}]
+        first = await provider.complete(messages, model="model")
+        second = await provider.complete(messages, model="model")
+        self.assertEqual(first.content, second.content)
+        other = await provider.complete([{"role": "user", "content": "bye"}], model="model")
+        self.assertNotEqual(first.content, other.content)
+        self.assertEqual(len(get_selections(first.content).selections), 3)
+
+    async def test_stream_matches_complete(self):
+        provider = StubProvider(chunk_size=5)
+        messages = [{"role": "user", "content": "hello"}]
+        completion = await provider.complete(messages, model="model")
+        chunks = [chunk async for chunk in await provider.stream(messages, model="model")]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), completion.content)
@@ -0,0 +1,45 @@
+"""
+Store the parsed selections with the messages of existing game sessions.
+Run scripts.migrate_messages first, so that all messages are in the game-messages collection.
+Only messages without selections or with selections of another parser version are updated.
+
+Run with: DB_URL=... python -m scripts.backfill_selections
+"""
+import logging
+import os
+
+import certifi
+from pymongo import MongoClient, UpdateOne
+
+from utils.get_selections import PARSER_VERSION, get_selections, to_stored_selections
+
+BATCH_SIZE = 100
+
+
+def backfill_selections(client: MongoClient, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Backfill the parsed selections
+    :param client: mongo client
+    :param batch_size: number of messages updated per bulk write
+    :return: number of updated messages
+    """
+    collection = client["gamebot"]["game-messages"]
+    messages = collection.find({"parsed.version": {"$ne": PARSER_VERSION}}, projection={"content": 1})
+    updated = 0
+    operations = []
+    for message in messages:
+        parsed = to_stored_selections(get_selections(message["content"]))
+        operations.append(UpdateOne({"_id": message["_id"]}, {"$set": {"parsed": parsed}}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if len(operations) > 0:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    db_url = os.getenv("DB_URL")
+    mongo_client = MongoClient(db_url, tlsCAFile=certifi.where() if db_url.startswith("mongodb+srv") else None)
+    logging.info(f"Updated {backfill_selections(mongo_client)} messages")
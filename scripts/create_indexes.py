@@ -0,0 +1,21 @@
+"""
+Create the indexes of all collections. Run it once per deployment, e.g. as a release step, and start the workers
+with CREATE_INDEXES_ON_STARTUP=false. Safe to run multiple times.
+
+Run with: DB_URL=... python -m scripts.create_indexes
+"""
+import asyncio
+import logging
+
+
+async def create_indexes():
+    # the app creates its clients lazily, so importing it doesn't connect to anything
+    from main import index_bootstrap
+
+    await index_bootstrap.create_indexes()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(create_indexes())
+    logging.info("Indexes created")
@@ -0,0 +1,37 @@
+"""
+Move the messages embedded in the game-sessions documents to the game-messages collection.
+Sessions that are not migrated yet are also migrated when they are first loaded, so this can run while serving.
+
+Run with: DB_URL=... python -m scripts.migrate_messages
+"""
+import asyncio
+import logging
+import os
+
+from controllers.message_store import MessageStore
+from utils.mongo import AsyncMongoClient, create_mongo_client
+
+
+async def migrate_messages(client: AsyncMongoClient) -> int:
+    """
+    Migrate all sessions with embedded messages
+    :param client: mongo client
+    :return: number of migrated sessions
+    """
+    message_store = MessageStore(client=client)
+    await message_store.create_indexes()
+    migrated = 0
+    sessions = message_store.sessions.find({"messages": {"$exists": True}}, projection={"_id": 1})
+    for session in await sessions.to_list(length=None):
+        # load each session right before migrating it, so that a batch of large documents isn't held in memory
+        session = await message_store.sessions.find_one({"_id": session["_id"]})
+        if session is not None and session.get("messages") is not None:
+            await message_store.migrate(session)
+            migrated += 1
+    return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    mongo_client = create_mongo_client(os.getenv("DB_URL"), use_async_driver=True)
+    logging.info(f"Migrated {asyncio.run(migrate_messages(mongo_client))} sessions")
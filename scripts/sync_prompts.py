@@ -0,0 +1,37 @@
+"""
+Insert or update the prompts of the prompts directory in one bulk write. Files whose content didn't change since
+the last sync are skipped. With --watch, changes are pushed as the files are saved until the script is stopped.
+The running workers pick the new prompts up within PROMPT_CACHE_REFRESH_INTERVAL.
+
+Run with: DB_URL=... python -m scripts.sync_prompts [--directory prompts] [--watch]
+"""
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from controllers.prompt_sync import PromptSync
+
+
+async def sync_prompts(directory: Path, watch: bool):
+    # the app creates its clients lazily, so importing it doesn't connect to anything
+    from main import prompt_controller
+
+    prompt_sync = PromptSync(prompt_controller=prompt_controller, directory=directory)
+    changed = await prompt_sync.sync()
+    logging.info(f"{len(changed)} prompts written")
+    if watch:
+        logging.info(f"Watching {directory}")
+        await prompt_sync.watch()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", type=Path, default=Path(__file__).parent.parent / "prompts")
+    parser.add_argument("--watch", action="store_true", help="keep pushing the changes of the files")
+    args = parser.parse_args()
+    try:
+        asyncio.run(sync_prompts(args.directory, watch=args.watch))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Tokens added by the chat format for every message, and once to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 2
+SUMMARY_PREFIX = "Summary of the earlier part of the game:\n"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer, so that it works offline.
+    Ascii text averages about 4 characters per token. Other characters, such as Chinese, are counted as
+    1.5 tokens each, which errs on the side of overestimating.
+    :param text: text
+    :return: estimated number of tokens
+    """
+    characters = len(text)
+    # ascii characters take one byte in utf-8, the CJK characters used in the prompts take three
+    wide_characters = (len(text.encode("utf-8")) - characters) // 2
+    ascii_characters = characters - wide_characters
+    return (ascii_characters + 3) // 4 + (wide_characters * 3 + 1) // 2
+
+
+def count_message_tokens(message: dict) -> int:
+    """
+    Estimate the number of tokens of a message in the chat gpt format
+    :param message: message
+    :return:
+    """
+    return TOKENS_PER_MESSAGE + count_tokens(message["content"])
+
+
+@dataclass
+class ContextWindow:
+    """
+    Messages to send to the model
+    """
+    messages: List[dict]
+    """
+    Index of the first history message that is sent verbatim. Older messages are only sent through the summary
+    """
+    first_kept: int
+    tokens: int
+
+
+def build_context(system_message: dict, history: List[dict], budget: int,
+                  summary: Optional[str] = None) -> ContextWindow:
+    """
+    Build the messages for the model within a token budget.
+    The system message and the summary are always sent, followed by the most recent messages that fit.
+    The last message is always sent, even if it doesn't fit.
+    :param system_message: system message in the chat gpt format
+    :param history: previous messages in the chat gpt format, oldest first
+    :param budget: maximum number of tokens of the request
+    :param summary: summary of the older messages
+    :return:
+    """
+    head = [system_message]
+    if summary:
+        head.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+    tokens = TOKENS_PER_REPLY + sum(count_message_tokens(message) for message in head)
+
+    first_kept = len(history)
+    while first_kept > 0:
+        message_tokens = count_message_tokens(history[first_kept - 1])
+        if tokens + message_tokens > budget and first_kept < len(history):
+            break
+        tokens += message_tokens
+        first_kept -= 1
+    return ContextWindow(messages=head + history[first_kept:], first_kept=first_kept, tokens=tokens)
+
+
+def select_messages_to_summarize(history: List[dict], start: int, end: int, budget: int) -> int:
+    """
+    Select the messages to fold into the summary in one request, so that the request stays within the budget
+    :param history: messages in the chat gpt format
+    :param start: index of the first message that is not summarized yet
+    :param end: index of the first message that is still sent verbatim
+    :param budget: maximum number of tokens of the selected messages
+    :return: index after the last selected message. At least one message is selected if start < end
+    """
+    tokens = 0
+    position = start
+    while position < end:
+        tokens += count_message_tokens(history[position])
+        if tokens > budget and position > start:
+            break
+        position += 1
+    return position
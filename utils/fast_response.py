@@ -0,0 +1,146 @@
+import gzip
+import json
+from typing import Optional
+
+from fastapi.responses import Response
+
+# Optional dependencies. Without them the responses are encoded with the standard library and only gzip is offered
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def dumps_json(content) -> bytes:
+    """
+    Encode plain dicts, lists and scalars as json, with orjson when it is installed
+    :param content: content made of json types only
+    :return: utf-8 encoded json
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parse_quality_values(header: Optional[str]) -> dict:
+    """
+    Parse a header such as Accept-Encoding: gzip;q=0.8, br
+    :param header: header value
+    :return: quality by lower case value. Values with an invalid quality are ignored
+    """
+    qualities = {}
+    if header is None:
+        return qualities
+    for part in header.split(","):
+        value, _, parameters = part.partition(";")
+        value = value.strip().lower()
+        if value == "":
+            continue
+        quality = 1.0
+        for parameter in parameters.split(";"):
+            name, _, number = parameter.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = -1.0
+        if quality >= 0:
+            qualities[value] = quality
+    return qualities
+
+
+class ResponseEncoder:
+    """
+    Encodes large responses without the generic encoder of FastAPI: the content is built as plain dicts by the
+    caller, encoded with orjson, or with MessagePack when the client asks for it, and compressed with brotli or gzip
+    when the client accepts it and the body is larger than a threshold.
+    """
+
+    def __init__(self, compression_min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 msgpack_enabled: bool = True):
+        """
+        :param compression_min_size: bodies of fewer bytes are sent uncompressed. Negative values disable compression
+        :param gzip_level: gzip compression level, 1 to 9
+        :param brotli_quality: brotli quality, 0 to 11. Levels above 5 cost a lot of CPU for a few percent
+        :param msgpack_enabled: answer Accept: application/msgpack with MessagePack
+        """
+        self.compression_min_size = compression_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.msgpack_enabled = msgpack_enabled
+
+    def configure(self, compression_min_size: int, gzip_level: int, brotli_quality: int, msgpack_enabled: bool):
+        self.compression_min_size = compression_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.msgpack_enabled = msgpack_enabled
+
+    def response(self, content, accept: Optional[str] = None, accept_encoding: Optional[str] = None,
+                 status_code: int = 200) -> Response:
+        """
+        Build the response for a content
+        :param content: plain dicts, lists and scalars
+        :param accept: Accept header of the request
+        :param accept_encoding: Accept-Encoding header of the request
+        :param status_code: status code of the response
+        :return:
+        """
+        media_type = self.negotiate_media_type(accept)
+        if media_type == JSON_MEDIA_TYPE:
+            body = dumps_json(content)
+        else:
+            body = msgpack.packb(content, use_bin_type=True)
+        headers = {"Vary": "Accept, Accept-Encoding"}
+        encoding = self.negotiate_encoding(accept_encoding) if 0 <= self.compression_min_size <= len(body) else None
+        if encoding is not None:
+            body = self.compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+    def negotiate_media_type(self, accept: Optional[str]) -> str:
+        """
+        :param accept: Accept header of the request
+        :return: MessagePack if the client prefers it and it is available, json otherwise
+        """
+        if not self.msgpack_enabled or msgpack is None or accept is None:
+            return JSON_MEDIA_TYPE
+        qualities = parse_quality_values(accept)
+        for media_type in MSGPACK_MEDIA_TYPES:
+            quality = qualities.get(media_type, 0)
+            if quality > 0 and quality >= qualities.get(JSON_MEDIA_TYPE, 0):
+                return media_type
+        return JSON_MEDIA_TYPE
+
+    def negotiate_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        :param accept_encoding: Accept-Encoding header of the request
+        :return: br or gzip, whichever the client accepts with the higher quality, with br winning ties.
+        None to send the body uncompressed
+        """
+        qualities = parse_quality_values(accept_encoding)
+        wildcard = qualities.get("*", 0)
+        candidates = []
+        if brotli is not None:
+            candidates.append((qualities.get("br", wildcard), 1, "br"))
+        candidates.append((qualities.get("gzip", wildcard), 0, "gzip"))
+        quality, _, encoding = max(candidates)
+        return encoding if quality > 0 else None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+response_encoder = ResponseEncoder()
@@ -1,8 +1,14 @@
 from dataclasses import dataclass
+from enum import Enum
 from typing import List, Optional
 
+# Bump when the output of the parser changes, so that selections stored with the messages are parsed again
+PARSER_VERSION = 1
+SELECTIONS_START = "---selections---"
+SELECTIONS_END = "---end selections---"
 
-@dataclass
+
+@dataclass(slots=True)
 class GameMessageWithSelections:
     """
     message without selections
@@ -11,44 +17,177 @@ class GameMessageWithSelections:
     selections: List[str]
 
 
+class SelectionEventType(Enum):
+    TEXT = "text"
+    SELECTION = "selection"
+
+
+@dataclass(slots=True)
+class SelectionEvent:
+    type: SelectionEventType
+    content: str
+
+
+class SelectionsParser:
+    """
+    Incremental parser for messages with the format:
+    some text content
+    ---selections---
+    selection 1
+    selection 2
+    ---end selections---
+
+    Text is fed in chunks as it arrives. Narrative text is emitted as soon as it can't be the start of a
+    selections marker, and each selection is emitted once its line is complete. Markers split across chunks are handled.
+    """
+
+    def __init__(self):
+        self.in_selections = False
+        self.closed = False
+        # parts of the current line that have not been emitted yet
+        self._pending: List[str] = []
+        # the current line is narrative text and has been partially emitted already
+        self._line_is_text = False
+        self._text: List[str] = []
+        self._selections: List[str] = []
+
+    def feed(self, chunk: str) -> List[SelectionEvent]:
+        """
+        Feed a chunk of the message
+        :param chunk: next chunk of text
+        :return: events that are confirmed by this chunk
+        """
+        if self.closed:
+            raise ValueError("Parser is already closed")
+        events: List[SelectionEvent] = []
+        if len(self._pending) > 0:
+            if self.in_selections and "\n" not in chunk:
+                # selections are only emitted once the line is complete
+                self._pending.append(chunk)
+                return events
+            self._pending.append(chunk)
+            chunk = "".join(self._pending)
+            self._pending = []
+
+        position = 0
+        if self._line_is_text:
+            newline = chunk.find("\n")
+            if newline == -1:
+                self.__emit__(events, SelectionEventType.TEXT, chunk)
+                return events
+            self._line_is_text = False
+            position = newline + 1
+            self.__emit__(events, SelectionEventType.TEXT, chunk[:position])
+
+        while position < len(chunk):
+            if self.in_selections:
+                newline = chunk.find("\n", position)
+                if newline == -1:
+                    self._pending = [chunk[position:]]
+                    break
+                self.__classify_line__(chunk[position:newline], events, ending="\n")
+                position = newline + 1
+            else:
+                position = self.__scan_text__(chunk, position, events)
+        return events
+
+    def close(self) -> List[SelectionEvent]:
+        """
+        Signal the end of the message and flush the last line
+        :return: remaining events
+        """
+        events: List[SelectionEvent] = []
+        if not self.closed and len(self._pending) > 0:
+            self.__classify_line__("".join(self._pending), events, ending="")
+        self._pending = []
+        self.closed = True
+        return events
+
+    def result(self) -> GameMessageWithSelections:
+        """
+        Message and selections of everything that has been emitted so far
+        :return:
+        """
+        return GameMessageWithSelections(message="".join(self._text), selections=list(self._selections))
+
+    def __emit__(self, events: List[SelectionEvent], event_type: SelectionEventType, content: str):
+        if event_type == SelectionEventType.TEXT:
+            self._text.append(content)
+        else:
+            self._selections.append(content)
+        events.append(SelectionEvent(type=event_type, content=content))
+
+    def __classify_line__(self, line: str, events: List[SelectionEvent], ending: str):
+        stripped = line.strip()
+        if self.in_selections:
+            if stripped == SELECTIONS_END:
+                self.in_selections = False
+            elif len(stripped) > 0:
+                self.__emit__(events, SelectionEventType.SELECTION, stripped)
+        elif stripped == SELECTIONS_START:
+            self.in_selections = True
+        elif len(line) > 0 or len(ending) > 0:
+            self.__emit__(events, SelectionEventType.TEXT, line + ending)
+
+    def __scan_text__(self, chunk: str, position: int, events: List[SelectionEvent]) -> int:
+        """
+        Emit the narrative text starting at position, up to the next start marker
+        :return: position after the consumed text
+        """
+        search = position
+        marker = chunk.find(SELECTIONS_START, search)
+        while marker != -1:
+            line_start = chunk.rfind("\n", position, marker) + 1 or position
+            line_end = chunk.find("\n", marker)
+            after_marker = chunk[marker + len(SELECTIONS_START):line_end if line_end != -1 else len(chunk)]
+            if chunk[line_start:marker].strip() == "" and after_marker.strip() == "":
+                if line_start > position:
+                    self.__emit__(events, SelectionEventType.TEXT, chunk[position:line_start])
+                if line_end == -1:
+                    # the line may still continue in the next chunk
+                    self._pending = [chunk[line_start:]]
+                    return len(chunk)
+                self.in_selections = True
+                return line_end + 1
+            search = marker + 1
+            marker = chunk.find(SELECTIONS_START, search)
+
+        last_line_start = chunk.rfind("\n", position) + 1 or position
+        if last_line_start > position:
+            self.__emit__(events, SelectionEventType.TEXT, chunk[position:last_line_start])
+        if last_line_start < len(chunk):
+            line = chunk[last_line_start:]
+            candidate = line.lstrip()
+            if SELECTIONS_START.startswith(candidate):
+                # may still become the start marker
+                self._pending = [line]
+            else:
+                self._line_is_text = True
+                self.__emit__(events, SelectionEventType.TEXT, line)
+        return len(chunk)
+
+
 def get_selections(message: str) -> GameMessageWithSelections:
     """
     Get selections from message
     :param message:  to get selections from
     :return: message with selections
     """
-    # Message is with format:
-    # some text content
-    # ---selections---
-    # selection 1
-    # selection 2
-    # ---end selections---
-
-    # split message into lines
-    lines = message.splitlines()
-    selections: List[str] = []
-    message_without_selections = ""
-    entered_selections = False
-
-    # iterate over lines
-    for line in lines:
-        if entered_selections:
-            # if we are in selections
-            if line.strip() == "---end selections---":
-                # if we reached end of selections
-                entered_selections = False
-            else:
-                # if we are in selections
-                selection = line.strip()
-                if len(selection) > 0:
-                    selections.append(selection)
-        else:
-            # if we are not in selections
-            if line.strip() == "---selections---":
-                # if we reached start of selections
-                entered_selections = True
-            else:
-                # if we are not in selections
-                message_without_selections += line
+    parser = SelectionsParser()
+    parser.feed(message)
+    parser.close()
+    return parser.result()
+
+
+def to_stored_selections(message: GameMessageWithSelections) -> dict:
+    """
+    Convert a parsed message to the format stored with the game session messages
+    :param message: parsed message
+    :return:
+    """
+    return {
+        "message": message.message,
+        "selections": message.selections,
+        "version": PARSER_VERSION,
+    }
 
-    return GameMessageWithSelections(message=message_without_selections, selections=selections)
@@ -0,0 +1,46 @@
+import hashlib
+import json
+from typing import Optional
+
+from fastapi.responses import JSONResponse, Response
+
+
+def compute_etag(body: bytes) -> str:
+    """
+    Strong etag of a response body
+    :param body: serialized body
+    :return: quoted etag
+    """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    Check an If-None-Match header against an etag, with the weak comparison required for If-None-Match
+    :param etag: quoted etag of the current representation
+    :param if_none_match: header value, e.g. '"a", W/"b"' or '*'
+    :return:
+    """
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def conditional_json_response(content, if_none_match: Optional[str], cache_control: str) -> Response:
+    """
+    Respond with the content, or with 304 Not Modified if the client already has it
+    :param content: json serializable content
+    :param if_none_match: If-None-Match header of the request
+    :param cache_control: Cache-Control header of the response
+    :return:
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = compute_etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=JSONResponse.media_type, headers=headers)
@@ -0,0 +1,241 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "http_requests_total": "HTTP requests by handler and status",
+    "http_request_duration_seconds": "Duration of the HTTP requests by handler",
+    "stage_duration_seconds": "Duration of the stages of the request handlers",
+    "llm_requests_total": "Calls to the language model by model and outcome",
+    "llm_tokens_total": "Tokens used by the language model, as reported by the provider",
+    "background_errors_total": "Failed background tasks",
+    "llm_queue_wait_seconds": "Time the calls to the language model waited for a slot",
+    "admission_rejected_total": "Requests rejected by the admission control by reason",
+}
+
+# (stage, seconds) of the current request, when the timing headers are enabled
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(DEFAULT_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(DEFAULT_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """
+    Times a stage of a request. Use it as a context manager
+    """
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.started
+        if self.metrics.enabled:
+            self.metrics.observe("stage_duration_seconds", duration, stage=self.stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, duration))
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Metrics:
+    """
+    Counters and histograms in the Prometheus text format, without a client library.
+    When both the metrics and the timing headers are disabled, spans are a shared no-op object and the counters
+    return immediately.
+    """
+
+    def __init__(self, enabled: bool = False, server_timing: bool = False):
+        """
+        :param enabled: collect the metrics
+        :param server_timing: collect the stage durations of each request for the Server-Timing header
+        """
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, Histogram]] = {}
+        self._stats: List[Tuple[str, Callable[[], dict]]] = []
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, server_timing: bool):
+        self.enabled = enabled
+        self.server_timing = server_timing
+
+    def span(self, stage: str):
+        """
+        Time a stage of a request
+        :param stage: stage name
+        :return: context manager
+        """
+        if not self.enabled and not self.server_timing:
+            return NOOP_SPAN
+        return Span(self, stage)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increment a counter
+        :param name: metric name
+        :param value: increment
+        :param labels: labels of the time series
+        :return:
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Add a value to a histogram
+        :param name: metric name
+        :param value: observed value, usually in seconds
+        :param labels: labels of the time series
+        :return:
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def add_stats(self, prefix: str, stats: Callable[[], dict]):
+        """
+        Export the numbers returned by a stats function, e.g. the hit counters of a cache, when the metrics are
+        scraped. Nothing is recorded on the hot path
+        :param prefix: prefix of the metric names
+        :param stats: function returning a dict of numbers
+        :return:
+        """
+        self._stats.append((prefix, stats))
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text format
+        :return:
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self.__header__(lines, name, "counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self.__labels__(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                self.__header__(lines, name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(DEFAULT_BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self.__labels__(key + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self.__labels__(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{self.__labels__(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{self.__labels__(key)} {histogram.count}")
+        for prefix, stats in self._stats:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{key}"
+                    lines.append(f"# TYPE {name} untyped")
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def __header__(lines: List[str], name: str, metric_type: str):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    @staticmethod
+    def __labels__(key: tuple) -> str:
+        if len(key) == 0:
+            return ""
+        labels = ",".join(f'{name}="{Metrics.__escape__(str(value))}"' for name, value in key)
+        return "{" + labels + "}"
+
+    @staticmethod
+    def __escape__(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that counts the requests by handler and status, and adds a Server-Timing header with the
+    durations of the stages when enabled. Only added to the app when the metrics or the timing headers are enabled
+    """
+
+    def __init__(self, app, metrics: "Metrics"):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings: Optional[List[Tuple[str, float]]] = [] if self.metrics.server_timing else None
+        token = request_timings.set(timings)
+        status = 500
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    header = ", ".join(f"{stage};dur={duration * 1e3:.2f}" for stage, duration in timings)
+                    header += f"{', ' if header else ''}total;dur={(time.perf_counter() - started) * 1e3:.2f}"
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            request_timings.reset(token)
+            # the router sets the endpoint in the scope once the route is matched
+            endpoint = scope.get("endpoint")
+            handler = endpoint.__name__ if endpoint is not None else "unmatched"
+            self.metrics.inc("http_requests_total", handler=handler, status=str(status))
+            self.metrics.observe("http_request_duration_seconds", time.perf_counter() - started, handler=handler)
+
+
+metrics = Metrics()
@@ -0,0 +1,189 @@
+import threading
+from typing import Callable, List, Optional, Union
+
+import certifi
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from starlette.concurrency import run_in_threadpool
+
+
+class ThreadedCursor:
+    """
+    Cursor returned by ThreadedCollection.find and ThreadedCollection.aggregate.
+    The underlying pymongo cursor is only created when the results are fetched, so that
+    no I/O happens on the event loop.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._modifiers: List[tuple] = []
+
+    def sort(self, *args, **kwargs) -> "ThreadedCursor":
+        self._modifiers.append(("sort", args, kwargs))
+        return self
+
+    def skip(self, *args, **kwargs) -> "ThreadedCursor":
+        self._modifiers.append(("skip", args, kwargs))
+        return self
+
+    def limit(self, *args, **kwargs) -> "ThreadedCursor":
+        self._modifiers.append(("limit", args, kwargs))
+        return self
+
+    def __fetch__(self, length: Optional[int]) -> list:
+        cursor = self._factory()
+        for name, args, kwargs in self._modifiers:
+            cursor = getattr(cursor, name)(*args, **kwargs)
+        results = []
+        for document in cursor:
+            if length is not None and len(results) >= length:
+                break
+            results.append(document)
+        return results
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        return await run_in_threadpool(self.__fetch__, length)
+
+    async def __aiter__(self):
+        for document in await self.to_list(length=None):
+            yield document
+
+
+class ThreadedCollection:
+    """
+    Exposes the awaitable interface of a motor collection on top of a blocking pymongo collection.
+    Every call runs in the threadpool, which is how the request handlers used to run before
+    the async mode was introduced.
+    """
+
+    def __init__(self, collection):
+        self.delegate = collection
+
+    @property
+    def name(self) -> str:
+        return self.delegate.name
+
+    def find(self, *args, **kwargs) -> ThreadedCursor:
+        return ThreadedCursor(lambda: self.delegate.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs) -> ThreadedCursor:
+        return ThreadedCursor(lambda: self.delegate.aggregate(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.delegate, name)
+
+        async def method(*args, **kwargs):
+            return await run_in_threadpool(attribute, *args, **kwargs)
+
+        return method
+
+
+class ThreadedDatabase:
+    def __init__(self, database):
+        self.delegate = database
+
+    def __getitem__(self, name: str) -> ThreadedCollection:
+        return ThreadedCollection(self.delegate[name])
+
+    async def command(self, *args, **kwargs):
+        return await run_in_threadpool(self.delegate.command, *args, **kwargs)
+
+
+class ThreadedMongoClient:
+    """
+    Blocking pymongo client behind the same awaitable interface as AsyncIOMotorClient.
+    Used when the async mode is disabled, so that both drivers can be compared with the same controllers.
+    """
+
+    def __init__(self, client):
+        self.delegate = client
+
+    def __getitem__(self, name: str) -> ThreadedDatabase:
+        return ThreadedDatabase(self.delegate[name])
+
+    def close(self):
+        self.delegate.close()
+
+
+class LazyCollection:
+    """
+    Collection of a LazyMongoClient. The client is created on the first call
+    """
+
+    def __init__(self, database: "LazyDatabase", name: str):
+        self._database = database
+        self._name = name
+        self._delegate = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def __getattr__(self, name: str):
+        if self._delegate is None:
+            self._delegate = self._database.resolve()[self._name]
+        return getattr(self._delegate, name)
+
+
+class LazyDatabase:
+    def __init__(self, client: "LazyMongoClient", name: str):
+        self._client = client
+        self._name = name
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        return LazyCollection(self, name)
+
+    def resolve(self):
+        return self._client.resolve()[self._name]
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
+
+
+class LazyMongoClient:
+    """
+    Creates the mongo client on first use instead of at import time, so that a worker starts without waiting for
+    e.g. the DNS lookup of a mongodb+srv url. Databases and collections can be taken from it right away
+    """
+
+    def __init__(self, factory: Callable[[], Union[AsyncIOMotorClient, ThreadedMongoClient]]):
+        """
+        :param factory: creates the actual client
+        """
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._client is not None
+
+    def __getitem__(self, name: str) -> LazyDatabase:
+        return LazyDatabase(self, name)
+
+    def resolve(self) -> Union[AsyncIOMotorClient, ThreadedMongoClient]:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+AsyncMongoClient = Union[AsyncIOMotorClient, ThreadedMongoClient, LazyMongoClient]
+
+
+def create_mongo_client(db_url: str, use_async_driver: bool) -> AsyncMongoClient:
+    """
+    Create a mongo client
+    :param db_url: mongo connection string
+    :param use_async_driver: use motor if true, otherwise wrap pymongo and run every call in the threadpool
+    :return:
+    """
+    tls_ca_file = certifi.where() if db_url.startswith("mongodb+srv") else None
+    if use_async_driver:
+        return AsyncIOMotorClient(db_url, tlsCAFile=tls_ca_file)
+    return ThreadedMongoClient(MongoClient(db_url, tlsCAFile=tls_ca_file))
@@ -0,0 +1,49 @@
+import threading
+from typing import Optional
+
+
+class LazyS3Client:
+    """
+    Creates the boto3 S3 client on first use. Importing boto3 and loading the S3 service model takes a few hundred
+    milliseconds, which workers that never upload anything shouldn't pay at startup
+    """
+
+    def __init__(self, aws_access_key_id: Optional[str], aws_secret_access_key: Optional[str],
+                 region_name: Optional[str], endpoint_url: Optional[str], addressing_style: Optional[str] = None):
+        """
+        :param addressing_style: path, virtual or None for the default of boto3. S3 compatible stand-ins such as
+        MinIO usually need path
+        """
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.addressing_style = addressing_style
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._client is not None
+
+    def get(self):
+        """
+        Get the boto3 S3 client, creating it on the first call
+        :return:
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    config = Config(s3={"addressing_style": self.addressing_style}) \
+                        if self.addressing_style is not None else None
+                    self._client = boto3.client('s3',
+                                                aws_access_key_id=self.aws_access_key_id,
+                                                aws_secret_access_key=self.aws_secret_access_key,
+                                                region_name=self.region_name,
+                                                endpoint_url=self.endpoint_url,
+                                                config=config,
+                                                )
+        return self._client
@@ -0,0 +1,28 @@
+import json
+from typing import AsyncIterator, Tuple
+
+from fastapi import HTTPException
+
+
+def format_event(event: str, data: dict) -> str:
+    """
+    Format an event for a text/event-stream response
+    :param event: event name
+    :param data: json serializable payload
+    :return:
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def to_event_stream(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[str]:
+    """
+    Convert (event, data) tuples into server sent events.
+    If the stream fails after it has started, an "error" event is sent, since the status code can't be changed anymore.
+    :param events: events to send
+    :return:
+    """
+    try:
+        async for event, data in events:
+            yield format_event(event, data)
+    except Exception as e:
+        yield format_event("error", {"detail": e.detail if isinstance(e, HTTPException) else str(e)})
@@ -0,0 +1,137 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from jinja2 import Environment, Template
+
+
+class TemplateCache:
+    """
+    LRU cache of compiled jinja templates keyed by the hash of the template source.
+    Optionally caches the rendered output per (template, extra data) as well.
+    """
+
+    def __init__(self, max_templates: int = 128, max_rendered: int = 0):
+        """
+        :param max_templates: maximum number of compiled templates
+        :param max_rendered: maximum number of rendered outputs. 0 disables the rendered cache
+        """
+        self.environment = Environment()
+        self.max_templates = max_templates
+        self.max_rendered = max_rendered
+        self._templates: OrderedDict = OrderedDict()
+        self._rendered: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.template_hits = 0
+        self.template_misses = 0
+        self.rendered_hits = 0
+        self.rendered_misses = 0
+
+    def configure(self, max_templates: int, max_rendered: int):
+        """
+        Change the cache sizes and clear the cache
+        :param max_templates: maximum number of compiled templates
+        :param max_rendered: maximum number of rendered outputs. 0 disables the rendered cache
+        :return:
+        """
+        self.max_templates = max_templates
+        self.max_rendered = max_rendered
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._rendered.clear()
+
+    def discard(self, source: str):
+        """
+        Drop the compiled template and the rendered outputs of a source, e.g. of a prompt that was replaced
+        :param source: template source
+        :return:
+        """
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._templates.pop(key, None)
+            for rendered_key in [rendered_key for rendered_key in self._rendered if rendered_key[0] == key]:
+                del self._rendered[rendered_key]
+
+    def get_template(self, source: str) -> Template:
+        """
+        Get the compiled template for a source, compiling it on a miss
+        :param source: template source
+        :return:
+        """
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        return self.__get_template__(key, source)
+
+    def render(self, source: str, extra_data: dict) -> str:
+        """
+        Render a template with the cached compiled template and, if enabled, the cached output
+        :param source: template source
+        :param extra_data: variables of the template
+        :return: rendered template
+        """
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        rendered_key = self.__get_rendered_key__(key, extra_data)
+        if rendered_key is not None:
+            with self._lock:
+                rendered = self._rendered.get(rendered_key)
+                if rendered is not None:
+                    self._rendered.move_to_end(rendered_key)
+                    self.rendered_hits += 1
+                    return rendered
+                self.rendered_misses += 1
+
+        rendered = self.__get_template__(key, source).render(**extra_data)
+        if rendered_key is not None:
+            with self._lock:
+                self._rendered[rendered_key] = rendered
+                if len(self._rendered) > self.max_rendered:
+                    self._rendered.popitem(last=False)
+        return rendered
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the cache
+        :return:
+        """
+        return {
+            "template_hits": self.template_hits,
+            "template_misses": self.template_misses,
+            "templates": len(self._templates),
+            "rendered_hits": self.rendered_hits,
+            "rendered_misses": self.rendered_misses,
+            "rendered": len(self._rendered),
+        }
+
+    def __get_template__(self, key: str, source: str) -> Template:
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.template_hits += 1
+                return template
+            self.template_misses += 1
+
+        # compile outside the lock. Two concurrent misses compile the same template twice, which is harmless
+        template = self.environment.from_string(source)
+        with self._lock:
+            self._templates[key] = template
+            if len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return template
+
+    def __get_rendered_key__(self, key: str, extra_data: dict) -> Optional[tuple]:
+        if self.max_rendered <= 0:
+            return None
+        try:
+            items = tuple(sorted(extra_data.items()))
+            hash(items)
+        except TypeError:
+            # values that can't be hashed are not cached
+            return None
+        return key, items
+
+
+template_cache = TemplateCache()
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from utils.context_window import build_context, count_tokens, select_messages_to_summarize, SUMMARY_PREFIX
+
+
+class TestCountTokens(TestCase):
+    def test_ascii(self):
+        self.assertEqual(count_tokens(""), 0)
+        self.assertEqual(count_tokens("abcd"), 1)
+        self.assertEqual(count_tokens("abcde"), 2)
+
+    def test_chinese(self):
+        self.assertEqual(count_tokens("你好"), 3)
+        self.assertEqual(count_tokens("你好abcd"), 4)
+
+
+class TestBuildContext(TestCase):
+    system = {"role": "system", "content": "system"}
+    history = [{"role": "user" if index % 2 == 0 else "assistant", "content": "a" * 40} for index in range(10)]
+
+    def test_everything_fits(self):
+        context = build_context(self.system, self.history, budget=1000)
+        self.assertEqual(context.first_kept, 0)
+        self.assertEqual(context.messages, [self.system] + self.history)
+
+    def test_recent_messages_are_kept(self):
+        # system: 4 + 2, each message: 4 + 10
+        context = build_context(self.system, self.history, budget=50)
+        self.assertEqual(context.first_kept, 7)
+        self.assertEqual(context.messages, [self.system] + self.history[7:])
+        self.assertLessEqual(context.tokens, 50)
+
+    def test_request_size_is_flat(self):
+        long_history = self.history * 100
+        context = build_context(self.system, long_history, budget=50, summary="summary")
+        self.assertEqual(context.messages[1], {"role": "system", "content": SUMMARY_PREFIX + "summary"})
+        self.assertEqual(len(context.messages), 3)
+        self.assertLessEqual(context.tokens, 50)
+
+    def test_last_message_is_always_kept(self):
+        context = build_context(self.system, self.history, budget=1)
+        self.assertEqual(context.first_kept, 9)
+
+    def test_select_messages_to_summarize(self):
+        self.assertEqual(select_messages_to_summarize(self.history, start=2, end=8, budget=30), 4)
+        self.assertEqual(select_messages_to_summarize(self.history, start=2, end=8, budget=1), 3)
+        self.assertEqual(select_messages_to_summarize(self.history, start=2, end=2, budget=30), 2)
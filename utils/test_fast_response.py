@@ -0,0 +1,85 @@
+import gzip
+import json
+from unittest import TestCase
+
+import brotli
+import msgpack
+
+from fastapi.encoders import jsonable_encoder
+
+from models.message_models import GetMessageDto, Role
+from models.session_models import GetGameSessionDto
+from utils.fast_response import ResponseEncoder, parse_quality_values
+from utils.get_selections import get_selections, to_stored_selections
+
+REPLY = "你醒了。\n---selections---\n1. 起床\n---end selections---\n"
+
+
+class TestFastResponse(TestCase):
+    def setUp(self):
+        documents = [
+            {"role": "user", "content": "开始", "image": None, "audio": None, "seq": 0},
+            {"role": "assistant", "content": REPLY, "image": None, "audio": None, "seq": 1,
+             "parsed": to_stored_selections(get_selections(REPLY))},
+        ]
+        self.content = GetGameSessionDto.response_dict_from_documents(
+            {"user": "user", "prompt_name": "game", "message_count": 2}, documents)
+        # what the generic encoder of FastAPI returned for the session
+        self.expected = jsonable_encoder(GetGameSessionDto(
+            user="user",
+            messages=[
+                GetMessageDto(role=Role.USER, content=get_selections("开始"), image=None, audio=None, seq=0),
+                GetMessageDto(role=Role.ASSISTANT, content=get_selections(REPLY), image=None, audio=None, seq=1),
+            ],
+            prompt="game",
+            message_count=2,
+        ))
+
+    def test_response_from_documents(self):
+        self.assertEqual(self.content, self.expected)
+
+    def test_parse_quality_values(self):
+        self.assertEqual(parse_quality_values("gzip;q=0.5, BR, identity;q=x"), {"gzip": 0.5, "br": 1.0})
+        self.assertEqual(parse_quality_values(None), {})
+
+    def test_compression_threshold(self):
+        encoder = ResponseEncoder(compression_min_size=10_000)
+        response = encoder.response(self.content, accept_encoding="gzip")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(json.loads(response.body), self.expected)
+
+        encoder.configure(compression_min_size=0, gzip_level=6, brotli_quality=4, msgpack_enabled=True)
+        response = encoder.response(self.content, accept_encoding="deflate, gzip;q=0.8")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept, Accept-Encoding")
+        self.assertEqual(json.loads(gzip.decompress(response.body)), self.expected)
+
+    def test_brotli(self):
+        encoder = ResponseEncoder(compression_min_size=0)
+        response = encoder.response(self.content, accept_encoding="gzip, br")
+        self.assertEqual(response.headers["content-encoding"], "br")
+        self.assertEqual(json.loads(brotli.decompress(response.body)), self.expected)
+
+    def test_msgpack(self):
+        encoder = ResponseEncoder(compression_min_size=-1)
+        response = encoder.response(self.content, accept="application/msgpack")
+        self.assertEqual(response.headers["content-type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.body), self.expected)
+
+    def test_negotiate_encoding(self):
+        encoder = ResponseEncoder()
+        self.assertIsNone(encoder.negotiate_encoding(None))
+        self.assertIsNone(encoder.negotiate_encoding("identity"))
+        self.assertIsNone(encoder.negotiate_encoding("gzip;q=0"))
+        self.assertEqual(encoder.negotiate_encoding("*"), "br")
+        self.assertEqual(encoder.negotiate_encoding("gzip, br;q=0.5"), "gzip")
+        self.assertEqual(encoder.negotiate_encoding("br;q=0, gzip"), "gzip")
+
+    def test_negotiate_media_type(self):
+        encoder = ResponseEncoder(msgpack_enabled=False)
+        self.assertEqual(encoder.negotiate_media_type("application/msgpack"), "application/json")
+        encoder.msgpack_enabled = True
+        self.assertEqual(encoder.negotiate_media_type("*/*"), "application/json")
+        self.assertEqual(encoder.negotiate_media_type("application/x-msgpack"), "application/x-msgpack")
+        self.assertEqual(encoder.negotiate_media_type("application/msgpack;q=0.5, application/json"),
+                         "application/json")
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from utils.get_selections import get_selections
+from utils.get_selections import get_selections, SelectionsParser, SelectionEvent, SelectionEventType
 
 
 class TestGetSelection(TestCase):
@@ -41,3 +41,47 @@ class TestGetSelection(TestCase):
         game = get_selections(message)
         self.assertEqual(game.message.strip(), "some text content")
         self.assertEqual(game.selections, ["1. selection 1", "2. selection 2"])
+
+    def test_get_selections_keeps_newlines(self):
+        message = "line 1\nline 2\n---selections---\n1. selection 1\n---end selections---\n"
+        game = get_selections(message)
+        self.assertEqual(game.message, "line 1\nline 2\n")
+        self.assertEqual(game.selections, ["1. selection 1"])
+
+
+class TestSelectionsParser(TestCase):
+    message = "some text content\n---selections---\n1. selection 1\n2. selection 2\n---end selections---\n"
+
+    def test_feed_char_by_char(self):
+        parser = SelectionsParser()
+        for char in self.message:
+            parser.feed(char)
+        parser.close()
+        self.assertEqual(parser.result(), get_selections(self.message))
+
+    def test_marker_split_across_chunks(self):
+        parser = SelectionsParser()
+        events = parser.feed("some text content\n---sel")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.TEXT, content="some text content\n")])
+        events = parser.feed("ections---\n1. selection 1\n2. sel")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.SELECTION, content="1. selection 1")])
+        events = parser.feed("ection 2\n---end selec")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.SELECTION, content="2. selection 2")])
+        events = parser.feed("tions---\n") + parser.close()
+        self.assertEqual(events, [])
+
+    def test_text_is_emitted_before_line_ends(self):
+        parser = SelectionsParser()
+        events = parser.feed("some te")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.TEXT, content="some te")])
+        events = parser.feed("xt\n--")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.TEXT, content="xt\n")])
+        events = parser.feed("- not a marker")
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.TEXT, content="--- not a marker")])
+
+    def test_selection_without_trailing_newline(self):
+        parser = SelectionsParser()
+        parser.feed("text\n---selections---\n1. selection 1")
+        events = parser.close()
+        self.assertEqual(events, [SelectionEvent(type=SelectionEventType.SELECTION, content="1. selection 1")])
+
@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from utils.http_cache import compute_etag, conditional_json_response, etag_matches
+
+
+class TestHttpCache(TestCase):
+    def test_etag_matches(self):
+        etag = compute_etag(b"body")
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(etag, f'"other", W/{etag}'))
+        self.assertTrue(etag_matches(etag, "*"))
+        self.assertFalse(etag_matches(etag, '"other"'))
+        self.assertFalse(etag_matches(etag, None))
+
+    def test_conditional_response(self):
+        response = conditional_json_response({"name": "game"}, None, cache_control="public, max-age=60")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'{"name":"game"}')
+        self.assertEqual(response.headers["Cache-Control"], "public, max-age=60")
+
+        etag = response.headers["ETag"]
+        not_modified = conditional_json_response({"name": "game"}, etag, cache_control="public, max-age=60")
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.body, b"")
+        self.assertEqual(not_modified.headers["ETag"], etag)
+
+        changed = conditional_json_response({"name": "other"}, etag, cache_control="public, max-age=60")
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from utils.metrics import Metrics, NOOP_SPAN, request_timings
+
+
+class TestMetrics(TestCase):
+    def test_disabled(self):
+        metrics = Metrics()
+        self.assertIs(metrics.span("llm"), NOOP_SPAN)
+        metrics.inc("llm_requests_total", model="model")
+        metrics.observe("stage_duration_seconds", 1, stage="llm")
+        self.assertEqual(metrics.render(), "\n")
+
+    def test_counter(self):
+        metrics = Metrics(enabled=True)
+        metrics.inc("llm_tokens_total", 10, model="model", type="prompt")
+        metrics.inc("llm_tokens_total", 5, model="model", type="prompt")
+        self.assertIn('llm_tokens_total{model="model",type="prompt"} 15', metrics.render())
+
+    def test_histogram(self):
+        metrics = Metrics(enabled=True)
+        with metrics.span("llm"):
+            pass
+        rendered = metrics.render()
+        self.assertIn('stage_duration_seconds_bucket{stage="llm",le="0.001"} 1', rendered)
+        self.assertIn('stage_duration_seconds_bucket{stage="llm",le="+Inf"} 1', rendered)
+        self.assertIn('stage_duration_seconds_count{stage="llm"} 1', rendered)
+
+    def test_label_escaping(self):
+        metrics = Metrics(enabled=True)
+        metrics.inc("errors_total", reason='say "hi"\n')
+        self.assertIn('errors_total{reason="say \\"hi\\"\\n"} 1', metrics.render())
+
+    def test_stats(self):
+        metrics = Metrics(enabled=True)
+        metrics.add_stats("cache", lambda: {"hits": 3, "name": "ignored"})
+        rendered = metrics.render()
+        self.assertIn("cache_hits 3", rendered)
+        self.assertNotIn("cache_name", rendered)
+
+    def test_server_timing(self):
+        metrics = Metrics(server_timing=True)
+        timings = []
+        token = request_timings.set(timings)
+        try:
+            with metrics.span("render"):
+                pass
+        finally:
+            request_timings.reset(token)
+        self.assertEqual([stage for stage, _ in timings], ["render"])
+        # the metrics themselves are still disabled
+        self.assertEqual(metrics.render(), "\n")
@@ -0,0 +1,44 @@
+import json
+from typing import AsyncIterator, List, Tuple
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi import HTTPException
+
+from utils.sse import format_event, to_event_stream
+
+
+def parse_event(text: str) -> Tuple[str, dict]:
+    event, data = text.rstrip("\n").split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+class TestSse(IsolatedAsyncioTestCase):
+    async def collect(self, events: AsyncIterator[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+        return [parse_event(text) async for text in to_event_stream(events)]
+
+    def test_format_event(self):
+        self.assertEqual(format_event("text", {"content": "Grüße"}), 'event: text\ndata: {"content": "Grüße"}\n\n')
+
+    async def test_events(self):
+        async def events():
+            yield "text", {"content": "You wake up"}
+            yield "done", {"message": "You wake up"}
+
+        self.assertEqual(await self.collect(events()),
+                         [("text", {"content": "You wake up"}), ("done", {"message": "You wake up"})])
+
+    async def test_error_after_the_stream_started(self):
+        async def events():
+            yield "text", {"content": "You wake"}
+            raise ValueError("The model stopped answering")
+
+        self.assertEqual(await self.collect(events()),
+                         [("text", {"content": "You wake"}), ("error", {"detail": "The model stopped answering"})])
+
+    async def test_error_with_a_status_code(self):
+        async def events():
+            yield "text", {"content": "You wake"}
+            raise HTTPException(status_code=409, detail="The session was changed by another request.")
+
+        self.assertEqual((await self.collect(events()))[-1],
+                         ("error", {"detail": "The session was changed by another request."}))
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from utils.template_cache import TemplateCache
+
+
+class TestTemplateCache(TestCase):
+    def test_template_is_compiled_once(self):
+        cache = TemplateCache()
+        self.assertEqual(cache.render("Hello {{ name }}", {"name": "John"}), "Hello John")
+        self.assertEqual(cache.render("Hello {{ name }}", {"name": "Jane"}), "Hello Jane")
+        self.assertEqual(cache.stats()["template_misses"], 1)
+        self.assertEqual(cache.stats()["template_hits"], 1)
+
+    def test_least_recently_used_template_is_evicted(self):
+        cache = TemplateCache(max_templates=2)
+        cache.get_template("a")
+        cache.get_template("b")
+        cache.get_template("a")
+        cache.get_template("c")
+        cache.get_template("a")
+        cache.get_template("b")
+        self.assertEqual(cache.stats()["template_misses"], 4)
+        self.assertEqual(cache.stats()["templates"], 2)
+
+    def test_rendered_cache(self):
+        cache = TemplateCache(max_rendered=1)
+        cache.render("Hello {{ name }}", {"name": "John"})
+        cache.render("Hello {{ name }}", {"name": "John"})
+        cache.render("Hello {{ name }}", {"name": "Jane"})
+        self.assertEqual(cache.render("Hello {{ name }}", {"name": "John"}), "Hello John")
+        stats = cache.stats()
+        self.assertEqual(stats["rendered_hits"], 1)
+        self.assertEqual(stats["rendered_misses"], 3)
+        self.assertEqual(stats["rendered"], 1)
+
+    def test_rendered_cache_is_disabled_by_default(self):
+        cache = TemplateCache()
+        cache.render("Hello {{ name }}", {"name": "John"})
+        cache.render("Hello {{ name }}", {"name": "John"})
+        self.assertEqual(cache.stats()["rendered_hits"], 0)
+        self.assertEqual(cache.stats()["rendered_misses"], 0)
+
+    def test_discard(self):
+        cache = TemplateCache(max_rendered=10)
+        cache.render("Hello {{ name }}", {"name": "John"})
+        cache.render("Bye {{ name }}", {"name": "John"})
+        cache.discard("Hello {{ name }}")
+        stats = cache.stats()
+        self.assertEqual(stats["templates"], 1)
+        self.assertEqual(stats["rendered"], 1)
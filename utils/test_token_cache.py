@@ -0,0 +1,49 @@
+import time
+from unittest import TestCase
+
+from utils.token_cache import TokenCache, hash_token
+
+
+class TestTokenCache(TestCase):
+    def setUp(self):
+        self.cache = TokenCache(max_size=2)
+
+    def test_hit(self):
+        payload = {"id": "1", "exp": time.time() + 60}
+        self.cache.put(hash_token("a"), payload)
+        self.assertEqual(self.cache.get(hash_token("a")), payload)
+        self.assertIsNone(self.cache.get(hash_token("b")))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_expired_token(self):
+        self.cache.put("a", {"id": "1", "exp": time.time() - 1})
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_lru_eviction(self):
+        for key in ["a", "b"]:
+            self.cache.put(key, {"id": key})
+        self.cache.get("a")
+        self.cache.put("c", {"id": "c"})
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_revoke(self):
+        self.cache.put("a", {"id": "1"})
+        self.cache.revoke("a", expires_at=time.time() + 60)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertTrue(self.cache.is_revoked("a"))
+        # a request that verified the token before the revocation doesn't cache it again
+        self.cache.put("a", {"id": "1"})
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_prune(self):
+        self.cache.revoke("a", expires_at=time.time() - 1)
+        self.cache.revoke("b", expires_at=time.time() + 60)
+        self.cache.prune()
+        self.assertFalse(self.cache.is_revoked("a"))
+        self.assertTrue(self.cache.is_revoked("b"))
+
+    def test_disabled(self):
+        cache = TokenCache(max_size=0)
+        cache.put("a", {"id": "1"})
+        self.assertIsNone(cache.get("a"))
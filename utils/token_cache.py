@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def hash_token(token: str) -> str:
+    """
+    Hash of a token, so that the tokens themselves are neither kept in memory nor stored
+    :param token: jwt token
+    :return:
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """
+    LRU cache of the payloads of verified tokens keyed by the token hash, so that a token is verified once and
+    not on every request. Entries expire with the token. Revoked tokens are never served from the cache.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        """
+        :param max_size: maximum number of cached tokens. 0 disables the cache
+        """
+        self.max_size = max_size
+        # token hash -> (payload, expiry as unix time or None)
+        self._tokens: OrderedDict = OrderedDict()
+        # token hash -> expiry as unix time. Kept until the token would have expired anyway
+        self._revoked: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size: int):
+        """
+        Change the cache size and clear the cache
+        :param max_size: maximum number of cached tokens. 0 disables the cache
+        :return:
+        """
+        self.max_size = max_size
+        with self._lock:
+            self._tokens.clear()
+
+    def get(self, token_hash: str) -> Optional[dict]:
+        """
+        Get the payload of a verified token
+        :param token_hash: hash of the token
+        :return: payload, or None if the token isn't cached, expired or was revoked
+        """
+        with self._lock:
+            entry: Optional[Tuple[dict, Optional[float]]] = self._tokens.get(token_hash)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._tokens[token_hash]
+                self.misses += 1
+                return None
+            self._tokens.move_to_end(token_hash)
+            self.hits += 1
+            return payload
+
+    def put(self, token_hash: str, payload: dict):
+        """
+        Cache the payload of a verified token until its exp claim
+        :param token_hash: hash of the token
+        :param payload: decoded payload
+        :return:
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = payload.get("exp")
+        with self._lock:
+            if token_hash in self._revoked:
+                return
+            self._tokens[token_hash] = (payload, float(expires_at) if expires_at is not None else None)
+            if len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def revoke(self, token_hash: str, expires_at: Optional[float]):
+        """
+        Reject a token from now on
+        :param token_hash: hash of the token
+        :param expires_at: expiry of the token as unix time, after which it doesn't have to be remembered
+        :return:
+        """
+        with self._lock:
+            self._tokens.pop(token_hash, None)
+            self._revoked[token_hash] = expires_at
+
+    def is_revoked(self, token_hash: str) -> bool:
+        with self._lock:
+            return token_hash in self._revoked
+
+    def prune(self):
+        """
+        Forget the revoked tokens that expired
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            for token_hash in [key for key, expires_at in self._revoked.items()
+                               if expires_at is not None and expires_at <= now]:
+                del self._revoked[token_hash]
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the cache
+        :return:
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tokens": len(self._tokens),
+            "revoked": len(self._revoked),
+        }
+
+
+token_cache = TokenCache()